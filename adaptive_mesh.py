@@ -0,0 +1,418 @@
+"""Moving-front adaptive 1D mesh for cycling runs.
+
+At the end of each phase of the cycle schedule, the mesh is refined where
+the mobile concentration or the retention vary by more than
+refine_tolerance (relative to their maximum) over a cell, and coarsened
+where two neighbouring cells vary by less than coarsen_tolerance. The
+material borders are kept as vertices (snapped to their exact values).
+
+The model is then rebuilt on the new mesh (see run_adaptive) and the
+concentrations are transferred by a limited L2 projection of the piecewise
+linear fields, computed exactly on the union of the old and new vertices:
+the L2 projection is blended with the lumped-mass projection where it
+would leave the range of the old field (eg. negative concentrations or
+traps above their density), per cell for DG fields and globally for CG
+fields. Both projections preserve the integral of each field, so the
+total inventory is unchanged by the remeshing (the DG traps even preserve
+it cell by cell).
+
+After each remeshing, the XDMF exports written with fenics.XDMFFile.write
+continue in new files <name>_from_<iteration>.xdmf, as after a restart (see
+checkpoint.continue_xdmf_exports).
+
+The fields are handled as numpy arrays of cells (x_left, x_right,
+value_left, value_right), sorted by x.
+"""
+
+import fenics as f
+import numpy as np
+import FESTIM as F
+from scipy.linalg import solve_banded
+
+from checkpoint import continue_xdmf_exports, is_finished, write_fields_at_stop
+
+refine_tolerance = 0.05
+coarsen_tolerance = 0.005
+h_min = 1e-10
+h_max = 2e-5
+nb_passes = 20
+
+
+def cell_values(function):
+    """Values of a scalar CG1 or DG1 function at the ends of the cells
+
+    Args:
+        function (fenics.Function): the function
+
+    Returns:
+        tuple: x_left, x_right, value_left, value_right (numpy.ndarray),
+            sorted by x
+    """
+    V = function.function_space()
+    coordinates = V.tabulate_dof_coordinates()[:, 0]
+    values = function.vector().get_local()
+    dofmap = V.dofmap()
+    dofs = np.array([dofmap.cell_dofs(cell) for cell in range(V.mesh().num_cells())])
+    # left dof first
+    order = np.argsort(coordinates[dofs], axis=1)
+    dofs = np.take_along_axis(dofs, order, axis=1)
+    cells = np.argsort(coordinates[dofs[:, 0]])
+    dofs = dofs[cells]
+    return (
+        coordinates[dofs[:, 0]],
+        coordinates[dofs[:, 1]],
+        values[dofs[:, 0]],
+        values[dofs[:, 1]],
+    )
+
+
+def set_cell_values(function, cells):
+    """Sets the values of a scalar CG1 or DG1 function from the values at
+    the ends of the cells
+
+    Args:
+        function (fenics.Function): the function
+        cells (tuple): x_left, x_right, value_left, value_right, sorted by
+            x, on the mesh of the function
+    """
+    x_left, x_right, value_left, value_right = cells
+    V = function.function_space()
+    coordinates = V.tabulate_dof_coordinates()[:, 0]
+    dofmap = V.dofmap()
+    dofs = np.array([dofmap.cell_dofs(cell) for cell in range(V.mesh().num_cells())])
+    order = np.argsort(coordinates[dofs], axis=1)
+    dofs = np.take_along_axis(dofs, order, axis=1)
+    dofs = dofs[np.argsort(coordinates[dofs[:, 0]])]
+
+    values = function.vector().get_local()
+    values[dofs[:, 0]] = value_left
+    values[dofs[:, 1]] = value_right
+    function.vector().set_local(values)
+    function.vector().apply("insert")
+
+
+def evaluate(cells, x, side):
+    """Evaluates a piecewise linear field
+
+    Args:
+        cells (tuple): x_left, x_right, value_left, value_right
+        x (numpy.ndarray): the points
+        side (str): "right" for the limits from the right (x+), "left" for
+            the limits from the left (x-)
+
+    Returns:
+        numpy.ndarray: the values
+    """
+    x_left, x_right, value_left, value_right = cells
+    if side == "right":
+        i = np.searchsorted(x_left, x, side="right") - 1
+    else:
+        i = np.searchsorted(x_right, x, side="left")
+    i = np.clip(i, 0, x_left.size - 1)
+    weight = (x - x_left[i]) / (x_right[i] - x_left[i])
+    return value_left[i] + weight * (value_right[i] - value_left[i])
+
+
+def blend_factor(values, lumped, lower, upper):
+    """Largest factor alpha in [0, 1] such that lumped + alpha * (values -
+    lumped) is within [lower, upper]
+
+    Args:
+        values (numpy.ndarray): the unlimited values
+        lumped (numpy.ndarray): the values within the bounds
+        lower (numpy.ndarray): the lower bounds
+        upper (numpy.ndarray): the upper bounds
+
+    Returns:
+        numpy.ndarray: the factor of each value
+    """
+    difference = values - lumped
+    alpha = np.ones(values.size)
+    above, below = difference > 0, difference < 0
+    alpha[above] = (upper - lumped)[above] / difference[above]
+    alpha[below] = (lower - lumped)[below] / difference[below]
+    return np.clip(alpha, 0, 1)
+
+
+def project(cells, x_new, continuous):
+    """Limited L2 projection of a piecewise linear field on a new 1D mesh,
+    exact (2 point Gauss quadrature on the union of the old and new
+    vertices). The values are kept within the range of the field over the
+    support of each new basis function by blending the L2 projection with
+    the lumped-mass projection: cell by cell for DG1, with a single factor
+    for CG1. Both conserve the integral of the field.
+
+    Args:
+        cells (tuple): x_left, x_right, value_left, value_right of the field
+        x_new (numpy.ndarray): the vertices of the new mesh, sorted
+        continuous (bool): True for a CG1 projection, False for DG1
+
+    Returns:
+        tuple: x_left, x_right, value_left, value_right on the new mesh
+    """
+    x_old = np.union1d(cells[0], cells[1])
+    points = np.union1d(x_old, x_new)
+    a, b = points[:-1], points[1:]
+    new_cell = np.clip(
+        np.searchsorted(x_new, (a + b) / 2, side="right") - 1, 0, x_new.size - 2
+    )
+    h = np.diff(x_new)
+
+    # range of the field over each new cell (extrema of a linear piece are
+    # at its ends)
+    lower = np.full(h.size, np.inf)
+    upper = np.full(h.size, -np.inf)
+    for ends in [evaluate(cells, a, "right"), evaluate(cells, b, "left")]:
+        np.minimum.at(lower, new_cell, ends)
+        np.maximum.at(upper, new_cell, ends)
+
+    rhs_left = np.zeros(h.size)
+    rhs_right = np.zeros(h.size)
+    for s in [(1 - 3**-0.5) / 2, (1 + 3**-0.5) / 2]:
+        x = a + s * (b - a)
+        value = evaluate(cells, x, "right") * (b - a) / 2
+        phi_right = (x - x_new[new_cell]) / h[new_cell]
+        np.add.at(rhs_left, new_cell, value * (1 - phi_right))
+        np.add.at(rhs_right, new_cell, value * phi_right)
+
+    if continuous:
+        rhs = np.zeros(x_new.size)
+        rhs[:-1] += rhs_left
+        rhs[1:] += rhs_right
+        # tridiagonal mass matrix
+        banded = np.zeros((3, x_new.size))
+        banded[0, 1:] = h / 6
+        banded[1, :-1] += h / 3
+        banded[1, 1:] += h / 3
+        banded[2, :-1] = h / 6
+        values = solve_banded((1, 1), banded, rhs)
+        lumped_mass = np.zeros(x_new.size)
+        lumped_mass[:-1] += h / 2
+        lumped_mass[1:] += h / 2
+        lumped = rhs / lumped_mass
+        # a node sees the range of its two cells
+        lower_nodes = np.minimum(np.append(lower, np.inf), np.insert(lower, 0, np.inf))
+        upper_nodes = np.maximum(
+            np.append(upper, -np.inf), np.insert(upper, 0, -np.inf)
+        )
+        alpha = blend_factor(values, lumped, lower_nodes, upper_nodes).min()
+        # clipped for round-off only
+        values = np.clip(lumped + alpha * (values - lumped), lower_nodes, upper_nodes)
+        value_left, value_right = values[:-1], values[1:]
+    else:
+        # inverse of the 2x2 mass matrix of each cell
+        value_left = 2 / h * (2 * rhs_left - rhs_right)
+        value_right = 2 / h * (2 * rhs_right - rhs_left)
+        lumped_left, lumped_right = 2 / h * rhs_left, 2 / h * rhs_right
+        alpha = np.minimum(
+            blend_factor(value_left, lumped_left, lower, upper),
+            blend_factor(value_right, lumped_right, lower, upper),
+        )
+        value_left = np.clip(
+            lumped_left + alpha * (value_left - lumped_left), lower, upper
+        )
+        value_right = np.clip(
+            lumped_right + alpha * (value_right - lumped_right), lower, upper
+        )
+    return x_new[:-1], x_new[1:], value_left, value_right
+
+
+def variation(fields, a, b):
+    """Relative variation of the fields over the intervals [a, b]
+
+    Args:
+        fields (list): the fields (cells tuples)
+        a (numpy.ndarray): left ends of the intervals
+        b (numpy.ndarray): right ends of the intervals
+
+    Returns:
+        numpy.ndarray: the largest variation of the fields over each
+            interval relative to their maximum
+    """
+    indicator = np.zeros(a.size)
+    for cells in fields:
+        scale = max(np.abs(cells[2]).max(), np.abs(cells[3]).max())
+        if scale == 0:
+            continue
+        change = np.abs(evaluate(cells, b, "left") - evaluate(cells, a, "right"))
+        indicator = np.maximum(indicator, change / scale)
+    return indicator
+
+
+def snap_to_borders(x, borders, atol):
+    """Moves the points within atol of a border onto the border
+
+    Args:
+        x (numpy.ndarray): the points
+        borders (numpy.ndarray): the borders
+        atol (float): absolute tolerance
+
+    Returns:
+        numpy.ndarray: the points, snapped
+    """
+    x = np.array(x, dtype=float)
+    for border in borders:
+        x[np.isclose(x, border, rtol=0, atol=atol)] = border
+    return x
+
+
+def adapt_vertices(x, fields, borders):
+    """Refines and coarsens a 1D mesh based on the variation of the fields.
+    The vertices of the mesh within 1e-12 * size of a border (eg.
+    0.005999999999999999 for 6e-3) are snapped to it and the borders within
+    the mesh are always vertices of the new mesh.
+
+    Args:
+        x (numpy.ndarray): the vertices, sorted
+        fields (list): the fields (cells tuples) driving the adaptation
+        borders (list): vertices that are kept (material borders)
+
+    Returns:
+        numpy.ndarray: the new vertices
+    """
+    atol = 1e-12 * (x[-1] - x[0])
+    borders = np.asarray(borders, dtype=float)
+    borders = borders[(borders >= x[0] - atol) & (borders <= x[-1] + atol)]
+    x = snap_to_borders(x, borders, atol)
+    for i in range(nb_passes):
+        a, b = x[:-1], x[1:]
+        refine = (variation(fields, a, b) > refine_tolerance) & (b - a > 2 * h_min)
+        if not refine.any():
+            break
+        x = np.sort(np.concatenate([x, ((a + b) / 2)[refine]]))
+
+    # remove the vertex between two cells if their union varies little,
+    # never two neighbouring vertices at once
+    removable = (
+        (variation(fields, x[:-2], x[2:]) < coarsen_tolerance)
+        & (x[2:] - x[:-2] <= h_max)
+        & ~np.isin(x[1:-1], borders)
+    )
+    removed = []
+    for i in np.flatnonzero(removable):
+        if not removed or removed[-1] != i - 1:
+            removed.append(i)
+    x = np.delete(x, np.array(removed, dtype=int) + 1)
+    return np.union1d(x, borders)
+
+
+def material_borders(model):
+    return sorted(
+        {x for material in model.materials.materials for x in material.borders}
+    )
+
+
+def concentration_fields(model):
+    """Splits the concentrations of a model
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+
+    Returns:
+        list: the cells tuples of the mobile concentration and of each trap
+    """
+    u = model.h_transport_problem.u
+    if len(model.traps.traps) == 0:
+        return [cell_values(u)]
+    return [cell_values(function) for function in u.split(deepcopy=True)]
+
+
+def remesh(model, make_model):
+    """Adapts the mesh of a model to its solution
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        make_model (callable): builds a set up (not initialised) model on a
+            given FESTIM mesh
+
+    Returns:
+        FESTIM.Simulation: the initialised model on the new mesh with the
+            transferred solution, or model if the mesh didn't change
+    """
+    fields = concentration_fields(model)
+    mobile = fields[0]
+    retention = tuple(mobile[:2]) + (
+        sum(field[2] for field in fields),
+        sum(field[3] for field in fields),
+    )
+    x = np.sort(model.mesh.mesh.coordinates()[:, 0])
+    x_new = adapt_vertices(x, [mobile, retention], material_borders(model))
+    atol = 1e-12 * (x[-1] - x[0])
+    if x_new.size == x.size and np.allclose(x_new, x, rtol=0, atol=atol):
+        return model
+
+    new_model = make_model(F.MeshFromVertices(x_new))
+    new_model.exports = model.exports
+    for export in new_model.exports.exports:
+        if hasattr(export, "last_written"):  # ThinnedXDMFExport
+            export.last_written = None
+    new_model.initialise()
+    # the XDMF files written with fenics.XDMFFile.write hold the first mesh
+    # only: the exports continue in new files, as after a restart
+    continue_xdmf_exports(new_model, new_model.exports.nb_iterations)
+
+    continuous = [True] + [model.settings.traps_element_type == "CG"] * (
+        len(fields) - 1
+    )
+    u = new_model.h_transport_problem.u
+    if len(fields) == 1:
+        set_cell_values(u, project(fields[0], x_new, continuous=True))
+    else:
+        for i, (field, is_continuous) in enumerate(zip(fields, continuous)):
+            function = f.Function(u.function_space().sub(i).collapse())
+            set_cell_values(function, project(field, x_new, is_continuous))
+            f.assign(u.sub(i), function)
+    new_model.h_transport_problem.u_n.assign(u)
+
+    if isinstance(model.T, F.HeatTransferProblem):
+        T = cell_values(model.T.T)
+        set_cell_values(new_model.T.T, project(T, x_new, continuous=True))
+        new_model.T.T_n.assign(new_model.T.T)
+
+    new_model.t = model.t
+    new_model.dt.value.assign(float(model.dt.value))
+    for counter in ["nb_steps", "nb_rejected"]:
+        if hasattr(model.dt, counter):
+            setattr(new_model.dt, counter, getattr(model.dt, counter))
+    print(
+        "Remeshed at t = {:.1f} s: {} -> {} cells".format(
+            model.t, x.size - 1, x_new.size - 1
+        )
+    )
+    return new_model
+
+
+def run_adaptive(model, make_model, schedule, monitor=None):
+    """Runs the transient simulation like F.Simulation.run, adapting the
+    mesh at the end of each phase of the schedule. No checkpoints are
+    written (their fields are tied to a mesh).
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        make_model (callable): builds a set up (not initialised) model on a
+            given FESTIM mesh, with the same setup as model
+        schedule (CycleSchedule): the cycle schedule
+        monitor (InventoryMonitor, optional): if given, the run stops as
+            soon as monitor.update returns True. Defaults to None.
+
+    Returns:
+        FESTIM.Simulation: the model at the end of the run
+    """
+    model.timer = f.Timer()
+    model.exports.final_time = model.settings.final_time
+    tolerance = 1e-9 * schedule.cycle_length
+    while not is_finished(model):
+        model.iterate()
+        if monitor is not None and monitor.update(model):
+            print("Converged at t = {:.1f} s, stopping".format(model.t))
+            write_fields_at_stop(model)
+            break
+        if schedule.phase_ending_at(model.t, tolerance) is not None:
+            if model.t < model.settings.final_time - tolerance:
+                model = remesh(model, make_model)
+                if monitor is not None:
+                    monitor.form = None  # assembled on the previous mesh
+    for export in model.exports.exports:
+        if isinstance(export, F.DerivedQuantities):
+            export.write()
+    return model
@@ -0,0 +1,79 @@
+"""Wall time and XDMF output size of the cycling setup (shortened to a few
+cycles) with every-step XDMF exports and with the thinned exports of
+cycling.make_exports (end of plateau and end of rest).
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import FESTIM as F
+
+from main import build_monoblock_model
+from cycle_schedule import CycleSchedule
+from cycling import (
+    setup_cycling,
+    make_exports,
+    rampup,
+    plateau,
+    rampdown,
+    rest,
+    heat_flux_value,
+    part_flux_value,
+)
+
+nb_cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+
+schedule = CycleSchedule(
+    rampup=rampup, plateau=plateau, rampdown=rampdown, rest=rest, nb_cycles=nb_cycles
+)
+
+
+def make_every_step_exports(main_folder):
+    return F.Exports(
+        [
+            F.XDMFExport(
+                field,
+                filename="{}/{}.xdmf".format(main_folder, label),
+                checkpoint=False,
+            )
+            for field, label in [
+                ("solute", "mobile_concentration"),
+                ("retention", "retention"),
+                ("T", "temperature"),
+            ]
+        ]
+    )
+
+
+def xdmf_size(folder):
+    return sum(
+        os.path.getsize(os.path.join(folder, filename))
+        for filename in os.listdir(folder)
+        if filename.endswith((".xdmf", ".h5"))
+    )
+
+
+def run(exports_factory):
+    with tempfile.TemporaryDirectory() as folder:
+        model = build_monoblock_model()
+        setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+        model.exports = exports_factory(folder)
+        model.initialise()
+        start = time.perf_counter()
+        model.run()
+        wall_time = time.perf_counter() - start
+        size = xdmf_size(folder)
+    return wall_time, size
+
+
+results = {
+    "every step": run(make_every_step_exports),
+    "thinned": run(lambda folder: make_exports(folder, schedule)),
+}
+
+print("{} cycles".format(nb_cycles))
+print("{:<16}{:>16}{:>16}".format("", "wall time (s)", "XDMF (MB)"))
+for name, (wall_time, size) in results.items():
+    print("{:<16}{:>16.1f}{:>16.2f}".format(name, wall_time, size / 1e6))
@@ -0,0 +1,84 @@
+"""Per-step cost of the cycling boundary conditions on the 20-cycle case.
+
+Compares InterpolatedExpression (Python callback per evaluation point) with
+TimeProfile (one interpolation per time step stored in a Constant). At each
+time step the expressions are updated, the heat flux form is assembled and
+the implantation Dirichlet BC is applied, as FESTIM does. The assembled
+vectors are checked to be identical.
+"""
+import time
+
+import fenics as f
+import numpy as np
+import FESTIM as F
+
+from main import build_monoblock_model, tungsten_parameters
+from model_parameters import implantation_depth, initial_temperature
+from cycle_schedule import CycleSchedule
+from fluxes import InterpolatedExpression, TimeProfile, dc_imp
+
+nb_cycles = 20
+rampup = 100
+plateau = 400
+rampdown = 100
+rest = 1000
+
+heat_flux_value = 5e6
+part_flux_value = 5e21
+
+dt = 5
+schedule = CycleSchedule(rampup, plateau, rampdown, rest, nb_cycles)
+
+model = build_monoblock_model()
+mesh = model.mesh.mesh
+surface_markers = model.mesh.define_surface_markers()
+ds = f.Measure("ds", domain=mesh, subdomain_data=surface_markers)
+V = f.FunctionSpace(mesh, "CG", 1)
+v = f.TestFunction(V)
+T = f.interpolate(f.Constant(initial_temperature), V)
+
+
+def run(profile_class):
+    heat_flux = profile_class(
+        data_t=schedule.t_data,
+        data_y=schedule.make_data_y([0, heat_flux_value, heat_flux_value, 0]),
+    )
+    phi = profile_class(
+        data_t=schedule.t_data,
+        data_y=schedule.make_data_y([0, part_flux_value, part_flux_value, 0]),
+    )
+    implantation = F.BoundaryConditionExpression(
+        T,
+        dc_imp,
+        phi=phi,
+        R_p=implantation_depth,
+        D_0=tungsten_parameters["D_0"],
+        E_D=tungsten_parameters["E_D"],
+    )
+    bc = f.DirichletBC(V, implantation, surface_markers, 1)
+    form = -heat_flux * v * ds(1)
+
+    vectors = []
+    times = []
+    for t in np.arange(dt, schedule.final_time, dt):
+        start = time.perf_counter()
+        for expression in [heat_flux, phi, implantation]:
+            expression.t = t
+        b = f.assemble(form)
+        bc.apply(b)
+        times.append(time.perf_counter() - start)
+        vectors.append(b.get_local())
+    return np.array(times), vectors
+
+
+times_old, vectors_old = run(InterpolatedExpression)
+times_new, vectors_new = run(TimeProfile)
+
+identical = all(np.array_equal(a, b) for a, b in zip(vectors_old, vectors_new))
+
+print("{} steps of {} s".format(len(times_old), dt))
+print("{:<24}{:>16}{:>16}".format("", "mean step (ms)", "total (s)"))
+for name, times in [("InterpolatedExpression", times_old), ("TimeProfile", times_new)]:
+    print("{:<24}{:>16.3f}{:>16.2f}".format(name, times.mean() * 1e3, times.sum()))
+print("speed-up: {:.1f}".format(times_old.sum() / times_new.sum()))
+print("bit-identical BC values: {}".format(identical))
@@ -0,0 +1,62 @@
+"""Setup time of the refined mesh of main.py with and without the on-disk
+cache of mesh_cache.py.
+
+The mesh is refined and marked from scratch, written to a temporary cache
+folder, then read back. The vertex coordinates, volume markers and surface
+markers read from the cache are checked to be identical to the original
+ones.
+"""
+
+import tempfile
+import time
+
+import numpy as np
+
+from main import make_materials, mesh_parameters
+from mesh_cache import create_mesh, load_or_create_mesh
+
+materials = make_materials()
+
+nb_repeats = 3
+
+
+def timed(function, *args):
+    times = []
+    for _ in range(nb_repeats):
+        start = time.perf_counter()
+        output = function(*args)
+        times.append(time.perf_counter() - start)
+    return output, min(times)
+
+
+with tempfile.TemporaryDirectory() as folder:
+    original, time_create = timed(create_mesh, mesh_parameters, materials)
+
+    start = time.perf_counter()
+    load_or_create_mesh(mesh_parameters, materials, folder)
+    time_miss = time.perf_counter() - start
+
+    cached, time_hit = timed(load_or_create_mesh, mesh_parameters, materials, folder)
+
+mesh, volume_markers, surface_markers = original
+cached_mesh, cached_volume_markers, cached_surface_markers = cached
+
+identical = {
+    "vertices": np.array_equal(mesh.coordinates(), cached_mesh.coordinates()),
+    "cells": np.array_equal(mesh.cells(), cached_mesh.cells()),
+    "volume markers": np.array_equal(
+        volume_markers.array(), cached_volume_markers.array()
+    ),
+    "surface markers": np.array_equal(
+        surface_markers.array(), cached_surface_markers.array()
+    ),
+}
+
+print("{} cells, {} vertices".format(mesh.num_cells(), mesh.num_vertices()))
+print("{:<32}{:>12}".format("", "time (s)"))
+print("{:<32}{:>12.3f}".format("refine and mark", time_create))
+print("{:<32}{:>12.3f}".format("cache miss (refine and write)", time_miss))
+print("{:<32}{:>12.3f}".format("cache hit (read)", time_hit))
+print("speed-up: {:.1f}".format(time_create / time_hit))
+for name, value in identical.items():
+    print("identical {}: {}".format(name, value))
@@ -0,0 +1,492 @@
+"""Benchmark suite of the monoblock cycling workflow.
+
+Short, fixed configurations:
+    - "mesh": refinement and marking of the mesh of main.py, and reading it
+      back from the mesh cache
+    - "bc_eval": updating and applying the cycling boundary conditions of
+      fluxes.py over 2 cycles of 5 s steps
+    - "stepsize": CyclingStepsize.adapt (phase lookup and breakpoint
+      clipping) over 2 cycles of 1 s steps
+    - "cycling": cycling.py shortened to 2 cycles
+    - "continuous": continuous.py shortened to the exposure time of 2 cycles
+    - "restricted_traps": the cycling setup solved with and without the
+      trap unknowns outside the trap materials pinned (restricted_traps.py).
+      Fails if the TotalVolume retentions of the three materials at the
+      phase boundaries differ by more than a relative 1e-6.
+    - "adaptive_mesh": the cycling setup on the refined mesh of main.py
+      (reference), with the adaptive mesh of adaptive_mesh.py, and on a
+      static mesh with as many cells as the adaptive one on average (every
+      k-th vertex of the refined mesh). Reports the number of cells and the
+      largest relative difference of the inventory at the phase boundaries
+      with the reference, ie. the accuracy of the adaptive mesh against a
+      static mesh of the same size
+    - "postprocessing": the post-processing of plot_inventory.py (see
+      spike_analysis.analyse_scenario) on all the results/ folders
+    - "screening": the "cycling" and "continuous" configurations run as one
+      batch by the reduced engine of screening.py, and with FESTIM. Reports
+      the wall time of the engine, the wall time of FESTIM (festim_wall)
+      and their ratio (speedup)
+
+Each benchmark runs in a fresh process and reports its wall time (s), its
+peak RSS (MB) and, for the simulations, the number of steps, rejected
+solves and Newton iterations. The results are written to a JSON file and
+can be compared with a baseline:
+
+    python benchmark_suite.py --output new.json --baseline baseline.json
+
+exits with status 1 if a metric of a benchmark is more than threshold
+(relative) above its baseline value.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+nb_cycles = 2
+rampup = 100
+plateau = 400
+rampdown = 100
+rest = 1000
+
+heat_flux_value = 5e6
+part_flux_value = 5e21
+
+# metrics for which an increase is a regression
+compared_metrics = [
+    "wall",
+    "peak_rss",
+    "nb_steps",
+    "nb_rejected",
+    "newton_iterations",
+]
+
+
+def make_schedule():
+    from cycle_schedule import CycleSchedule
+
+    return CycleSchedule(rampup, plateau, rampdown, rest, nb_cycles)
+
+
+def benchmark_mesh():
+    from main import make_materials, mesh_parameters
+    from mesh_cache import create_mesh, read_mesh, write_mesh
+
+    start = time.perf_counter()
+    mesh, volume_markers, surface_markers = create_mesh(
+        mesh_parameters, make_materials()
+    )
+    create = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as folder:
+        write_mesh(folder, volume_markers, surface_markers)
+        start = time.perf_counter()
+        read_mesh(folder)
+        read = time.perf_counter() - start
+    return {
+        "wall": create + read,
+        "create": create,
+        "read": read,
+        "nb_cells": mesh.num_cells(),
+    }
+
+
+def benchmark_bc_eval():
+    import fenics as f
+    import numpy as np
+
+    from main import build_monoblock_model
+    from cycling import setup_cycling
+
+    schedule = make_schedule()
+    model = build_monoblock_model()
+    setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+    mesh = model.mesh.mesh
+    surface_markers = model.mesh.define_surface_markers()
+    ds = f.Measure("ds", domain=mesh, subdomain_data=surface_markers)
+    V = f.FunctionSpace(mesh, "CG", 1)
+    v = f.TestFunction(V)
+    T = f.interpolate(f.Constant(323), V)
+
+    h_implantation, _, heat_flux, _ = model.boundary_conditions
+    h_implantation.create_expression(T)
+    heat_flux.create_form(T, None)
+    expressions = h_implantation.sub_expressions + heat_flux.sub_expressions
+    bc = f.DirichletBC(V, h_implantation.expression, surface_markers, 1)
+    form = -heat_flux.form * v * ds(1)
+
+    steps = np.arange(5, schedule.final_time, 5)
+    start = time.perf_counter()
+    for t in steps:
+        for expression in expressions:
+            expression.t = t
+        b = f.assemble(form)
+        bc.apply(b)
+    return {"wall": time.perf_counter() - start, "nb_steps": steps.size}
+
+
+def benchmark_stepsize():
+    import types
+
+    import numpy as np
+
+    from cycling import setup_cycling
+
+    schedule = make_schedule()
+    # only the stepsize is used, no mesh needed
+    model = types.SimpleNamespace()
+    setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+    stepsize = model.dt
+
+    steps = np.arange(1, schedule.final_time, 1.0)
+    start = time.perf_counter()
+    for t in steps:
+        stepsize.adapt(t, 3, True)
+    return {"wall": time.perf_counter() - start, "nb_steps": steps.size}
+
+
+def run_model(model, folder, schedule=None):
+    """Runs an initialised model with a StepProfiler attached
+
+    Args:
+        model (FESTIM.Simulation): the model
+        folder (str): folder of the trace
+        schedule (CycleSchedule, optional): the cycle schedule. Defaults to
+            None.
+
+    Returns:
+        dict: the wall time (s), number of steps, rejected solves and
+            Newton iterations, and the times (s) by category
+    """
+    from profiling import StepProfiler, read_trace
+
+    profiler = StepProfiler(folder + "/profile.jsonl", schedule)
+    profiler.attach(model)
+    start = time.perf_counter()
+    model.run()
+    wall = time.perf_counter() - start
+    profiler.close()
+
+    records = read_trace(profiler.filename)
+    times = {}
+    for record in records:
+        for category, value in record["times"].items():
+            times[category] = times.get(category, 0) + value
+    return {
+        "wall": wall,
+        "nb_steps": len(records),
+        "nb_rejected": sum(record["rejected"] for record in records),
+        "newton_iterations": sum(sum(r["newton_iterations"]) for r in records),
+        "times": times,
+    }
+
+
+def benchmark_cycling():
+    from main import build_monoblock_model
+    from cycling import setup_cycling, make_exports
+
+    schedule = make_schedule()
+    model = build_monoblock_model()
+    setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+    with tempfile.TemporaryDirectory() as folder:
+        model.exports = make_exports(folder, schedule)
+        model.initialise()
+        return run_model(model, folder, schedule)
+
+
+def benchmark_continuous():
+    from main import build_monoblock_model
+    from continuous import setup_continuous, make_exports
+
+    model = build_monoblock_model()
+    final_time = nb_cycles * (rampup + plateau + rampdown)
+    setup_continuous(model, final_time, heat_flux_value, part_flux_value)
+    with tempfile.TemporaryDirectory() as folder:
+        model.exports = make_exports(folder)
+        model.initialise()
+        return run_model(model, folder)
+
+
+def benchmark_restricted_traps():
+    import numpy as np
+
+    from main import build_monoblock_model
+    from cycling import setup_cycling, make_exports
+    from derived_quantities_reader import read_derived_quantities
+    from restricted_traps import restrict_traps
+
+    schedule = make_schedule()
+    walls, retentions = {}, {}
+    for restricted in [False, True]:
+        model = build_monoblock_model()
+        setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+        if restricted:
+            restrict_traps(model)
+        with tempfile.TemporaryDirectory() as folder:
+            model.exports = make_exports(folder, schedule)
+            model.initialise()
+            start = time.perf_counter()
+            model.run()
+            walls[restricted] = time.perf_counter() - start
+            data = read_derived_quantities(folder)
+            # the steps end on the phase boundaries
+            retentions[restricted] = np.array(
+                [
+                    np.interp(
+                        schedule.t_data[1:],
+                        data["ts"],
+                        data["Total_retention_volume_{}".format(volume)],
+                    )
+                    for volume in [1, 2, 3]
+                ]
+            )
+
+    full, pinned = retentions[False], retentions[True]
+    scale = np.abs(full).max(axis=1, keepdims=True)
+    difference = float(np.max(np.abs(pinned - full) / scale))
+    if difference > 1e-6:
+        raise RuntimeError(
+            "retention differs from the full solve by {:.2e}".format(difference)
+        )
+    return {
+        "wall": walls[True],
+        "wall_full": walls[False],
+        "retention_difference": difference,
+    }
+
+
+def benchmark_adaptive_mesh():
+    import numpy as np
+    import FESTIM as F
+
+    from main import build_monoblock_model, make_materials
+    from cycling import setup_cycling, make_exports
+    from adaptive_mesh import run_adaptive
+    from derived_quantities_reader import read_derived_quantities
+
+    schedule = make_schedule()
+    nb_cells = []
+
+    def make_model(mesh=None):
+        model = build_monoblock_model(**({} if mesh is None else {"mesh": mesh}))
+        setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+        return model
+
+    def make_adapted_model(mesh):
+        nb_cells.append(mesh.vertices.size - 1)
+        return make_model(mesh)
+
+    def run(model, adaptive=False):
+        with tempfile.TemporaryDirectory() as folder:
+            model.exports = make_exports(folder, schedule)
+            model.initialise()
+            start = time.perf_counter()
+            if adaptive:
+                run_adaptive(model, make_adapted_model, schedule)
+            else:
+                model.run()
+            wall = time.perf_counter() - start
+            data = read_derived_quantities(folder)
+            inventory = sum(
+                data["Total_retention_volume_{}".format(volume)] for volume in [1, 2, 3]
+            )
+            # the steps end on the phase boundaries
+            return wall, np.interp(schedule.t_data[1:], data["ts"], inventory)
+
+    model = make_model()
+    x = np.sort(model.mesh.mesh.coordinates()[:, 0])
+    _, reference = run(model)
+
+    nb_cells.append(x.size - 1)
+    wall, adaptive = run(make_model(), adaptive=True)
+    nb_cells_adaptive = float(np.mean(nb_cells))
+
+    # same grading as the refined mesh, as many cells as the adaptive mesh
+    step = int(np.ceil((x.size - 1) / nb_cells_adaptive))
+    borders = [border for material in make_materials() for border in material.borders]
+    x_static = np.union1d(np.append(x[::step], x[-1]), borders)
+    _, static = run(make_model(F.MeshFromVertices(x_static)))
+
+    scale = np.abs(reference).max()
+    return {
+        "wall": wall,
+        "nb_cells_reference": x.size - 1,
+        "nb_cells_adaptive": nb_cells_adaptive,
+        "nb_cells_static": x_static.size - 1,
+        "error_adaptive": float(np.abs(adaptive - reference).max() / scale),
+        "error_static": float(np.abs(static - reference).max() / scale),
+    }
+
+
+def benchmark_postprocessing():
+    from postprocessing import load_inventory
+    from spike_analysis import analyse_scenario, find_scenarios
+
+    scenarios = find_scenarios()
+    load_inventory.cache_clear()
+    start = time.perf_counter()
+    for scenario in scenarios:
+        analyse_scenario(scenario)
+    return {"wall": time.perf_counter() - start, "nb_scenarios": len(scenarios)}
+
+
+def benchmark_screening():
+    from screening import Scenario, run_batch
+
+    final_time = nb_cycles * (rampup + plateau + rampdown)
+    scenarios = [
+        Scenario(heat_flux_value, part_flux_value, make_schedule()),
+        Scenario(heat_flux_value, part_flux_value, final_time=final_time),
+    ]
+    _, statistics = run_batch(scenarios)
+    festim_wall = benchmark_cycling()["wall"] + benchmark_continuous()["wall"]
+    return {
+        "wall": statistics["wall"],
+        "nb_steps": statistics["nb_steps"],
+        "festim_wall": festim_wall,
+        "speedup": festim_wall / statistics["wall"],
+    }
+
+
+benchmarks = {
+    "mesh": benchmark_mesh,
+    "bc_eval": benchmark_bc_eval,
+    "stepsize": benchmark_stepsize,
+    "cycling": benchmark_cycling,
+    "continuous": benchmark_continuous,
+    "restricted_traps": benchmark_restricted_traps,
+    "adaptive_mesh": benchmark_adaptive_mesh,
+    "postprocessing": benchmark_postprocessing,
+    "screening": benchmark_screening,
+}
+
+
+def run_benchmark(name):
+    """Runs a benchmark and adds the peak RSS of the process to its metrics
+
+    Args:
+        name (str): the name of the benchmark
+
+    Returns:
+        dict: the metrics
+    """
+    metrics = benchmarks[name]()
+    # kB on Linux
+    metrics["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return metrics
+
+
+def run_suite(names):
+    """Runs benchmarks, each in a fresh process so that their peak RSS and
+    caches (mesh, compiled forms) don't depend on each other
+
+    Args:
+        names (list): names of the benchmarks
+
+    Returns:
+        dict: the metadata of the run and the metrics by benchmark
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        print("Running {}".format(name))
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_benchmark, (name,))
+    return {"metadata": metadata(), "benchmarks": results}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "commit": commit,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """Compares results with a baseline
+
+    Args:
+        results (dict): the results (see run_suite)
+        baseline (dict): the baseline results
+        threshold (float, optional): maximum relative increase of a metric.
+            Defaults to 0.1.
+
+    Returns:
+        list: the regressions (benchmark, metric, baseline value, value)
+    """
+    regressions = []
+    print("{:<16}{:<20}{:>14}{:>14}{:>10}".format("", "", "baseline", "new", "change"))
+    for name, metrics in results["benchmarks"].items():
+        reference = baseline["benchmarks"].get(name)
+        if reference is None:
+            continue
+        for metric in compared_metrics:
+            if metric not in metrics or metric not in reference:
+                continue
+            change = (metrics[metric] - reference[metric]) / max(
+                reference[metric], 1e-300
+            )
+            regression = change > threshold
+            if regression:
+                regressions.append((name, metric, reference[metric], metrics[metric]))
+            print(
+                "{:<16}{:<20}{:>14.4g}{:>14.4g}{:>+10.1%}{}".format(
+                    name,
+                    metric,
+                    reference[metric],
+                    metrics[metric],
+                    change,
+                    "  REGRESSION" if regression else "",
+                )
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "names", nargs="*", default=list(benchmarks), help="benchmarks to run"
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmarks/{}.json".format(
+            datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        ),
+        help="JSON file of the results",
+    )
+    parser.add_argument("--baseline", help="JSON file of the baseline results")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="maximum relative increase of a metric",
+    )
+    args = parser.parse_args()
+
+    results = run_suite(args.names)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print("Results written to {}".format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("{} regression(s)".format(len(regressions)))
+            sys.exit(1)
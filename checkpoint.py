@@ -0,0 +1,384 @@
+"""Checkpoint/restart of FESTIM simulations.
+
+A checkpoint is a folder with
+    - fields.h5: the concentrations (mobile and traps, current and previous
+      time step), the temperature (current and previous time step) and the
+      previous solutions of the error-controlled CyclingStepsize
+    - state.json: the time, the stepsize (value, counters and error
+      history), the number of iterations of the exports, the history of
+      the derived quantities and the state of the InventoryMonitor
+    - derived_quantities_<i>.<j>.bin: the history of the derived
+      quantities written by StreamingDerivedQuantities exports (column j
+      of export i)
+
+Checkpoints are written in a temporary folder then renamed to
+checkpoint_<iteration>, so a run killed while writing never leaves a
+partial checkpoint behind. The temporary folders left by killed writes are
+removed by the next save_state in the same folder. Only the latest nb_kept
+checkpoints are kept.
+
+To resume, the model is set up as usual (possibly with a larger
+nb_cycles or final_time), initialised, then restored with resume (or
+read_checkpoint) before calling run_with_checkpoints. resume keeps the
+XDMF files written before the checkpoint: exports written with
+write_checkpoint are appended to, the others continue in a new file
+<name>_from_<iteration>.xdmf.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import fenics as f
+import numpy as np
+import FESTIM as F
+
+from thinned_exports import ThinnedXDMFExport
+
+# attributes of the stepsize saved with the checkpoints if they exist
+# (CyclingStepsize counters and error history)
+stepsize_attributes = ["nb_steps", "nb_rejected", "nb_history", "previous_dt"]
+
+# previous solutions of the error-controlled CyclingStepsize
+stepsize_fields = ["u_n", "u_nm1"]
+
+# temporary folders older than this are left by killed writes (s)
+stale_age = 3600
+temporary_prefix = ".tmp_"
+
+
+def get_fields(model):
+    """Returns the fields saved in the checkpoints
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+
+    Returns:
+        dict: {name: fenics.Function}
+    """
+    fields = {
+        "u": model.h_transport_problem.u,
+        "u_n": model.h_transport_problem.u_n,
+        "T": model.T.T,
+        "T_n": model.T.T_n,
+    }
+    for name in stepsize_fields:
+        if hasattr(model.dt, name):  # tracked CyclingStepsize
+            fields["stepsize_" + name] = getattr(model.dt, name)
+    return fields
+
+
+def get_derived_quantities(model):
+    """Returns the derived quantities exports of the model
+
+    Args:
+        model (FESTIM.Simulation): the model
+
+    Returns:
+        list: the F.DerivedQuantities objects
+    """
+    return [
+        export
+        for export in model.exports.exports
+        if isinstance(export, F.DerivedQuantities)
+    ]
+
+
+def is_written(export, model):
+    """Checks if an XDMF export was written at the last time step
+
+    Args:
+        export (F.XDMFExport): the export
+        model (FESTIM.Simulation): the model
+
+    Returns:
+        bool: True if the export was written at model.t
+    """
+    if isinstance(export, ThinnedXDMFExport):
+        return export.t_written == model.t
+    if export.mode == "last":
+        return model.t >= model.settings.final_time
+    # F.Exports.write counts the iteration after writing
+    return (model.exports.nb_iterations - 1) % export.mode == 0
+
+
+def write_fields_at_stop(model):
+    """Writes the XDMF exports at the current time when the run stops
+    before its final time (see InventoryMonitor), as they are at the final
+    time. The exports already written at this time are skipped.
+
+    Args:
+        model (FESTIM.Simulation): the model
+    """
+    for export in model.exports.exports:
+        if not isinstance(export, F.XDMFExport) or is_written(export, model):
+            continue
+        function = model.label_to_function[export.field]
+        # as F.Exports.write
+        if not isinstance(function, f.Function):
+            function = f.project(function, model.exports.V_DG1)
+        export.function = function
+        if isinstance(export, ThinnedXDMFExport):
+            export.forced = True
+        export.write(model.t)
+        export.append = True
+
+
+def list_checkpoints(folder):
+    """Lists the checkpoints of a folder
+
+    Args:
+        folder (str): the checkpoints folder
+
+    Returns:
+        list: paths of the checkpoints, oldest first
+    """
+    if not os.path.exists(folder):
+        return []
+    names = [name for name in os.listdir(folder) if name.startswith("checkpoint_")]
+    return [os.path.join(folder, name) for name in sorted(names)]
+
+
+def remove_stale_temporary_folders(folder):
+    """Removes the temporary folders of save_state left behind by killed
+    writes. Only the folders older than stale_age are removed, so the ones
+    being written by other processes are kept.
+
+    Args:
+        folder (str): the folder
+    """
+    now = time.time()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if not name.startswith(temporary_prefix) or not os.path.isdir(path):
+            continue
+        try:
+            if now - os.path.getmtime(path) > stale_age:
+                shutil.rmtree(path)
+        except OSError:  # removed by another process
+            pass
+
+
+def save_state(model, path, replace=True, monitor=None):
+    """Writes the state of the model to the folder path. The state is
+    written in a temporary folder renamed to path once complete.
+
+    Args:
+        model (FESTIM.Simulation): the model
+        path (str): the folder
+        replace (bool, optional): if False and path already exists (eg.
+            written by another process), it is kept as is. Defaults to True.
+        monitor (InventoryMonitor, optional): if given, its state is saved
+            too. Defaults to None.
+    """
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    remove_stale_temporary_folders(parent)
+    tmp_path = tempfile.mkdtemp(prefix=temporary_prefix, dir=parent)
+
+    with f.HDF5File(
+        model.mesh.mesh.mpi_comm(), os.path.join(tmp_path, "fields.h5"), "w"
+    ) as file:
+        for name, function in get_fields(model).items():
+            file.write(function, name)
+
+    state = {
+        "t": model.t,
+        "dt": float(model.dt.value),
+        "nb_iterations": model.exports.nb_iterations,
+        "stepsize": {
+            attribute: getattr(model.dt, attribute)
+            for attribute in stepsize_attributes
+            if hasattr(model.dt, attribute)
+        },
+        "derived_quantities": [],
+    }
+    for i, export in enumerate(get_derived_quantities(model)):
+        if hasattr(export, "save"):  # StreamingDerivedQuantities
+            export.save(os.path.join(tmp_path, "derived_quantities_{}.bin".format(i)))
+            state["derived_quantities"].append(None)
+        else:
+            state["derived_quantities"].append(export.data[1:])
+    if monitor is not None:
+        state["monitor"] = monitor.get_state()
+    with open(os.path.join(tmp_path, "state.json"), "w") as file:
+        json.dump(state, file)
+
+    if replace and os.path.exists(path):
+        shutil.rmtree(path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        if replace:
+            raise
+        shutil.rmtree(tmp_path)
+
+
+def write_checkpoint(model, folder, nb_kept=2, monitor=None):
+    """Writes a checkpoint of the model
+
+    Args:
+        model (FESTIM.Simulation): the model
+        folder (str): the checkpoints folder
+        nb_kept (int, optional): number of checkpoints kept. Defaults to 2.
+        monitor (InventoryMonitor, optional): if given, its state is saved
+            too. Defaults to None.
+
+    Returns:
+        str: the path of the checkpoint
+    """
+    checkpoint = os.path.join(
+        folder, "checkpoint_{:09d}".format(model.exports.nb_iterations)
+    )
+    save_state(model, checkpoint, monitor=monitor)
+
+    for old_checkpoint in list_checkpoints(folder)[:-nb_kept]:
+        shutil.rmtree(old_checkpoint)
+    return checkpoint
+
+
+def read_checkpoint(model, checkpoint, monitor=None):
+    """Restores the state of an initialised model from a checkpoint (or any
+    folder written by save_state)
+
+    Args:
+        model (FESTIM.Simulation): the initialised model, set up like the
+            one that wrote the checkpoint
+        checkpoint (str): the path of the checkpoint
+        monitor (InventoryMonitor, optional): if given, it is restored from
+            the checkpoint (if saved). Defaults to None.
+    """
+    with f.HDF5File(
+        model.mesh.mesh.mpi_comm(), os.path.join(checkpoint, "fields.h5"), "r"
+    ) as file:
+        for name, function in get_fields(model).items():
+            if file.has_dataset(name):  # older checkpoints lack some fields
+                file.read(function, name)
+
+    with open(os.path.join(checkpoint, "state.json")) as file:
+        state = json.load(file)
+
+    model.t = state["t"]
+    model.dt.value.assign(state["dt"])
+    model.exports.nb_iterations = state["nb_iterations"]
+    for attribute, value in state["stepsize"].items():
+        setattr(model.dt, attribute, value)
+    if monitor is not None and "monitor" in state:
+        monitor.set_state(state["monitor"])
+
+    for i, (export, rows) in enumerate(
+        zip(get_derived_quantities(model), state["derived_quantities"])
+    ):
+        if rows is None:
+            export.load(os.path.join(checkpoint, "derived_quantities_{}.bin".format(i)))
+            continue
+        export.data = [export.make_header()] + rows
+        export.t = [row[0] for row in rows]
+        for i, quantity in enumerate(export.derived_quantities, start=1):
+            quantity.t = [row[0] for row in rows]
+            quantity.data = [row[i] for row in rows]
+
+
+def continue_xdmf_exports(model, nb_iterations):
+    """Makes the XDMF exports of a resumed model keep the files written
+    before the checkpoint. fenics.XDMFFile.write_checkpoint can append to an
+    existing file, fenics.XDMFFile.write can't: these exports continue in
+    <name>_from_<nb_iterations>.xdmf. Also used when the mesh changes (see
+    adaptive_mesh.remesh).
+
+    Args:
+        model (FESTIM.Simulation): the model
+        nb_iterations (int): the number of iterations of the checkpoint
+    """
+    for export in model.exports.exports:
+        if not isinstance(export, F.XDMFExport):
+            continue
+        if export.checkpoint:
+            export.append = True
+        else:
+            # <name> of the original file, not of a previous continuation
+            name = re.sub(r"_from_\d{9}$", "", export.filename[: -len(".xdmf")])
+            export.filename = "{}_from_{:09d}.xdmf".format(name, nb_iterations)
+            export.define_xdmf_file()
+
+
+def resume(model, folder, monitor=None):
+    """Restores the model from the latest checkpoint of folder, if any. The
+    XDMF files written before the checkpoint are kept (see
+    continue_xdmf_exports).
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        folder (str): the checkpoints folder
+        monitor (InventoryMonitor, optional): if given, it is restored from
+            the checkpoint. Defaults to None.
+
+    Returns:
+        bool: True if the model was restored, else False
+    """
+    checkpoints = list_checkpoints(folder)
+    if not checkpoints:
+        return False
+    read_checkpoint(model, checkpoints[-1], monitor)
+    continue_xdmf_exports(model, model.exports.nb_iterations)
+    print("Resumed from {} at t = {:.1f} s".format(checkpoints[-1], model.t))
+    return True
+
+
+def is_finished(model):
+    """Checks if the model has reached its final time. As in FESTIM, t is
+    considered final when it is within round-off of final_time.
+
+    Args:
+        model (FESTIM.Simulation): the model
+
+    Returns:
+        bool: True if the run is finished, else False
+    """
+    final_time = model.settings.final_time
+    return model.t >= final_time or np.isclose(model.t, final_time, atol=0)
+
+
+def run_with_checkpoints(model, folder, interval=600, nb_kept=2, monitor=None):
+    """Runs the transient simulation like F.Simulation.run, writing a
+    checkpoint every interval seconds of wall time and at the end
+
+    Args:
+        model (FESTIM.Simulation): the initialised (and possibly resumed)
+            model
+        folder (str): the checkpoints folder
+        interval (float, optional): wall time between checkpoints (s).
+            Defaults to 600.
+        nb_kept (int, optional): number of checkpoints kept. Defaults to 2.
+        monitor (InventoryMonitor, optional): if given, the run stops as
+            soon as monitor.update returns True, and its state is saved with
+            the checkpoints. Defaults to None.
+    """
+    model.timer = f.Timer()
+    model.exports.final_time = model.settings.final_time
+    if not model.settings.update_jacobian:
+        model.h_transport_problem.compute_jacobian()
+
+    # as in F.Simulation.iterate, avoid t > final_time
+    if not is_finished(model) and (
+        model.t + float(model.dt.value) > model.settings.final_time
+    ):
+        model.dt.value.assign(model.settings.final_time - model.t)
+
+    last_checkpoint = time.perf_counter()
+    while not is_finished(model):
+        model.iterate()
+        if monitor is not None and monitor.update(model):
+            print("Converged at t = {:.1f} s, stopping".format(model.t))
+            # the exports may not have been written at this step
+            for export in get_derived_quantities(model):
+                export.write()
+            write_fields_at_stop(model)
+            break
+        if time.perf_counter() - last_checkpoint > interval:
+            write_checkpoint(model, folder, nb_kept, monitor)
+            last_checkpoint = time.perf_counter()
+    write_checkpoint(model, folder, nb_kept, monitor)
@@ -0,0 +1,116 @@
+"""Number of steps, rejected solves and wall time of the CyclingStepsize
+modes (phase caps only, breakpoint-aware, error-controlled) on the
+cycling.py setup (shortened to a few cycles).
+"""
+import sys
+import time
+
+import FESTIM as F
+
+from main import (
+    build_monoblock_model,
+    make_coolant_boundary_conditions,
+    tungsten_parameters,
+)
+from model_parameters import implantation_depth, initial_temperature
+
+from cycle_schedule import CycleSchedule
+from cycling_stepsize import CyclingStepsize
+from fluxes import CyclingFlux, CyclingImplantationDirichlet
+
+nb_cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+rampup = 100
+plateau = 400
+rampdown = 100
+rest = 1000
+
+heat_flux_value = 5e6
+part_flux_value = 5e21
+
+schedule = CycleSchedule(
+    rampup=rampup, plateau=plateau, rampdown=rampdown, rest=rest, nb_cycles=nb_cycles
+)
+
+
+def run(stepsizes_restart, error_relative_tolerance=None):
+    model = build_monoblock_model()
+    model.settings = F.Settings(
+        absolute_tolerance=1e10,
+        relative_tolerance=1e-10,
+        final_time=schedule.final_time,
+        chemical_pot=False,
+        traps_element_type="DG",
+    )
+    model.dt = CyclingStepsize(
+        schedule=schedule,
+        stepsizes_max={"rampup": 5, "plateau": 20, "rampdown": 5, "rest": 50},
+        stepsizes_restart=stepsizes_restart,
+        error_relative_tolerance=error_relative_tolerance,
+        initial_value=0.1,
+        stepsize_change_ratio=1.1,
+        dt_min=0.1,
+    )
+    recombination_flux_coolant, convection_flux = make_coolant_boundary_conditions()
+    model.boundary_conditions = [
+        CyclingImplantationDirichlet(
+            surfaces=1,
+            phi=part_flux_value,
+            R_p=implantation_depth,
+            D_0=tungsten_parameters["D_0"],
+            E_D=tungsten_parameters["E_D"],
+            data_y=[0, part_flux_value, part_flux_value, 0],
+            schedule=schedule,
+        ),
+        recombination_flux_coolant,
+        CyclingFlux(
+            surfaces=1,
+            field="T",
+            data_y=[0, heat_flux_value, heat_flux_value, 0],
+            schedule=schedule,
+        ),
+        convection_flux,
+    ]
+    model.T = F.HeatTransferProblem(
+        transient=True,
+        initial_value=initial_temperature,
+        relative_tolerance=1e-6,
+        absolute_tolerance=1e0,
+    )
+
+    model.dt.attach(model)
+    model.initialise()
+    start = time.perf_counter()
+    model.run()
+    return model.dt, time.perf_counter() - start
+
+
+results = {
+    "phase caps only": run(stepsizes_restart=None),
+    "breakpoint-aware": run(
+        stepsizes_restart={"rampup": 0.5, "plateau": 2, "rampdown": 0.5, "rest": 2}
+    ),
+    "error-controlled": run(
+        stepsizes_restart={"rampup": 0.5, "plateau": 2, "rampdown": 0.5, "rest": 2},
+        error_relative_tolerance=1e-3,
+    ),
+}
+
+print("{} cycles".format(nb_cycles))
+header = "{:<20}{:>10}{:>12}{:>14}{:>16}{:>14}"
+row = "{:<20}{:>10}{:>12}{:>14.1f}{:>16.1f}{:>14.1f}"
+print(
+    header.format(
+        "", "steps", "rejected", "steps/cycle", "rejected/cycle", "wall time (s)"
+    )
+)
+for name, (stepsize, wall_time) in results.items():
+    print(
+        row.format(
+            name,
+            stepsize.nb_steps,
+            stepsize.nb_rejected,
+            stepsize.nb_steps / nb_cycles,
+            stepsize.nb_rejected / nb_cycles,
+            wall_time,
+        )
+    )
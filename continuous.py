@@ -1,4 +1,16 @@
-from main import model, tungsten, recombination_flux_coolant, convection_flux
+import sys
+
+from main import (
+    build_monoblock_model,
+    make_coolant_boundary_conditions,
+    tungsten_parameters,
+)
+from model_parameters import implantation_depth
+
+from checkpoint import resume, run_with_checkpoints
+from streaming_derived_quantities import StreamingDerivedQuantities
+from restricted_traps import restrict_traps
+from profiling import StepProfiler, print_summary, read_trace, summarise
 
 import FESTIM as F
 
@@ -11,63 +23,121 @@ rest = 1000
 heat_flux_value = 5e6
 part_flux_value = 5e21
 
-model.settings = F.Settings(
-    absolute_tolerance=1e10,
-    relative_tolerance=1e-10,
-    final_time=nb_cycles * (rampup + plateau + rampdown),
-    chemical_pot=False,
-    traps_element_type="DG",
-)
-
-model.dt = F.Stepsize(initial_value=1, stepsize_change_ratio=1.1, dt_min=0.1)
-
-h_implantation = F.ImplantationDirichlet(
-    surfaces=1, phi=part_flux_value, R_p=9.52e-10, D_0=tungsten.D_0, E_D=tungsten.E_D
-)
-
-heat_flux = F.FluxBC(surfaces=1, field="T", value=heat_flux_value)
-
+# if True, the trap unknowns outside the trap materials are pinned (see
+# restricted_traps.py). The Newton system keeps its size, so this saves
+# neither time nor memory: off by default
+pin_inactive_traps = False
+
+
+def setup_continuous(model, final_time, heat_flux_value, part_flux_value):
+    """Sets the settings, stepsize, boundary conditions and temperature of
+    the model for a continuous scenario
+
+    Args:
+        model (FESTIM.Simulation): the model
+        final_time (float): the final time (s)
+        heat_flux_value (float): heat flux (W/m2)
+        part_flux_value (float): particle flux (H/m2/s)
+    """
+    model.settings = F.Settings(
+        absolute_tolerance=1e10,
+        relative_tolerance=1e-10,
+        final_time=final_time,
+        chemical_pot=False,
+        traps_element_type="DG",
+    )
+
+    model.dt = F.Stepsize(initial_value=1, stepsize_change_ratio=1.1, dt_min=0.1)
+
+    h_implantation = F.ImplantationDirichlet(
+        surfaces=1,
+        phi=part_flux_value,
+        R_p=implantation_depth,
+        D_0=tungsten_parameters["D_0"],
+        E_D=tungsten_parameters["E_D"],
+    )
+
+    heat_flux = F.FluxBC(surfaces=1, field="T", value=heat_flux_value)
+
+    recombination_flux_coolant, convection_flux = make_coolant_boundary_conditions()
+    h_transport_bcs = [h_implantation, recombination_flux_coolant]
+    heat_transfer_bcs = [heat_flux, convection_flux]
+
+    model.boundary_conditions = h_transport_bcs + heat_transfer_bcs
+
+    model.T = F.HeatTransferProblem(
+        transient=False, relative_tolerance=1e-6, absolute_tolerance=1e0
+    )
+
+
+def make_exports(main_folder, csv=False):
+    """Creates the exports of a continuous run. The derived quantities are
+    streamed to derived_quantities.bin.
+
+    Args:
+        main_folder (str): the results folder
+        csv (bool, optional): if True, the derived quantities are also
+            written to derived_quantities.csv. Defaults to False.
+
+    Returns:
+        FESTIM.Exports: the exports
+    """
+    derived_quantities = StreamingDerivedQuantities(
+        [
+            F.TotalVolume(field="retention", volume=1),
+            F.TotalVolume(field="retention", volume=2),
+            F.TotalVolume(field="retention", volume=3),
+        ],
+        filename=main_folder + "/derived_quantities.bin",
+        csv_filename=main_folder + "/derived_quantities.csv" if csv else None,
+    )
+
+    return F.Exports(
+        [
+            F.XDMFExport(
+                "solute",
+                filename=main_folder + "/mobile_concentration.xdmf",
+                checkpoint=False,
+            ),
+            F.XDMFExport(
+                "retention",
+                filename=main_folder + "/retention.xdmf",
+                checkpoint=False,
+            ),
+            F.XDMFExport(
+                "T", filename=main_folder + "/temperature.xdmf", checkpoint=False
+            ),
+            derived_quantities,
+        ]
+    )
 
-h_transport_bcs = [h_implantation, recombination_flux_coolant]
-heat_transfer_bcs = [heat_flux, convection_flux]
-
-
-model.boundary_conditions = h_transport_bcs + heat_transfer_bcs
-
-model.T = F.HeatTransferProblem(
-    transient=False, relative_tolerance=1e-6, absolute_tolerance=1e0
-)
 
 main_folder = "results/phi_heat={:.1e}_phi_part={:.1e}/continuous".format(
     heat_flux_value, part_flux_value
 )
 
-
-derived_quantities = F.DerivedQuantities(
-    [
-        F.TotalVolume(field="retention", volume=1),
-        F.TotalVolume(field="retention", volume=2),
-        F.TotalVolume(field="retention", volume=3),
-    ],
-    filename=main_folder + "/derived_quantities.csv",
-)
-
-model.exports = F.Exports(
-    [
-        F.XDMFExport(
-            "solute",
-            filename=main_folder + "/mobile_concentration.xdmf",
-            checkpoint=False,
-        ),
-        F.XDMFExport(
-            "retention",
-            filename=main_folder + "/retention.xdmf",
-            checkpoint=False,
-        ),
-        F.XDMFExport("T", filename=main_folder + "/temperature.xdmf", checkpoint=False),
-        derived_quantities,
-    ]
-)
-
-model.initialise()
-model.run()
+if __name__ == "__main__":
+    model = build_monoblock_model()
+    setup_continuous(
+        model,
+        nb_cycles * (rampup + plateau + rampdown),
+        heat_flux_value,
+        part_flux_value,
+    )
+    if pin_inactive_traps:
+        restrict_traps(model)
+    model.exports = make_exports(main_folder)
+    model.initialise()
+    # python continuous.py --resume continues from the latest checkpoint, eg.
+    # after increasing nb_cycles
+    if "--resume" in sys.argv:
+        resume(model, main_folder + "/checkpoints")
+    # python continuous.py --profile writes a per-step trace and its summary
+    profiler = None
+    if "--profile" in sys.argv:
+        profiler = StepProfiler(main_folder + "/profile.jsonl")
+        profiler.attach(model)
+    run_with_checkpoints(model, main_folder + "/checkpoints")
+    if profiler is not None:
+        profiler.close()
+        print_summary(summarise(read_trace(profiler.filename)))
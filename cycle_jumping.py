@@ -0,0 +1,294 @@
+"""Cycle jumping for long cycling campaigns.
+
+A few cycles of the cycling.py scenario are simulated, then the trapped
+concentrations are extrapolated over several cycles from the per-cycle
+increments, assuming these increments decay as a power law of the number of
+cycles (as the inventory does, see plot_inventory.py). A correction cycle is
+then simulated and compared with the prediction: the number of jumped cycles
+is doubled if the prediction was accurate and halved otherwise. The
+extrapolated concentrations are clipped to [0, trap density].
+
+Since the boundary conditions are periodic, each cycle is simulated from
+t = 0 to t = cycle_length with the same model.
+"""
+import logging
+import os
+
+import fenics as f
+import numpy as np
+
+from main import build_monoblock_model
+from cycling import setup_cycling, schedule, heat_flux_value, part_flux_value
+from derived_quantities_reader import read_derived_quantities
+from heat_transfer import QuasiStaticHeatTransferProblem
+from restricted_traps import material_ids
+
+logger = logging.getLogger(__name__)
+
+nb_cycles_total = 1000
+nb_cycles_jump_max = 64
+jump_tolerance = 0.05
+
+reference_folder = "results/phi_heat={:.1e}_phi_part={:.1e}/cycling".format(
+    heat_flux_value, part_flux_value
+)
+reference_tolerance = 0.05
+
+
+def simulate_cycle(model, schedule):
+    """Simulates one cycle from t = 0 to t = schedule.cycle_length
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        schedule (CycleSchedule): the cycle schedule
+    """
+    if model.dt.stepsizes_restart is None:
+        dt = min(float(model.dt.value), model.dt.stepsizes_max["rampup"])
+    else:
+        dt = model.dt.stepsizes_restart["rampup"]
+    model.dt.value.assign(dt)
+    model.t = 0
+    # its frozen phases are keyed on the time of the previous step
+    if isinstance(model.T, QuasiStaticHeatTransferProblem):
+        model.T.reset()
+    while model.t < schedule.cycle_length and not np.isclose(
+        model.t, schedule.cycle_length, atol=0
+    ):
+        model.iterate()
+
+
+def get_inventories(model):
+    """Computes the retention inventory in each material
+
+    Args:
+        model (FESTIM.Simulation): the model
+
+    Returns:
+        list: the inventories (H/m2)
+    """
+    retention = sum(f.split(model.h_transport_problem.u))
+    return [
+        f.assemble(retention * model.mesh.dx(material.id))
+        for material in model.materials.materials
+    ]
+
+
+def get_trap_dofs(model):
+    """Returns the dofs of the trapped concentrations in
+    model.h_transport_problem.u
+
+    Args:
+        model (FESTIM.Simulation): the model
+
+    Returns:
+        numpy.ndarray: the dofs
+    """
+    V = model.h_transport_problem.V
+    return np.concatenate(
+        [V.sub(i).dofmap().dofs() for i in range(1, V.num_sub_spaces())]
+    )
+
+
+def get_trap_densities(model, trap_dofs):
+    """Returns the density of the trap of each trapped concentration dof, 0
+    outside of the trap materials
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        trap_dofs (numpy.ndarray): the dofs (see get_trap_dofs)
+
+    Returns:
+        numpy.ndarray: the densities (m-3)
+    """
+    V = model.h_transport_problem.V
+    mesh = V.mesh()
+    markers = model.mesh.volume_markers.array()
+    densities = np.zeros(V.dim())
+    for i, trap in enumerate(model.traps.traps):
+        dofmap = V.sub(i + 1).dofmap()
+        for j, material in enumerate(trap.materials):
+            # one density for all the materials or one per material
+            density = trap.density[j if len(trap.density) > 1 else 0]
+            for cell in np.flatnonzero(np.isin(markers, material_ids(material))):
+                x = f.Cell(mesh, cell).midpoint().x()
+                densities[dofmap.cell_dofs(cell)] = density(x)
+    return densities[trap_dofs]
+
+
+def extrapolation_factor(cycle, nb_cycles, exponent):
+    """Sum of the next nb_cycles increments relative to the increment of
+    cycle, assuming increments scale as cycle**exponent
+
+    Args:
+        cycle (int): the cycle of the last known increment
+        nb_cycles (int): the number of jumped cycles
+        exponent (float): the exponent of the power law
+
+    Returns:
+        float: the extrapolation factor
+    """
+    next_cycles = np.arange(cycle + 1, cycle + nb_cycles + 1)
+    return np.sum((next_cycles / cycle) ** exponent)
+
+
+def power_law_exponent(cycle_a, increment_a, cycle_b, increment_b):
+    """Exponent of the power law going through two increments. Limited to
+    [-2, 0] so that the increments never grow.
+
+    Returns:
+        float: the exponent
+    """
+    if increment_a <= 0 or increment_b <= 0:
+        return 0
+    exponent = np.log(increment_b / increment_a) / np.log(cycle_b / cycle_a)
+    return min(max(exponent, -2), 0)
+
+
+def run_cycle_jumping(model, schedule, nb_cycles_total):
+    """Runs nb_cycles_total cycles, jumping over some of them
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        schedule (CycleSchedule): the cycle schedule
+        nb_cycles_total (int): the total number of cycles
+
+    Returns:
+        numpy.ndarray: one row per computed cycle end (cycle, t, inventory in
+            each material, 1 if simulated 0 if extrapolated)
+    """
+    u = model.h_transport_problem.u
+    u_n = model.h_transport_problem.u_n
+    trap_dofs = get_trap_dofs(model)
+    trap_densities = get_trap_densities(model, trap_dofs)
+    model.settings.final_time = schedule.cycle_length
+    model.timer = f.Timer()
+
+    rows = []
+
+    def simulate(cycle):
+        """Simulates the cycle following cycle and returns its index, the
+        increment of the trapped concentrations and of the inventory"""
+        previous_state = u.vector().get_local()[trap_dofs]
+        previous_inventory = sum(get_inventories(model))
+        simulate_cycle(model, schedule)
+        inventories = get_inventories(model)
+        rows.append([cycle + 1, (cycle + 1) * schedule.cycle_length, *inventories, 1])
+        increment = u.vector().get_local()[trap_dofs] - previous_state
+        return cycle + 1, increment, sum(inventories) - previous_inventory
+
+    # spin-up: two consecutive cycles give a first estimate of the exponent
+    cycle_a, _, increment_a = simulate(0)
+    cycle_b, increment, increment_b = simulate(cycle_a)
+    exponent = power_law_exponent(cycle_a, increment_a, cycle_b, increment_b)
+    nb_jump = 1
+
+    while cycle_b < nb_cycles_total:
+        # keep two cycles to simulate after the jump
+        nb_jump = min(nb_jump, nb_cycles_total - cycle_b - 2)
+        state_error = 0
+        if nb_jump > 0:
+            factor = extrapolation_factor(cycle_b, nb_jump, exponent)
+            inventory = sum(get_inventories(model))
+            state = u.vector().get_local()
+            state[trap_dofs] = np.clip(
+                state[trap_dofs] + factor * increment, 0, trap_densities
+            )
+            u.vector().set_local(state)
+            u.vector().apply("insert")
+            u_n.assign(u)
+            cycle = cycle_b + nb_jump
+            inventories = get_inventories(model)
+            rows.append([cycle, cycle * schedule.cycle_length, *inventories, 0])
+            jumped = sum(inventories) - inventory
+            # let the mobile concentration relax before measuring the
+            # increment, and compare the extrapolated state with the
+            # simulated one
+            predicted = (
+                sum(inventories) + increment_b * ((cycle + 1) / cycle_b) ** exponent
+            )
+            cycle, _, _ = simulate(cycle)
+            simulated = sum(rows[-1][2:-1])
+            state_error = abs(simulated - predicted) / max(abs(jumped), 1e-30)
+        else:
+            nb_jump = 0
+            cycle = cycle_b
+        cycle, increment, new_increment = simulate(cycle)
+
+        # accuracy of the power law prediction on the correction cycle
+        predicted = increment_b * (cycle / cycle_b) ** exponent
+        error = abs(new_increment - predicted) / max(abs(new_increment), 1e-30)
+        error = max(error, state_error)
+        if error > jump_tolerance:
+            nb_jump = nb_jump // 2
+        else:
+            nb_jump = min(max(2 * nb_jump, 1), nb_cycles_jump_max)
+
+        exponent = power_law_exponent(cycle_b, increment_b, cycle, new_increment)
+        cycle_b, increment_b = cycle, new_increment
+        logger.info(
+            "cycle %d/%d, next jump: %d cycles, prediction error: %.1e",
+            cycle,
+            nb_cycles_total,
+            nb_jump,
+            error,
+        )
+
+    return np.array(rows)
+
+
+def compare_to_brute_force(rows, folder, tolerance):
+    """Compares the end of cycle inventories with a brute force run
+
+    Args:
+        rows (numpy.ndarray): output of run_cycle_jumping
+        folder (str): results folder of the brute force run
+        tolerance (float): maximum relative error
+
+    Returns:
+        bool: True if the relative error is below tolerance at all the
+            cycles covered by the brute force run
+    """
+    data = read_derived_quantities(folder)
+    inventory = sum([data["Total_retention_volume_{}".format(i)] for i in [1, 2, 3]])
+    rows = rows[rows[:, 1] <= data["ts"][-1]]
+    reference = np.interp(rows[:, 1], data["ts"], inventory)
+    errors = np.abs(rows[:, 2:-1].sum(axis=1) - reference) / reference
+    logger.info(
+        "{:>8}{:>16}{:>16}{:>12}".format("cycle", "inventory", "reference", "error")
+    )
+    for row, ref, error in zip(rows, reference, errors):
+        logger.info(
+            "{:>8.0f}{:>16.3e}{:>16.3e}{:>12.2e}".format(
+                row[0], row[2:-1].sum(), ref, error
+            )
+        )
+    return bool(np.all(errors < tolerance))
+
+
+if __name__ == "__main__":
+    model = build_monoblock_model()
+    setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+    model.log_level = 20
+    logging.basicConfig(level=model.log_level, format="%(message)s")
+    model.initialise()
+    rows = run_cycle_jumping(model, schedule, nb_cycles_total)
+
+    main_folder = "results/phi_heat={:.1e}_phi_part={:.1e}/cycle_jumping".format(
+        heat_flux_value, part_flux_value
+    )
+    os.makedirs(main_folder, exist_ok=True)
+    np.savetxt(
+        main_folder + "/inventory_per_cycle.csv",
+        rows,
+        delimiter=",",
+        header="cycle,t(s),Total retention volume 1,Total retention volume 2,"
+        + "Total retention volume 3,simulated",
+        comments="",
+    )
+    logger.info("%.0f cycles simulated out of %d", rows[:, -1].sum(), nb_cycles_total)
+
+    if os.path.exists(reference_folder):
+        if compare_to_brute_force(rows, reference_folder, reference_tolerance):
+            logger.info("Agreement with brute force run within tolerance")
+        else:
+            logger.warning("Disagreement with brute force run above tolerance")
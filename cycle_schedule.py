@@ -0,0 +1,246 @@
+import numpy as np
+
+PHASES = ["rampup", "plateau", "rampdown", "rest"]
+
+# durations of the phases of the cycling scenarios (s)
+default_timing = {"rampup": 100, "plateau": 400, "rampdown": 100, "rest": 1000}
+
+
+class CycleSchedule:
+    """Phase boundaries of nb_cycles identical rampup/plateau/rampdown/rest
+    cycles.
+
+    The boundaries are computed once and shared by the stepsize, the
+    boundary conditions and the post-processing, so the phase of a given
+    time is found in constant time.
+
+    Attributes:
+        durations (numpy.ndarray): durations of the four phases (s)
+        phase_starts (numpy.ndarray): beginning of each phase relative to
+            the beginning of the cycle (s)
+        phase_ends (numpy.ndarray): end of each phase relative to the
+            beginning of the cycle (s)
+        cycle_length (float): duration of one cycle (s)
+        final_time (float): end of the last cycle (s)
+        t_data (numpy.ndarray): all the phase boundaries, from 0 to
+            final_time (s)
+    """
+
+    def __init__(self, rampup, plateau, rampdown, rest, nb_cycles) -> None:
+        """Inits CycleSchedule
+
+        Args:
+            rampup (float): duration of the ramp-up (s)
+            plateau (float): duration of the plateau (s)
+            rampdown (float): duration of the ramp-down (s)
+            rest (float): duration of the rest (s)
+            nb_cycles (int): number of cycles
+        """
+        self.rampup = rampup
+        self.plateau = plateau
+        self.rampdown = rampdown
+        self.rest = rest
+        self.nb_cycles = nb_cycles
+
+        self.durations = np.array([rampup, plateau, rampdown, rest], dtype=float)
+        self.phase_ends = np.cumsum(self.durations)
+        self.phase_starts = np.concatenate([[0], self.phase_ends[:-1]])
+        self.cycle_length = rampup + plateau + rampdown + rest
+        self.final_time = nb_cycles * self.cycle_length
+        self.t_data = self.make_t_data()
+
+    def make_t_data(self):
+        """Computes the phase boundaries of all the cycles
+
+        Returns:
+            numpy.ndarray: the 4 * nb_cycles + 1 phase boundaries (s)
+        """
+        cycle_starts = np.arange(self.nb_cycles) * self.cycle_length
+        data_t = (cycle_starts[:, None] + self.phase_starts).ravel()
+        return np.append(data_t, data_t[-1] + self.rest)
+
+    def make_data_y(self, data_y):
+        """Repeats the values at the beginning of each phase for every cycle
+
+        Args:
+            data_y (list): the 4 values at the beginning of rampup, plateau,
+                rampdown and rest
+
+        Returns:
+            numpy.ndarray: the values at each of self.t_data
+        """
+        assert len(data_y) == 4
+        return np.append(np.tile(data_y, self.nb_cycles), data_y[-1])
+
+    def cycle(self, t):
+        """Returns the index of the cycle at time t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            int: the cycle index (starts at 0)
+        """
+        return int(t // self.cycle_length)
+
+    def phase_index(self, t):
+        """Returns the index of the phase at time t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            int: 0 for rampup, 1 for plateau, 2 for rampdown, 3 for rest
+        """
+        boundary = (t // self.cycle_length) * self.cycle_length
+        for i in range(3):
+            boundary = boundary + self.durations[i]
+            if t < boundary:
+                return i
+        return 3
+
+    def phase(self, t):
+        """Returns the name of the phase at time t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            str: "rampup", "plateau", "rampdown" or "rest"
+        """
+        return PHASES[self.phase_index(t)]
+
+    def next_boundary(self, t):
+        """Returns the first phase boundary strictly after t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            float: the time of the next phase boundary (s)
+        """
+        beginning_cycle = (t // self.cycle_length) * self.cycle_length
+        return beginning_cycle + self.phase_ends[self.phase_index(t)]
+
+    def previous_boundary(self, t):
+        """Returns the last phase boundary before or at t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            float: the time of the previous phase boundary (s)
+        """
+        beginning_cycle = (t // self.cycle_length) * self.cycle_length
+        return beginning_cycle + self.phase_starts[self.phase_index(t)]
+
+    def time_to_next_boundary(self, t):
+        """Returns the time left before the next phase boundary
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            float: the time to the next phase boundary (s)
+        """
+        return self.next_boundary(t) - t
+
+    def phase_ending_at(self, t, tolerance=0):
+        """Finds the phase ending at t (within tolerance)
+
+        Args:
+            t (float): the time (s)
+            tolerance (float, optional): absolute tolerance (s). Defaults
+                to 0.
+
+        Returns:
+            tuple or None: (cycle index, phase index) of the phase ending at
+                t, None if t isn't on a phase boundary
+        """
+        if self.next_boundary(t) - t <= tolerance:
+            return self.cycle(t), self.phase_index(t)
+        if 0 < t and t - self.previous_boundary(t) <= tolerance:
+            phase_index = self.phase_index(t)
+            if phase_index == 0:
+                return self.cycle(t) - 1, 3
+            return self.cycle(t), phase_index - 1
+        return None
+
+    def phase_indices(self, t):
+        """Vectorised version of phase_index
+
+        Args:
+            t (numpy.ndarray): the times (s)
+
+        Returns:
+            numpy.ndarray: the phase indices
+        """
+        t = np.asarray(t, dtype=float)
+        t_in_cycle = t - (t // self.cycle_length) * self.cycle_length
+        indices = np.searchsorted(self.phase_ends, t_in_cycle, side="right")
+        return np.minimum(indices, 3)
+
+    def phases(self, t):
+        """Vectorised version of phase
+
+        Args:
+            t (numpy.ndarray): the times (s)
+
+        Returns:
+            numpy.ndarray: the phase names
+        """
+        return np.array(PHASES)[self.phase_indices(t)]
+
+    def next_boundaries(self, t):
+        """Vectorised version of next_boundary
+
+        Args:
+            t (numpy.ndarray): the times (s)
+
+        Returns:
+            numpy.ndarray: the times of the next phase boundaries (s)
+        """
+        t = np.asarray(t, dtype=float)
+        beginning_cycle = (t // self.cycle_length) * self.cycle_length
+        return beginning_cycle + self.phase_ends[self.phase_indices(t)]
+
+    def interpolate(self, data_y, t):
+        """Evaluates the piecewise linear cycling profile at times t
+
+        Args:
+            data_y (list): the 4 values at the beginning of rampup, plateau,
+                rampdown and rest
+            t (numpy.ndarray): the times (s)
+
+        Returns:
+            numpy.ndarray: the profile values
+        """
+        return np.interp(t, self.t_data, self.make_data_y(data_y))
+
+    def integrate(self, data_y, t):
+        """Integrates the piecewise linear cycling profile from 0 to t. The
+        profile being linear between the phase boundaries, the trapezoidal
+        rule is exact.
+
+        Args:
+            data_y (list): the 4 values at the beginning of rampup, plateau,
+                rampdown and rest
+            t (numpy.ndarray): the times (s)
+
+        Returns:
+            numpy.ndarray: the integrals (eg. the fluence if data_y is the
+                particle flux)
+        """
+        t = np.asarray(t, dtype=float)
+        y = self.make_data_y(data_y)
+        integral_nodes = np.concatenate(
+            [[0], np.cumsum(np.diff(self.t_data) * (y[1:] + y[:-1]) / 2)]
+        )
+        indices = np.clip(
+            np.searchsorted(self.t_data, t, side="right") - 1, 0, len(self.t_data) - 1
+        )
+        y_t = np.interp(t, self.t_data, y)
+        return (
+            integral_nodes[indices]
+            + (t - self.t_data[indices]) * (y[indices] + y_t) / 2
+        )
@@ -1,7 +1,25 @@
-from main import model, tungsten, recombination_flux_coolant, convection_flux
+import logging
+import sys
 
+from main import (
+    build_monoblock_model,
+    make_coolant_boundary_conditions,
+    tungsten_parameters,
+)
+from model_parameters import implantation_depth, initial_temperature
+
+from cycle_schedule import CycleSchedule
 from cycling_stepsize import CyclingStepsize
 from fluxes import CyclingFlux, CyclingImplantationDirichlet
+from heat_transfer import QuasiStaticHeatTransferProblem
+from temperature_library import use_temperature_library
+from restricted_traps import restrict_traps
+from adaptive_mesh import run_adaptive
+from thinned_exports import ThinnedXDMFExport
+from checkpoint import resume, run_with_checkpoints
+from inventory_monitor import InventoryMonitor
+from profiling import StepProfiler, print_summary, read_trace, summarise
+from streaming_derived_quantities import StreamingDerivedQuantities
 
 import FESTIM as F
 
@@ -14,90 +32,234 @@ rest = 1000
 heat_flux_value = 5e6
 part_flux_value = 5e21
 
-model.settings = F.Settings(
-    absolute_tolerance=1e10,
-    relative_tolerance=1e-10,
-    final_time=nb_cycles * (rampup + plateau + rampdown + rest),
-    chemical_pot=False,
-    traps_element_type="DG",
-)
+# convergence criteria of the InventoryMonitor (see inventory_monitor.py),
+# None to run all the cycles. Eg. with spike_ratio_threshold = 0.1, the run
+# stops once the spike is below 10% of the inventory
+spike_ratio_threshold = None
+growth_rate_threshold = None
 
-model.dt = CyclingStepsize(
-    rampup=rampup,
-    plateau=plateau,
-    rampdown=rampdown,
-    rest=rest,
-    nb_cycles=nb_cycles,
-    stepsizes_max={"rampup": 5, "plateau": 20, "rampdown": 5, "rest": 50},
-    initial_value=0.1,
-    stepsize_change_ratio=1.1,
-    dt_min=0.1,
-)
+# if True, T is read from (or solved once and stored in) the temperature
+# library instead of being solved with the H transport. The interpolation
+# in time of the stored fields changes the inventory slightly: off by
+# default, turn it on for sweeps where the particle flux is varied.
+temperature_from_library = False
 
-h_implantation = CyclingImplantationDirichlet(
-    surfaces=1,
-    phi=part_flux_value,
-    R_p=9.52e-10,
-    D_0=tungsten.D_0,
-    E_D=tungsten.E_D,
-    data_y=[0, part_flux_value, part_flux_value, 0],
-    rampup=rampup,
-    plateau=plateau,
-    rampdown=rampdown,
-    rest=rest,
-    nb_cycles=nb_cycles,
-)
+# if True, the trap unknowns outside the trap materials are pinned (see
+# restricted_traps.py). The Newton system keeps its size, so this saves
+# neither time nor memory: off by default
+pin_inactive_traps = False
 
-heat_flux = CyclingFlux(
-    surfaces=1,
-    field="T",
-    data_y=[0, heat_flux_value, heat_flux_value, 0],
-    rampup=rampup,
-    plateau=plateau,
-    rampdown=rampdown,
-    rest=rest,
-    nb_cycles=nb_cycles,
-)
+# if True, the factorised Jacobian is kept across steps of a phase
+# (modified Newton, with the solver of restricted_traps.py). The extra
+# Newton iterations make CyclingStepsize grow dt less often, so the
+# stepping and the results differ from the default Newton method: off by
+# default
+reuse_jacobian = False
+
+# python cycling.py --adaptive adapts the mesh to the fronts at the end of
+# each phase (see adaptive_mesh.py)
+adaptive = "--adaptive" in sys.argv
+
+
+def setup_cycling(model, schedule, heat_flux_value, part_flux_value):
+    """Sets the settings, stepsize, boundary conditions and temperature of
+    the model for a cycling scenario
+
+    Args:
+        model (FESTIM.Simulation): the model
+        schedule (CycleSchedule): the cycle schedule
+        heat_flux_value (float): heat flux during the plateau (W/m2)
+        part_flux_value (float): particle flux during the plateau (H/m2/s)
+    """
+    model.settings = F.Settings(
+        absolute_tolerance=1e10,
+        relative_tolerance=1e-10,
+        final_time=schedule.final_time,
+        chemical_pot=False,
+        traps_element_type="DG",
+    )
+
+    model.dt = CyclingStepsize(
+        schedule=schedule,
+        stepsizes_max={"rampup": 5, "plateau": 20, "rampdown": 5, "rest": 50},
+        stepsizes_restart={"rampup": 0.5, "plateau": 2, "rampdown": 0.5, "rest": 2},
+        initial_value=0.1,
+        stepsize_change_ratio=1.1,
+        dt_min=0.1,
+    )
+    # no-op unless error_relative_tolerance is set
+    model.dt.attach(model)
+
+    h_implantation = CyclingImplantationDirichlet(
+        surfaces=1,
+        phi=part_flux_value,
+        R_p=implantation_depth,
+        D_0=tungsten_parameters["D_0"],
+        E_D=tungsten_parameters["E_D"],
+        data_y=[0, part_flux_value, part_flux_value, 0],
+        schedule=schedule,
+    )
+
+    heat_flux = CyclingFlux(
+        surfaces=1,
+        field="T",
+        data_y=[0, heat_flux_value, heat_flux_value, 0],
+        schedule=schedule,
+    )
+
+    recombination_flux_coolant, convection_flux = make_coolant_boundary_conditions()
+    h_transport_bcs = [h_implantation, recombination_flux_coolant]
+    heat_transfer_bcs = [heat_flux, convection_flux]
+
+    model.boundary_conditions = h_transport_bcs + heat_transfer_bcs
 
+    # T is frozen once steady during the plateau and the rest
+    model.T = QuasiStaticHeatTransferProblem(
+        schedule,
+        steady_tolerance=1e-6,
+        transient=True,
+        initial_value=initial_temperature,
+        relative_tolerance=1e-6,
+        absolute_tolerance=1e0,
+    )
 
-h_transport_bcs = [h_implantation, recombination_flux_coolant]
-heat_transfer_bcs = [heat_flux, convection_flux]
 
+def make_exports(main_folder, schedule, csv=False):
+    """Creates the exports of a cycling run. The fields are exported at the
+    end of each plateau and rest, the derived quantities are streamed to
+    derived_quantities.bin.
 
-model.boundary_conditions = h_transport_bcs + heat_transfer_bcs
+    Args:
+        main_folder (str): the results folder
+        schedule (CycleSchedule): the cycle schedule
+        csv (bool, optional): if True, the derived quantities are also
+            written to derived_quantities.csv. Defaults to False.
 
-model.T = F.HeatTransferProblem(
-    transient=True, initial_value=323, relative_tolerance=1e-6, absolute_tolerance=1e0
+    Returns:
+        FESTIM.Exports: the exports
+    """
+    derived_quantities = StreamingDerivedQuantities(
+        [
+            F.TotalVolume(field="retention", volume=1),
+            F.TotalVolume(field="retention", volume=2),
+            F.TotalVolume(field="retention", volume=3),
+        ],
+        filename=main_folder + "/derived_quantities.bin",
+        csv_filename=main_folder + "/derived_quantities.csv" if csv else None,
+        nb_iterations_between_exports=10,
+    )
+
+    return F.Exports(
+        [
+            ThinnedXDMFExport(
+                "solute",
+                schedule,
+                filename=main_folder + "/mobile_concentration.xdmf",
+                checkpoint=False,
+            ),
+            ThinnedXDMFExport(
+                "retention",
+                schedule,
+                filename=main_folder + "/retention.xdmf",
+                checkpoint=False,
+            ),
+            ThinnedXDMFExport(
+                "T",
+                schedule,
+                filename=main_folder + "/temperature.xdmf",
+                checkpoint=False,
+            ),
+            derived_quantities,
+        ]
+    )
+
+
+schedule = CycleSchedule(
+    rampup=rampup, plateau=plateau, rampdown=rampdown, rest=rest, nb_cycles=nb_cycles
 )
+
 main_folder = "results/phi_heat={:.1e}_phi_part={:.1e}/cycling".format(
     heat_flux_value, part_flux_value
 )
-derived_quantities = F.DerivedQuantities(
-    [
-        F.TotalVolume(field="retention", volume=1),
-        F.TotalVolume(field="retention", volume=2),
-        F.TotalVolume(field="retention", volume=3),
-    ],
-    filename=main_folder + "/derived_quantities.csv",
-    nb_iterations_between_exports=10,
-)
 
-model.exports = F.Exports(
-    [
-        F.XDMFExport(
-            "solute",
-            filename=main_folder + "/mobile_concentration.xdmf",
-            checkpoint=False,
-        ),
-        F.XDMFExport(
-            "retention",
-            filename=main_folder + "/retention.xdmf",
-            checkpoint=False,
-        ),
-        F.XDMFExport("T", filename=main_folder + "/temperature.xdmf", checkpoint=False),
-        derived_quantities,
-    ]
-)
-model.log_level = 20
-model.initialise()
-model.run()
+
+def make_model(mesh=None):
+    """Builds and sets up the cycling model (not initialised)
+
+    Args:
+        mesh (FESTIM.Mesh1D, optional): the mesh. Defaults to the mesh of
+            main.py.
+
+    Returns:
+        F.Simulation: the model
+    """
+    model = (
+        build_monoblock_model() if mesh is None else build_monoblock_model(mesh=mesh)
+    )
+    setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+    # the library is keyed on the mesh, adaptive runs solve T
+    if temperature_from_library and not adaptive:
+        use_temperature_library(model, schedule)
+    return model
+
+
+if __name__ == "__main__":
+    model = make_model()
+    restricted = None
+    if pin_inactive_traps or reuse_jacobian:
+        restricted = restrict_traps(model, reuse_jacobian=reuse_jacobian)
+    model.exports = make_exports(main_folder, schedule)
+    model.log_level = 20
+    logging.basicConfig(level=model.log_level, format="%(message)s")
+    model.initialise()
+    monitor = InventoryMonitor(
+        schedule,
+        spike_ratio_threshold=spike_ratio_threshold,
+        growth_rate_threshold=growth_rate_threshold,
+    )
+    # python cycling.py --resume continues from the latest checkpoint, eg.
+    # after increasing nb_cycles
+    if "--resume" in sys.argv:
+        resume(model, main_folder + "/checkpoints", monitor)
+    # python cycling.py --profile writes a per-step trace and its summary
+    profiler = None
+    if "--profile" in sys.argv:
+        profiler = StepProfiler(main_folder + "/profile.jsonl", schedule)
+        profiler.attach(model)
+    if adaptive:
+
+        def make_adapted_model(mesh):
+            model = make_model(mesh)
+            adapted = None
+            if restricted is not None:
+                adapted = restrict_traps(model, reuse_jacobian=reuse_jacobian)
+            model.log_level = 20
+            initialise = model.initialise
+
+            def initialise_and_carry_over():
+                # the solver statistics and the profiler follow the remeshed
+                # models
+                initialise()
+                if adapted is not None:
+                    adapted["solver"].carry_over_statistics(restricted["solver"])
+                    restricted["solver"] = adapted["solver"]
+                if profiler is not None:
+                    profiler.attach(model)
+
+            model.initialise = initialise_and_carry_over
+            return model
+
+        run_adaptive(model, make_adapted_model, schedule, monitor=monitor)
+    else:
+        run_with_checkpoints(model, main_folder + "/checkpoints", monitor=monitor)
+    if restricted is not None:
+        print(
+            "{nb_factorisations} factorisations, {nb_reused} reused, "
+            "{time_saved:.1f} s saved (estimate)".format(
+                **restricted["solver"].statistics()
+            )
+        )
+    monitor.write(main_folder + "/monitor.json")
+    if profiler is not None:
+        profiler.close()
+        print_summary(summarise(read_trace(profiler.filename)))
@@ -1,17 +1,151 @@
 from FESTIM import Stepsize
+import fenics as f
+
+from cycle_schedule import CycleSchedule
 
 
 class CyclingStepsize(Stepsize):
     def __init__(
-        self, rampup, plateau, rampdown, rest, nb_cycles, stepsizes_max, **kwargs
+        self,
+        schedule,
+        stepsizes_max,
+        stepsizes_restart=None,
+        error_relative_tolerance=None,
+        error_absolute_tolerance=0.0,
+        **kwargs
     ) -> None:
+        """Inits CyclingStepsize
+
+        Args:
+            schedule (CycleSchedule): the cycle schedule
+            stepsizes_max (dict): maximum stepsize for each phase
+                {"rampup": ..., "plateau": ..., "rampdown": ..., "rest": ...}
+            stepsizes_restart (dict, optional): stepsize at the beginning of
+                each phase (same keys as stepsizes_max). If given, the steps
+                are clipped to end exactly on the phase boundaries and the
+                stepsize restarts from these values at each boundary.
+                Defaults to None.
+            error_relative_tolerance (float, optional): if given, the
+                stepsize is chosen from an estimate of the local truncation
+                error on the retention (comparison with a linear predictor
+                from the two previous steps) instead of the number of Newton
+                iterations, and a step whose error exceeds the tolerance is
+                rejected and recomputed with a smaller stepsize. The
+                stepsizes_max caps still apply. Requires calling attach()
+                before Simulation.initialise(). Defaults to None.
+            error_absolute_tolerance (float, optional): absolute tolerance
+                on the L2 norm of the retention error. Defaults to 0.
+        """
         super().__init__(**kwargs)
-        self.rampup = rampup
-        self.rampdown = rampdown
-        self.plateau = plateau
-        self.rest = rest
-        self.nb_cycles = nb_cycles
+        self.schedule = schedule
         self.stepsizes_max = stepsizes_max
+        self.stepsizes_restart = stepsizes_restart
+        self.breakpoint_tolerance = 1e-9 * schedule.cycle_length
+
+        self.error_relative_tolerance = error_relative_tolerance
+        self.error_absolute_tolerance = error_absolute_tolerance
+        self.nb_history = 0
+        self.rejected = False
+
+        self.nb_steps = 0
+        self.nb_rejected = 0
+
+    def attach(self, model):
+        """Makes the error control part of the initialisation of the model:
+        once initialised, the concentrations are tracked and the steps
+        rejected by adapt_to_error are recomputed (see reject_steps). Must
+        be called before Simulation.initialise(), does nothing without
+        error_relative_tolerance.
+
+        Args:
+            model (FESTIM.Simulation): the model using this stepsize
+        """
+        if self.error_relative_tolerance is None:
+            return
+        initialise = model.initialise
+
+        def initialise_and_track():
+            initialise()
+            self.track(model.h_transport_problem)
+            self.reject_steps(model)
+
+        model.initialise = initialise_and_track
+
+    def track(self, h_transport_problem):
+        """Attaches the concentrations to the stepsize so that the error on
+        retention can be estimated. Called by attach() after
+        Simulation.initialise()
+
+        Args:
+            h_transport_problem (FESTIM.HTransportProblem): the hydrogen
+                transport problem of the simulation
+        """
+        u = h_transport_problem.u
+        V = u.function_space()
+        self.u = u
+        self.u_n = f.Function(V)
+        self.u_n.assign(h_transport_problem.u_n)
+        self.u_nm1 = f.Function(V)
+        self.error = f.Function(V)
+        self.previous_dt = None
+        self.nb_history = 1
+
+        if V.num_sub_spaces() == 0:
+            retention, retention_error = u, self.error
+        else:
+            retention = sum(f.split(u))
+            retention_error = sum(f.split(self.error))
+        dx = f.dx(domain=V.mesh())
+        self.retention_form = retention**2 * dx
+        self.error_form = retention_error**2 * dx
+
+    def reject_steps(self, model):
+        """Recomputes the steps rejected by adapt_to_error: the solution,
+        the temperature and the time are restored to the end of the previous
+        step, which is taken again with the reduced stepsize
+
+        Args:
+            model (FESTIM.Simulation): the initialised model
+        """
+        problem = model.h_transport_problem
+        T_problem = model.T
+        update, T_update = problem.update, T_problem.update
+        T_fields = [
+            getattr(T_problem, name)
+            for name in ["T", "T_n"]
+            if isinstance(getattr(T_problem, name, None), f.Function)
+        ]
+        # state of QuasiStaticHeatTransferProblem
+        T_attributes = [name for name in ["t", "frozen"] if hasattr(T_problem, name)]
+        T_saved = {}
+
+        def save_and_update_T(t):
+            # Simulation.iterate updates T before the hydrogen transport
+            T_saved["fields"] = [T.vector().get_local() for T in T_fields]
+            T_saved["attributes"] = {
+                name: getattr(T_problem, name) for name in T_attributes
+            }
+            T_update(t)
+
+        def update_or_reject(t, dt):
+            t_n = t - float(dt.value)
+            while True:
+                update(t, dt)
+                if not self.rejected:
+                    return
+                problem.u.assign(self.u_n)
+                problem.u_n.assign(self.u_n)
+                for T, values in zip(T_fields, T_saved["fields"]):
+                    T.vector().set_local(values)
+                    T.vector().apply("insert")
+                for name, value in T_saved["attributes"].items():
+                    setattr(T_problem, name, value)
+                t = t_n + float(dt.value)
+                model.t = t
+                T_problem.update(t)
+
+        T_problem.update = save_and_update_T
+        problem.update = update_or_reject
 
     def adapt(self, t, nb_it, converged):
         """Changes the stepsize based on convergence.
@@ -25,55 +159,138 @@ class CyclingStepsize(Stepsize):
         dt_min = self.adaptive_stepsize["dt_min"]
         stepsize_stop_max = self.adaptive_stepsize["stepsize_stop_max"]
         # t_stop = self.adaptive_stepsize["t_stop"]
+        self.rejected = False
+        if converged:
+            self.nb_steps += 1
+        else:
+            self.nb_rejected += 1
         if not converged:
             self.value.assign(float(self.value) / change_ratio)
             if float(self.value) < dt_min:
                 raise ValueError("stepsize reached minimal value")
-        if nb_it < 5:
+        if self.error_relative_tolerance is not None and converged:
+            self.adapt_to_error(change_ratio)
+            if self.rejected:
+                self.nb_steps -= 1
+                self.nb_rejected += 1
+                if float(self.value) < dt_min:
+                    raise ValueError("stepsize reached minimal value")
+                # the step is taken again from the previous time (see
+                # reject_steps), a shorter one can't cross a phase boundary
+                return
+        elif nb_it < 5:
             self.value.assign(float(self.value) * change_ratio)
         else:
             self.value.assign(float(self.value) / change_ratio)
 
-        if self.during_rampup(t) and float(self.value) > self.stepsizes_max["rampup"]:
-            self.value.assign(self.stepsizes_max["rampup"])
-        if self.during_plateau(t) and float(self.value) > self.stepsizes_max["plateau"]:
-            self.value.assign(self.stepsizes_max["plateau"])
-        if (
-            self.during_rampdown(t)
-            and float(self.value) > self.stepsizes_max["rampdown"]
-        ):
-            self.value.assign(self.stepsizes_max["rampdown"])
-        if self.during_rest(t) and float(self.value) > self.stepsizes_max["rest"]:
-            self.value.assign(self.stepsizes_max["rest"])
+        if self.stepsizes_restart is None:
+            stepsize_max = self.stepsizes_max[self.schedule.phase(t)]
+            if float(self.value) > stepsize_max:
+                self.value.assign(stepsize_max)
+        else:
+            self.clip_to_breakpoints(t, converged)
+
+    def adapt_to_error(self, change_ratio):
+        """Changes the stepsize so that the estimated local truncation error
+        on the retention matches the tolerance. The error of the backward
+        Euler step is estimated from the difference between the solution
+        and a linear extrapolation of the two previous solutions. If it
+        exceeds the tolerance, the step is rejected (rejected is set) and
+        the stepsize reduced.
+
+        Args:
+            change_ratio (float): growth factor used until enough previous
+                solutions are known.
+        """
+        if self.nb_history == 0:
+            raise AttributeError("attach() must be called before initialise()")
+        dt = float(self.value)
+        if self.nb_history < 2:
+            self.value.assign(dt * change_ratio)
+        else:
+            ratio = dt / self.previous_dt
+            error = (
+                self.u.vector().get_local()
+                - (1 + ratio) * self.u_n.vector().get_local()
+                + ratio * self.u_nm1.vector().get_local()
+            )
+            self.error.vector().set_local(dt / (dt + self.previous_dt) * error)
+            self.error.vector().apply("insert")
+
+            error_norm = f.assemble(self.error_form) ** 0.5
+            retention_norm = f.assemble(self.retention_form) ** 0.5
+            tolerance = (
+                self.error_relative_tolerance * retention_norm
+                + self.error_absolute_tolerance
+            )
+            if error_norm == 0:
+                factor = 2
+            else:
+                # local error of backward Euler is O(dt**2)
+                factor = min(max(0.9 * (tolerance / error_norm) ** 0.5, 0.2), 2)
+            self.value.assign(dt * factor)
+            if error_norm > tolerance:
+                self.rejected = True
+                return
+
+        self.u_nm1.assign(self.u_n)
+        self.u_n.assign(self.u)
+        self.previous_dt = dt
+        self.nb_history += 1
+
+    def clip_to_breakpoints(self, t, converged):
+        """Restarts the stepsize if t is on a phase boundary, caps it to the
+        maximum stepsize of the phase and clips it so that the next step ends
+        exactly on the next phase boundary.
+
+        Args:
+            t (float): current time.
+            converged (bool): True if the solver converged, else False.
+        """
+        phase = self.schedule.phase(t)
+        next_boundary = self.schedule.next_boundary(t)
+        on_breakpoint = (
+            t - self.schedule.previous_boundary(t) < self.breakpoint_tolerance
+        )
+        # t can be slightly before the boundary due to round-off errors
+        if next_boundary - t < self.breakpoint_tolerance:
+            phase = self.schedule.phase(next_boundary)
+            next_boundary = self.schedule.next_boundary(next_boundary)
+            on_breakpoint = True
+
+        if on_breakpoint and converged:
+            self.value.assign(self.stepsizes_restart[phase])
+            # the profiles have a kink here, extrapolating across it is wrong
+            self.nb_history = min(self.nb_history, 1)
+
+        stepsize_max = self.stepsizes_max[phase]
+        if float(self.value) > stepsize_max:
+            self.value.assign(stepsize_max)
+
+        time_left = next_boundary - t
+        if float(self.value) >= time_left:
+            self.value.assign(time_left)
+        elif float(self.value) > time_left / 2:
+            # avoid leaving a tiny step before the boundary
+            self.value.assign(time_left / 2)
 
     def during_rampup(self, t):
-        length_cycle = self.rampup + self.plateau + self.rampdown + self.rest
-        current_cycle = t // length_cycle
-        beginning_cycle = current_cycle * length_cycle
-        return beginning_cycle <= t < beginning_cycle + self.rampup
+        return self.schedule.phase(t) == "rampup"
 
     def during_plateau(self, t):
-        length_cycle = self.rampup + self.plateau + self.rampdown + self.rest
-        current_cycle = t // length_cycle
-        beginning_cycle = current_cycle * length_cycle
-        beggining_plateau = beginning_cycle + self.rampup
-        return beggining_plateau <= t < beggining_plateau + self.plateau
+        return self.schedule.phase(t) == "plateau"
 
     def during_rampdown(self, t):
-        length_cycle = self.rampup + self.plateau + self.rampdown + self.rest
-        current_cycle = t // length_cycle
-        beginning_cycle = current_cycle * length_cycle
-        beggining_rampdown = beginning_cycle + self.rampup + self.plateau
-        return beggining_rampdown <= t < beggining_rampdown + self.rampdown
+        return self.schedule.phase(t) == "rampdown"
 
     def during_rest(self, t):
-        return not (
-            self.during_rampup(t) or self.during_plateau(t) or self.during_rampdown(t)
-        )
+        return self.schedule.phase(t) == "rest"
 
 
 if __name__ == "__main__":
-    my_stepsize = CyclingStepsize(2, 10, 3, 50, nb_cycles=2, stepsizes_max=0)
+    my_stepsize = CyclingStepsize(
+        CycleSchedule(2, 10, 3, 50, nb_cycles=2), stepsizes_max=0
+    )
     print(my_stepsize.during_rampup(66))
     print(my_stepsize.during_plateau(70))
     print(my_stepsize.during_rampdown(12))
@@ -0,0 +1,109 @@
+"""Reader of the derived quantities of a results folder.
+
+read_derived_quantities memory-maps the columns of derived_quantities.bin
+(written by StreamingDerivedQuantities: one file of float64 per column,
+derived_quantities.<j>.bin, so reading a quantity is a contiguous read) or
+parses derived_quantities.csv (older results) and returns the columns by
+name, with the same names as numpy.genfromtxt(..., names=True) (eg. "ts",
+"Total_retention_volume_1").
+"""
+
+import json
+import os
+
+import numpy as np
+
+# characters removed from the column titles by numpy.genfromtxt
+deleted_characters = set("""~!@#$%^&*()-=+~\\|]}[{';: /?.>,<""")
+
+
+def column_name(title):
+    """Converts a column title to its numpy.genfromtxt name
+
+    Args:
+        title (str): the column title (eg. "Total retention volume 1")
+
+    Returns:
+        str: the name (eg. "Total_retention_volume_1")
+    """
+    title = title.strip().replace(" ", "_")
+    return "".join(c for c in title if c not in deleted_characters)
+
+
+def header_filename(filename):
+    """Returns the .json file holding the column titles of a binary file"""
+    return os.path.splitext(filename)[0] + ".json"
+
+
+def column_filename(filename, j):
+    """Returns the file of the j-th column of a binary file (eg.
+    derived_quantities.0.bin for the times of derived_quantities.bin)"""
+    return "{}.{}.bin".format(os.path.splitext(filename)[0], j)
+
+
+def binary_exists(filename):
+    """Checks if a binary file was written (its header exists)"""
+    return os.path.exists(header_filename(filename))
+
+
+def count_rows(filename, nb_columns):
+    """Number of complete rows of a binary file, ie. the length of its
+    shortest column (a run killed while writing may leave longer ones)
+
+    Args:
+        filename (str): the binary file
+        nb_columns (int): the number of columns
+
+    Returns:
+        int: the number of rows
+    """
+    return min(
+        os.path.getsize(column_filename(filename, j)) // 8 for j in range(nb_columns)
+    )
+
+
+def read_binary(filename):
+    """Memory-maps the columns of the binary file written by
+    StreamingDerivedQuantities
+
+    Args:
+        filename (str): the binary file
+
+    Returns:
+        list: the columns (numpy.ndarray of nb_rows values)
+    """
+    with open(header_filename(filename)) as file:
+        nb_columns = len(json.load(file)["columns"])
+    nb_rows = count_rows(filename, nb_columns)
+    if nb_rows == 0:
+        return [np.zeros(0) for _ in range(nb_columns)]
+    return [
+        np.memmap(
+            column_filename(filename, j), dtype=np.float64, mode="r", shape=nb_rows
+        )
+        for j in range(nb_columns)
+    ]
+
+
+def read_derived_quantities(folder):
+    """Reads the derived quantities of a results folder, from
+    derived_quantities.bin if it exists else from derived_quantities.csv
+
+    Args:
+        folder (str): the results folder
+
+    Returns:
+        dict: the columns (numpy.ndarray), by name ("ts",
+            "Total_retention_volume_1"...)
+    """
+    filename = os.path.join(folder, "derived_quantities.bin")
+    if binary_exists(filename):
+        with open(header_filename(filename)) as file:
+            titles = json.load(file)["columns"]
+        columns = read_binary(filename)
+        return {column_name(title): column for title, column in zip(titles, columns)}
+
+    data = np.genfromtxt(
+        os.path.join(folder, "derived_quantities.csv"), delimiter=",", names=True
+    )
+    return {name: data[name] for name in data.dtype.names}
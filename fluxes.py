@@ -13,56 +13,64 @@ class InterpolatedExpression(f.UserExpression):
         value[0] = self.interpolated_object(self.t)
 
 
+class TimeProfile(f.Constant):
+    """Piecewise linear function of time, evaluated once per time step.
+
+    Same interface as InterpolatedExpression but the value is stored in a
+    fenics.Constant, so the forms using it are compiled once and no Python
+    callback is made per evaluation point. FESTIM sets the attribute t of
+    every sub expression at each time step, which here triggers the
+    interpolation.
+    """
+
+    def __init__(self, data_t, data_y) -> None:
+        super().__init__(0.0)
+        self.interpolated_object = interp1d(data_t, data_y, fill_value=0)
+        self.t = 0
+
+    @property
+    def t(self):
+        return self._t
+
+    @t.setter
+    def t(self, value):
+        self._t = value
+        self.assign(float(self.interpolated_object(value)))
+
+
 class CyclingFlux(F.FluxBC):
-    def __init__(
-        self, rampup, plateau, rampdown, rest, nb_cycles, data_y, **kwargs
-    ) -> None:
+    def __init__(self, schedule, data_y, **kwargs) -> None:
+        """Inits CyclingFlux
+
+        Args:
+            schedule (CycleSchedule): the cycle schedule
+            data_y (list): the 4 values of the flux at the beginning of
+                rampup, plateau, rampdown and rest
+        """
         super().__init__(**kwargs)
-        self.rampup = rampup
-        self.rampdown = rampdown
-        self.plateau = plateau
-        self.rest = rest
-        self.nb_cycles = nb_cycles
-        assert len(data_y) == 4
-        self.data_y = data_y * nb_cycles + [data_y[-1]]
+        self.schedule = schedule
+        self.data_y = schedule.make_data_y(data_y)
 
     def create_form(self, T, solute):
-        self.form = InterpolatedExpression(
-            data_t=self.make_t_data(), data_y=self.data_y
-        )
+        self.form = TimeProfile(data_t=self.schedule.t_data, data_y=self.data_y)
         self.sub_expressions.append(self.form)
 
-    def make_t_data(self):
-        data_t = []
-        cycle_length = self.rampup + self.plateau + self.rampdown + self.rest
-        for n in range(self.nb_cycles):
-            data_t += [
-                n * cycle_length,
-                self.rampup + n * cycle_length,
-                (self.rampup + self.plateau) + n * cycle_length,
-                (self.rampup + self.plateau + self.rampdown) + n * cycle_length,
-            ]
-
-        data_t.append(data_t[-1] + self.rest)
-
-        return data_t
-
 
 class CyclingImplantationDirichlet(F.ImplantationDirichlet):
-    def __init__(
-        self, rampup, plateau, rampdown, rest, nb_cycles, data_y, **kwargs
-    ) -> None:
+    def __init__(self, schedule, data_y, **kwargs) -> None:
+        """Inits CyclingImplantationDirichlet
+
+        Args:
+            schedule (CycleSchedule): the cycle schedule
+            data_y (list): the 4 values of the implanted flux at the
+                beginning of rampup, plateau, rampdown and rest
+        """
         super().__init__(**kwargs)
-        self.rampup = rampup
-        self.rampdown = rampdown
-        self.plateau = plateau
-        self.rest = rest
-        self.nb_cycles = nb_cycles
-        assert len(data_y) == 4
-        self.data_y = data_y * nb_cycles + [data_y[-1]]
+        self.schedule = schedule
+        self.data_y = schedule.make_data_y(data_y)
 
     def create_expression(self, T):
-        phi = InterpolatedExpression(data_t=self.make_t_data(), data_y=self.data_y)
+        phi = TimeProfile(data_t=self.schedule.t_data, data_y=self.data_y)
         R_p = f.Expression(sp.printing.ccode(self.R_p), t=0, degree=1)
         sub_expressions = [phi, R_p]
 
@@ -79,20 +87,6 @@ class CyclingImplantationDirichlet(F.ImplantationDirichlet):
         self.expression = value_BC
         self.sub_expressions = sub_expressions
 
-    def make_t_data(self):
-        data_t = []
-        cycle_length = self.rampup + self.plateau + self.rampdown + self.rest
-        for n in range(self.nb_cycles):
-            data_t += [
-                n * cycle_length,
-                self.rampup + n * cycle_length,
-                (self.rampup + self.plateau) + n * cycle_length,
-                (self.rampup + self.plateau + self.rampdown) + n * cycle_length,
-            ]
-        data_t.append(data_t[-1] + self.rest)
-
-        return data_t
-
 
 def dc_imp(T, phi, R_p, D_0, E_D, Kr_0=None, E_Kr=None):
     D = D_0 * f.exp(-E_D / F.k_B / T)
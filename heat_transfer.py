@@ -0,0 +1,137 @@
+import fenics as f
+import FESTIM as F
+
+
+def set_parameters(parameters, values):
+    """Sets dolfin parameters from a (nested) dict
+
+    Args:
+        parameters (fenics.Parameters): the parameters
+        values (dict): the values, dicts for the nested parameters (eg.
+            {"krylov_solver": {"relative_tolerance": 1e-8}})
+    """
+    for key, value in values.items():
+        if isinstance(value, dict):
+            set_parameters(parameters[key], value)
+        else:
+            parameters[key] = value
+
+
+class QuasiStaticHeatTransferProblem(F.HeatTransferProblem):
+    """Transient heat transfer problem skipping the solves once the
+    temperature is steady within a phase of constant boundary conditions.
+
+    After each solve, the relative change of T (L2 norm of the nodal
+    values) is compared to steady_tolerance. If it is below and the
+    boundary conditions are constant during the current phase, T is frozen:
+    the next steps of the phase reuse it without solving. The solves resume
+    with the first step of the next phase.
+
+    The boundary conditions with a schedule (eg. CyclingFlux) are constant
+    during a phase if their values at its start and end are equal, the
+    other ones are assumed constant in time.
+
+    Attributes:
+        schedule (CycleSchedule): the cycle schedule
+        steady_tolerance (float): tolerance on the relative change of T
+            between two steps
+        frozen (tuple): the (cycle, phase index) during which T is frozen,
+            None if it isn't
+        nb_solves (int): number of solves
+        nb_skipped (int): number of skipped solves
+        newton_solver_parameters (dict): parameters of the dolfin
+            NewtonSolver of the solves (see set_parameters), None for the
+            ones of FESTIM
+    """
+
+    def __init__(
+        self, schedule, steady_tolerance=1e-6, newton_solver_parameters=None, **kwargs
+    ) -> None:
+        """Inits QuasiStaticHeatTransferProblem
+
+        Args:
+            schedule (CycleSchedule): the cycle schedule
+            steady_tolerance (float, optional): tolerance on the relative
+                change of T between two steps. Defaults to 1e-6.
+            newton_solver_parameters (dict, optional): parameters of the
+                dolfin NewtonSolver of the solves, eg. {"linear_solver":
+                "gmres", "preconditioner": "amg"}. None for the ones of
+                FESTIM. Defaults to None.
+            **kwargs: arguments of F.HeatTransferProblem
+        """
+        super().__init__(**kwargs)
+        self.schedule = schedule
+        self.steady_tolerance = steady_tolerance
+        self.newton_solver_parameters = newton_solver_parameters
+        self.frozen = None
+        self.t = None
+        self.nb_solves = 0
+        self.nb_skipped = 0
+
+    def reset(self):
+        """Forgets the previous step and unfreezes T, eg. when the time of
+        the simulation is set back
+        """
+        self.frozen = None
+        self.t = None
+
+    def constant_phases(self):
+        """Finds the phases during which the boundary conditions are
+        constant
+
+        Returns:
+            list: True for the phases (rampup, plateau, rampdown, rest) with
+                constant boundary conditions
+        """
+        constant = [True] * 4
+        for bc in self.boundary_conditions:
+            if hasattr(bc, "schedule"):
+                for i in range(4):
+                    if bc.data_y[i] != bc.data_y[i + 1]:
+                        constant[i] = False
+        return constant
+
+    def update(self, t):
+        if not self.transient:
+            return
+        # the step belongs to the phase containing its middle
+        middle = t if self.t is None else (self.t + t) / 2
+        self.t = t
+        step_phase = (self.schedule.cycle(middle), self.schedule.phase_index(middle))
+        if self.frozen == step_phase:
+            self.nb_skipped += 1
+            return
+        self.frozen = None
+
+        T_previous = self.T_n.vector().copy()
+        self.solve(t)
+        self.nb_solves += 1
+
+        # global norms, so that all the processes freeze T together
+        T = self.T.vector()
+        change = (T - T_previous).norm("l2") / T.norm("l2")
+        if change < self.steady_tolerance and self.constant_phases()[step_phase[1]]:
+            self.frozen = step_phase
+
+    def solve(self, t):
+        """Solves the heat transfer problem at t, as
+        F.HeatTransferProblem.update with newton_solver_parameters
+
+        Args:
+            t (float): the time
+        """
+        if self.newton_solver_parameters is None or not self.transient:
+            super().update(t)
+            return
+        F.update_expressions(self.sub_expressions, t)
+        dT = f.TrialFunction(self.T.function_space())
+        JT = f.derivative(self.F, self.T, dT)
+        problem = f.NonlinearVariationalProblem(self.F, self.T, self.dirichlet_bcs, JT)
+        solver = f.NonlinearVariationalSolver(problem)
+        newton_solver_prm = solver.parameters["newton_solver"]
+        newton_solver_prm["absolute_tolerance"] = self.absolute_tolerance
+        newton_solver_prm["relative_tolerance"] = self.relative_tolerance
+        newton_solver_prm["maximum_iterations"] = self.maximum_iterations
+        set_parameters(newton_solver_prm, self.newton_solver_parameters)
+        solver.solve()
+        self.T_n.assign(self.T)
@@ -0,0 +1,189 @@
+"""Online monitor of the inventory of cycling runs.
+
+InventoryMonitor computes the total inventory after each time step and,
+at the end of each cycle, the cycle statistics (peak, minimum and
+end-of-rest inventory, spike height). Once the convergence criteria are
+met the run can be stopped: run_with_checkpoints stops when update returns
+True. The state of the monitor is saved with the checkpoints (see
+checkpoint.save_state) so a resumed run keeps its cycle statistics.
+
+Criteria (None to disable):
+    - spike_ratio_threshold: spike height (peak minus minimum) over the
+      end-of-rest inventory
+    - growth_rate_threshold: relative increase of the end-of-rest inventory
+      from one cycle to the next
+"""
+
+import json
+import logging
+import os
+
+import fenics as f
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryMonitor:
+    """Per-cycle statistics of the inventory and convergence criteria
+
+    Attributes:
+        schedule (CycleSchedule): the cycle schedule
+        spike_ratio_threshold (float): threshold on the spike height over
+            the inventory
+        growth_rate_threshold (float): threshold on the per-cycle relative
+            growth of the inventory
+        nb_cycles_min (int): minimum number of cycles before stopping
+        cycles (list): statistics of the completed cycles (dicts)
+        converged (bool): True once the criteria are met
+    """
+
+    def __init__(
+        self,
+        schedule,
+        spike_ratio_threshold=None,
+        growth_rate_threshold=None,
+        nb_cycles_min=2,
+    ) -> None:
+        """Inits InventoryMonitor
+
+        Args:
+            schedule (CycleSchedule): the cycle schedule
+            spike_ratio_threshold (float, optional): the run is converged
+                when the spike height over the end-of-rest inventory is
+                below this threshold. Defaults to None.
+            growth_rate_threshold (float, optional): the run is converged
+                when the relative increase of the end-of-rest inventory over
+                the last cycle is below this threshold. Defaults to None.
+            nb_cycles_min (int, optional): minimum number of cycles before
+                stopping. Defaults to 2.
+        """
+        self.schedule = schedule
+        self.spike_ratio_threshold = spike_ratio_threshold
+        self.growth_rate_threshold = growth_rate_threshold
+        self.nb_cycles_min = nb_cycles_min
+        self.tolerance = 1e-9 * schedule.cycle_length
+
+        self.cycles = []
+        self.converged = False
+        self.form = None
+        self.cycle = None
+        self.peak = None
+        self.min = None
+
+    def inventory(self, model):
+        """Computes the total inventory of the model
+
+        Args:
+            model (FESTIM.Simulation): the model
+
+        Returns:
+            float: the inventory (H/m2)
+        """
+        if self.form is None:
+            retention = sum(f.split(model.h_transport_problem.u))
+            self.form = retention * model.mesh.dx
+        return f.assemble(self.form)
+
+    def update(self, model):
+        """Updates the statistics after a time step
+
+        Args:
+            model (FESTIM.Simulation): the model
+
+        Returns:
+            bool: True if the convergence criteria are met, else False
+        """
+        inventory = self.inventory(model)
+        if self.cycle is None:
+            self.start_cycle(self.schedule.cycle(model.t), inventory)
+            return False
+
+        self.peak = max(self.peak, inventory)
+        self.min = min(self.min, inventory)
+        cycle_end = (self.cycle + 1) * self.schedule.cycle_length
+        if model.t >= cycle_end - self.tolerance:
+            self.end_cycle(inventory)
+            self.start_cycle(self.cycle + 1, inventory)
+            self.converged = self.is_converged()
+        return self.converged
+
+    def start_cycle(self, cycle, inventory):
+        self.cycle = cycle
+        self.peak = inventory
+        self.min = inventory
+
+    def end_cycle(self, inventory):
+        statistics = {
+            "cycle": self.cycle,
+            "peak": self.peak,
+            "min": self.min,
+            "end_of_rest": inventory,
+            "spike_ratio": (self.peak - self.min) / inventory,
+            "growth_rate": None,
+        }
+        if self.cycles:
+            previous = self.cycles[-1]["end_of_rest"]
+            statistics["growth_rate"] = (inventory - previous) / previous
+        self.cycles.append(statistics)
+        logger.info(
+            "cycle {}: inventory {:.2e}, spike ratio {:.2e}".format(
+                self.cycle, inventory, statistics["spike_ratio"]
+            )
+        )
+
+    def is_converged(self):
+        """Checks the convergence criteria on the last completed cycle
+
+        Returns:
+            bool: True if all the criteria are met, else False
+        """
+        if len(self.cycles) < self.nb_cycles_min:
+            return False
+        if self.spike_ratio_threshold is None and self.growth_rate_threshold is None:
+            return False
+        last = self.cycles[-1]
+        if self.spike_ratio_threshold is not None:
+            if last["spike_ratio"] >= self.spike_ratio_threshold:
+                return False
+        if self.growth_rate_threshold is not None:
+            if last["growth_rate"] is None:
+                return False
+            if abs(last["growth_rate"]) >= self.growth_rate_threshold:
+                return False
+        return True
+
+    def get_state(self):
+        """Returns the state of the monitor (completed and current cycle)
+
+        Returns:
+            dict: the JSON serialisable state
+        """
+        return {
+            "cycles": self.cycles,
+            "converged": self.converged,
+            "cycle": self.cycle,
+            "peak": self.peak,
+            "min": self.min,
+        }
+
+    def set_state(self, state):
+        """Restores a state returned by get_state
+
+        Args:
+            state (dict): the state
+        """
+        self.cycles = state["cycles"]
+        self.converged = state["converged"]
+        self.cycle = state["cycle"]
+        self.peak = state["peak"]
+        self.min = state["min"]
+
+    def write(self, filename):
+        """Writes the cycle statistics and convergence status to a JSON file
+
+        Args:
+            filename (str): the file
+        """
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w") as file:
+            json.dump({"converged": self.converged, "cycles": self.cycles}, file)
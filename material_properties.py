@@ -0,0 +1,147 @@
+"""Temperature dependent thermal properties of W, Cu and CuCrZr.
+
+The properties are cubic polynomials of T whose coefficients are stored
+once in property_table. The same CubicProperty object is used by FESTIM
+(called on the temperature Function it returns the UFL expression of the
+original a*T**3 + b*T**2 + c*T + d expansion, so the solver outputs are
+unchanged), in post-processing (evaluate works in place on NumPy arrays,
+in Horner form) and, for large numbers of points, through a pre-tabulated
+spline.
+"""
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+# coefficients of T**3, T**2, T and 1
+property_table = {
+    "W": {
+        "thermal_cond": [-7.84154e-9, 5.03006e-5, -1.07335e-1, 1.75214e2],
+        "rho_cp": [5.15356e-6, -8.30703e-2, 5.98312e2, 2.48160e6],
+    },
+    "Cu": {
+        "thermal_cond": [-3.93153e-08, 3.76147e-05, -7.88669e-02, 4.02301e02],
+        "rho_cp": [1.68402e-4, -6.14079e-2, 4.67353e2, 3.45899e6],
+    },
+    "CuCrZr": {
+        "thermal_cond": [5.25780e-7, -6.45110e-4, 2.57678e-01, 3.12969e2],
+        "rho_cp": [-1.79134e-4, -1.51383e-1, 6.22091e2, 3.46007e6],
+    },
+}
+
+
+class CubicProperty:
+    """Property given by a cubic polynomial of the temperature
+
+    Attributes:
+        coefficients (list): coefficients of T**3, T**2, T and 1
+        T_min (float): lower bound of the tabulated range (K)
+        T_max (float): upper bound of the tabulated range (K)
+        spline (scipy.interpolate.CubicSpline): the tabulated property,
+            created by tabulate
+    """
+
+    def __init__(self, coefficients, T_min=300, T_max=3000):
+        """Inits CubicProperty
+
+        Args:
+            coefficients (list): coefficients of T**3, T**2, T and 1
+            T_min (float, optional): lower bound of the tabulated range (K).
+                Defaults to 300.
+            T_max (float, optional): upper bound of the tabulated range (K).
+                Defaults to 3000.
+        """
+        self.coefficients = [float(c) for c in coefficients]
+        self.T_min = T_min
+        self.T_max = T_max
+        self.spline = None
+
+    def __call__(self, T):
+        """Evaluation in the expanded form a*T**3 + b*T**2 + c*T + d, the
+        negative coefficients being subtracted, ie. the same operations
+        (and UFL expressions) as the original property functions of
+        main.py. Works with floats, NumPy arrays and UFL expressions (eg.
+        the temperature in the heat transfer forms).
+
+        Args:
+            T (float, numpy.ndarray or ufl.core.expr.Expr): the temperature (K)
+
+        Returns:
+            float, numpy.ndarray or ufl.core.expr.Expr: the property
+        """
+        a, *others = self.coefficients
+        value = a * T**3
+        for coefficient, term in zip(others, [T**2, T, 1]):
+            if coefficient < 0:
+                value = value - -coefficient * term
+            else:
+                value = value + coefficient * term
+        return value
+
+    def evaluate(self, T, out=None):
+        """Vectorized evaluation on NumPy arrays without temporaries
+
+        Args:
+            T (numpy.ndarray): the temperature (K)
+            out (numpy.ndarray, optional): array the result is written to.
+                Defaults to None (a new array is created).
+
+        Returns:
+            numpy.ndarray: the property
+        """
+        T = np.asarray(T, dtype=float)
+        if out is None:
+            out = np.empty_like(T)
+        out.fill(self.coefficients[0])
+        for coefficient in self.coefficients[1:]:
+            out *= T
+            out += coefficient
+        return out
+
+    def tabulate(self, nb_points=271):
+        """Creates the spline of the property over [T_min, T_max]
+
+        Args:
+            nb_points (int, optional): number of tabulated temperatures.
+                Defaults to 271.
+
+        Returns:
+            scipy.interpolate.CubicSpline: the spline
+        """
+        T = np.linspace(self.T_min, self.T_max, num=nb_points)
+        self.spline = CubicSpline(T, self.evaluate(T))
+        return self.spline
+
+    def lookup(self, T):
+        """Evaluates the tabulated property (tabulated on first call)
+
+        Args:
+            T (numpy.ndarray): the temperature (K), within [T_min, T_max]
+
+        Returns:
+            numpy.ndarray: the property
+        """
+        if self.spline is None:
+            self.tabulate()
+        return self.spline(T)
+
+
+def make_properties(table=property_table):
+    """Creates the CubicProperty objects of a property table
+
+    Args:
+        table (dict, optional): {material: {property: coefficients}}.
+            Defaults to property_table.
+
+    Returns:
+        dict: {material: {property: CubicProperty}}
+    """
+    return {
+        material: {
+            name: CubicProperty(coefficients)
+            for name, coefficients in properties.items()
+        }
+        for material, properties in table.items()
+    }
+
+
+properties = make_properties()
@@ -0,0 +1,162 @@
+"""On-disk cache of the refined 1D mesh and its markers.
+
+The mesh built by F.MeshFromRefinements and its volume and surface markers
+are written to XDMF files in a folder named after a hash of the refinement
+parameters and of the materials borders. Later runs (and the other
+processes of a sweep) read them back instead of refining and marking the
+mesh again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import fenics as f
+import FESTIM as F
+
+cache_folder = "mesh_cache"
+
+
+def mesh_key(mesh_parameters, materials):
+    """Hash of everything the refined mesh and its markers depend on
+
+    Args:
+        mesh_parameters (dict): arguments of F.MeshFromRefinements
+        materials (list): the F.Material objects
+
+    Returns:
+        str: the key
+    """
+    spec = {
+        "mesh": mesh_parameters,
+        "materials": [[material.id, material.borders] for material in materials],
+    }
+    content = json.dumps(spec, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class CachedMesh1D(F.Mesh1D):
+    """1D mesh whose markers are given at creation rather than computed from
+    the materials borders in define_measures.
+
+    Attributes:
+        mesh (fenics.Mesh): the mesh
+        volume_markers (fenics.MeshFunction): markers of the mesh cells
+        surface_markers (fenics.MeshFunction): markers of the mesh facets
+    """
+
+    def __init__(self, mesh, volume_markers, surface_markers, size, **kwargs):
+        """Inits CachedMesh1D
+
+        Args:
+            mesh (fenics.Mesh): the mesh
+            volume_markers (fenics.MeshFunction): markers of the mesh cells
+            surface_markers (fenics.MeshFunction): markers of the mesh facets
+            size (float): the size of the 1D mesh
+        """
+        super().__init__(mesh=mesh, **kwargs)
+        self.size = size
+        self.cached_volume_markers = volume_markers
+        self.cached_surface_markers = surface_markers
+
+    def define_markers(self, materials):
+        self.volume_markers = self.cached_volume_markers
+        self.surface_markers = self.cached_surface_markers
+
+
+def create_mesh(mesh_parameters, materials):
+    """Refines the mesh and marks it
+
+    Args:
+        mesh_parameters (dict): arguments of F.MeshFromRefinements
+        materials (list): the F.Material objects
+
+    Returns:
+        fenics.Mesh, fenics.MeshFunction, fenics.MeshFunction: the mesh, the
+            volume markers and the surface markers
+    """
+    mesh = F.MeshFromRefinements(**mesh_parameters)
+    volume_markers = mesh.define_volume_markers(F.Materials(materials))
+    surface_markers = mesh.define_surface_markers()
+    return mesh.mesh, volume_markers, surface_markers
+
+
+def write_mesh(folder, volume_markers, surface_markers):
+    """Writes the mesh and its markers to folder/volume_markers.xdmf and
+    folder/surface_markers.xdmf
+
+    Args:
+        folder (str): the folder
+        volume_markers (fenics.MeshFunction): markers of the mesh cells
+        surface_markers (fenics.MeshFunction): markers of the mesh facets
+    """
+    volume_markers.rename("f", "f")
+    surface_markers.rename("f", "f")
+    with f.XDMFFile(os.path.join(folder, "volume_markers.xdmf")) as file:
+        file.write(volume_markers)
+    with f.XDMFFile(os.path.join(folder, "surface_markers.xdmf")) as file:
+        file.write(surface_markers)
+
+
+def read_mesh(folder):
+    """Reads the mesh and its markers written by write_mesh
+
+    Args:
+        folder (str): the folder
+
+    Returns:
+        fenics.Mesh, fenics.MeshFunction, fenics.MeshFunction: the mesh, the
+            volume markers and the surface markers
+    """
+    volume_file = os.path.join(folder, "volume_markers.xdmf")
+    surface_file = os.path.join(folder, "surface_markers.xdmf")
+
+    mesh = f.Mesh()
+    with f.XDMFFile(volume_file) as file:
+        file.read(mesh)
+    dim = mesh.topology().dim()
+
+    volume_markers = f.MeshFunction("size_t", mesh, dim)
+    with f.XDMFFile(volume_file) as file:
+        file.read(volume_markers)
+
+    surface_markers = f.MeshValueCollection("size_t", mesh, dim - 1)
+    with f.XDMFFile(surface_file) as file:
+        file.read(surface_markers, "f")
+    surface_markers = f.MeshFunction("size_t", mesh, surface_markers)
+    return mesh, volume_markers, surface_markers
+
+
+def load_or_create_mesh(mesh_parameters, materials, folder=None):
+    """Reads the mesh and its markers from the cache, or creates and caches
+    them if they aren't there yet
+
+    Args:
+        mesh_parameters (dict): arguments of F.MeshFromRefinements
+        materials (list): the F.Material objects
+        folder (str, optional): the cache folder. Defaults to cache_folder.
+
+    Returns:
+        fenics.Mesh, fenics.MeshFunction, fenics.MeshFunction: the mesh, the
+            volume markers and the surface markers
+    """
+    if folder is None:
+        folder = cache_folder
+    entry = os.path.join(folder, mesh_key(mesh_parameters, materials))
+    if os.path.exists(entry):
+        return read_mesh(entry)
+
+    mesh, volume_markers, surface_markers = create_mesh(mesh_parameters, materials)
+    # written in a temporary folder then renamed so that concurrent processes
+    # never read a partially written entry
+    os.makedirs(folder, exist_ok=True)
+    tmp_entry = tempfile.mkdtemp(dir=folder)
+    write_mesh(tmp_entry, volume_markers, surface_markers)
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # another process cached it first
+        shutil.rmtree(tmp_entry)
+    return mesh, volume_markers, surface_markers
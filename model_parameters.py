@@ -0,0 +1,103 @@
+"""Parameters of the monoblock model: materials, traps, mesh and boundary
+conditions.
+
+Imports no FESTIM so that both main.py (which builds the FESTIM objects
+from them) and the NumPy/SciPy screening engine (screening.py) use the
+same values.
+"""
+
+from material_properties import properties
+
+thermal_cond_W = properties["W"]["thermal_cond"]
+thermal_cond_Cu = properties["Cu"]["thermal_cond"]
+thermal_cond_CuCrZr = properties["CuCrZr"]["thermal_cond"]
+
+rho_cp_W = properties["W"]["rho_cp"]
+rho_cp_Cu = properties["Cu"]["rho_cp"]
+rho_cp_CuCrZr = properties["CuCrZr"]["rho_cp"]
+
+
+# atom_density  =  density(g/m3)*Na(/mol)/M(g/mol)
+atom_density_W = 6.28e28  # 6.3222e28  # atomic density m^-3
+atom_density_Cu = 8.43e28  # 8.4912e28  # atomic density m^-3
+atom_density_CuCrZr = 2.6096e28  # atomic density m^-3
+
+tungsten_parameters = dict(
+    id=1,
+    D_0=1.9e-7,
+    E_D=0.2,
+    S_0=1.87e24,
+    E_S=1.04,
+    thermal_cond=thermal_cond_W,
+    rho=1,
+    heat_capacity=rho_cp_W,
+    borders=[0, 6e-3],
+)
+cu_parameters = dict(
+    id=2,
+    D_0=6.6e-7,
+    E_D=0.39,
+    S_0=3.14e24,
+    E_S=0.57,
+    thermal_cond=thermal_cond_Cu,
+    rho=1,
+    heat_capacity=rho_cp_Cu,
+    borders=[6e-3, 7e-3],
+)
+cucrzr_parameters = dict(
+    id=3,
+    D_0=3.9e-7,
+    E_D=0.42,
+    S_0=4.28e23,
+    E_S=0.39,
+    thermal_cond=thermal_cond_CuCrZr,
+    rho=1,
+    heat_capacity=rho_cp_CuCrZr,
+    borders=[7e-3, 7.5e-3],
+)
+
+# trap_conglo is in the three materials, trap_w2 in W only
+trap_w2_parameters = dict(
+    k_0=8.96e-17,
+    E_k=0.2,
+    p_0=1e13,
+    E_p=1,
+    density=4e-4 * atom_density_W,
+)
+
+trap_conglo_parameters = dict(
+    k_0=[8.96e-17, 6.0e-17, 1.2e-16],
+    E_k=[0.2, 0.39, 0.42],
+    p_0=[1e13, 8e13, 8e13],
+    E_p=[0.87, 0.5, 0.85],
+    density=[
+        1.1e-3 * atom_density_W,
+        5.0e-5 * atom_density_Cu,
+        5.0e-5 * atom_density_CuCrZr,
+    ],
+)
+
+mesh_parameters = dict(
+    initial_number_of_cells=600,
+    size=cucrzr_parameters["borders"][-1],
+    refinements=[
+        {"x": tungsten_parameters["borders"][-1], "cells": 500},
+        {"x": 1e-5, "cells": 100},
+        {"x": 2e-6, "cells": 200},
+        {"x": 2e-7, "cells": 20},
+        # {"x": 1e-4, "cells": 50},
+        # {"x": 1e-4, "cells": 100},
+        # {"x": 1e-6, "cells": 100},
+        # {"x": 1e-7, "cells": 100},
+    ],
+)
+
+
+# implantation at the plasma-facing surface (surface 1, x = 0)
+implantation_depth = 9.52e-10  # m
+
+# coolant surface (surface 2)
+recombination_parameters = dict(Kr_0=2.9e-14, E_Kr=1.92, order=2)
+convection_parameters = dict(h_coeff=70000, T_ext=323)
+
+initial_temperature = 323  # K
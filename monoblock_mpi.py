@@ -0,0 +1,314 @@
+"""2D/3D monoblock model run in parallel with MPI.
+
+Same materials, traps and cycling boundary conditions as the 1D model
+(main.py, cycling.py) on a tagged mesh of the monoblock cross-section (2D)
+or of the monoblock (3D), read from XDMF files (eg. converted with meshio
+from a gmsh mesh):
+    - volume_file: the cells, tagged 1 (W), 2 (Cu) and 3 (CuCrZr), the ids
+      of the materials
+    - boundary_file: the facets, tagged 1 (plasma-facing surface) and 2
+      (cooling surface, inner wall of the pipe), the surfaces of the
+      boundary conditions
+
+    mpirun -n 16 python monoblock_mpi.py --volume-file volumes.xdmf \
+        --boundary-file surfaces.xdmf
+
+dolfin partitions the mesh between the processes when reading it. The
+linear systems of the Newton iterations are solved with GMRES, preconditioned
+with block Jacobi/ILU(0) for the H transport and algebraic multigrid for T
+(--linear-solver krylov, the default), or with MUMPS (parallel LU,
+--linear-solver mumps), see linear_solvers. The XDMF exports are written
+collectively, the derived quantities are assembled over the whole mesh and
+written by the process of rank 0 (see streaming_derived_quantities.py), as
+are the messages.
+
+Not used here: the checkpoints, the temperature library and the adaptive
+mesh (serial or 1D only), and the restricted trap unknowns
+(restricted_traps.py, direct solver only). T is solved with
+QuasiStaticHeatTransferProblem as in cycling.py.
+
+With --benchmark <file>, a short run without exports is timed and its
+wall time, mesh size and solver counts are written to <file> (JSON), see
+strong_scaling.py.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import fenics as f
+import FESTIM as F
+
+from main import build_monoblock_model
+from checkpoint import is_finished, write_fields_at_stop
+from cycle_schedule import CycleSchedule
+from cycling import (
+    setup_cycling,
+    make_exports,
+    heat_flux_value,
+    part_flux_value,
+    rampup,
+    plateau,
+    rampdown,
+    rest,
+    nb_cycles,
+    spike_ratio_threshold,
+    growth_rate_threshold,
+)
+from heat_transfer import set_parameters
+from inventory_monitor import InventoryMonitor
+
+volume_file = "meshes/monoblock_volumes.xdmf"
+boundary_file = "meshes/monoblock_surfaces.xdmf"
+
+# parameters of the dolfin NewtonSolver of the H transport and heat
+# transfer solves (see heat_transfer.set_parameters). The Krylov solves
+# don't raise on non-convergence: the Newton iterations then fail to
+# converge and the step is retried with a smaller dt.
+linear_solvers = {
+    "krylov": {
+        # "default": PETSc's block Jacobi with ILU(0) on each process
+        "h_transport": {
+            "linear_solver": "gmres",
+            "preconditioner": "default",
+            "krylov_solver": {
+                "relative_tolerance": 1e-10,
+                "maximum_iterations": 1000,
+                "error_on_nonconvergence": False,
+            },
+        },
+        "heat": {
+            "linear_solver": "gmres",
+            "preconditioner": "amg",
+            "krylov_solver": {
+                "relative_tolerance": 1e-8,
+                "maximum_iterations": 1000,
+                "error_on_nonconvergence": False,
+            },
+        },
+    },
+    "mumps": {
+        "h_transport": {"linear_solver": "mumps"},
+        "heat": {"linear_solver": "mumps"},
+    },
+}
+
+# length of the benchmark runs
+benchmark_cycles = 1
+
+
+def use_newton_solver_parameters(problem, parameters):
+    """Makes an initialised hydrogen transport problem solve with the
+    given dolfin NewtonSolver parameters (FESTIM only sets the linear
+    solver)
+
+    Args:
+        problem (FESTIM.HTransportProblem): the problem
+        parameters (dict): the parameters (see heat_transfer.set_parameters)
+    """
+
+    def solve_once():
+        # as HTransportProblem.solve_once
+        J = problem.J
+        if J is None:
+            J = f.derivative(
+                problem.F, problem.u, f.TrialFunction(problem.u.function_space())
+            )
+        solver = f.NonlinearVariationalSolver(
+            f.NonlinearVariationalProblem(problem.F, problem.u, problem.bcs, J)
+        )
+        newton_solver_prm = solver.parameters["newton_solver"]
+        newton_solver_prm["error_on_nonconvergence"] = False
+        newton_solver_prm["absolute_tolerance"] = problem.settings.absolute_tolerance
+        newton_solver_prm["relative_tolerance"] = problem.settings.relative_tolerance
+        newton_solver_prm["maximum_iterations"] = problem.settings.maximum_iterations
+        set_parameters(newton_solver_prm, parameters)
+        return solver.solve()
+
+    problem.solve_once = solve_once
+
+
+def make_model(volume_file, boundary_file, schedule, linear_solver="krylov"):
+    """Builds and sets up the cycling model on a 2D/3D mesh (not
+    initialised)
+
+    Args:
+        volume_file (str): the XDMF file of the tagged cells
+        boundary_file (str): the XDMF file of the tagged facets
+        schedule (CycleSchedule): the cycle schedule
+        linear_solver (str, optional): "krylov" or "mumps", see
+            linear_solvers. Defaults to "krylov".
+
+    Returns:
+        F.Simulation: the model
+    """
+    mesh = F.MeshFromXDMF(volume_file=volume_file, boundary_file=boundary_file)
+    model = build_monoblock_model(mesh=mesh)
+    setup_cycling(model, schedule, heat_flux_value, part_flux_value)
+    parameters = linear_solvers[linear_solver]
+    model.T.newton_solver_parameters = parameters["heat"]
+    initialise = model.initialise
+
+    def initialise_and_set_solver():
+        initialise()
+        use_newton_solver_parameters(
+            model.h_transport_problem, parameters["h_transport"]
+        )
+
+    model.initialise = initialise_and_set_solver
+    return model
+
+
+def count_newton_iterations(model):
+    """Counts the Newton iterations of the hydrogen transport solves of an
+    initialised model
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+
+    Returns:
+        dict: the number of iterations under "newton_iterations", updated
+            after each solve
+    """
+    problem = model.h_transport_problem
+    solve_once = problem.solve_once
+    counts = {"newton_iterations": 0}
+
+    def counted_solve_once():
+        nb_it, converged = solve_once()
+        counts["newton_iterations"] += nb_it
+        return nb_it, converged
+
+    problem.solve_once = counted_solve_once
+    return counts
+
+
+def run(model, monitor=None):
+    """Runs the transient simulation like F.Simulation.run
+
+    Args:
+        model (FESTIM.Simulation): the initialised model
+        monitor (InventoryMonitor, optional): if given, the run stops as
+            soon as monitor.update returns True. Defaults to None.
+    """
+    model.timer = f.Timer()
+    model.exports.final_time = model.settings.final_time
+    if not model.settings.update_jacobian:
+        model.h_transport_problem.compute_jacobian()
+
+    while not is_finished(model):
+        model.iterate()
+        # the inventory is assembled over the whole mesh, so all the
+        # processes stop together
+        if monitor is not None and monitor.update(model):
+            if f.MPI.rank(model.mesh.mesh.mpi_comm()) == 0:
+                print("Converged at t = {:.1f} s, stopping".format(model.t))
+            write_fields_at_stop(model)
+            break
+    for export in model.exports.exports:
+        if isinstance(export, F.DerivedQuantities):
+            export.write()
+
+
+def benchmark(volume_file, boundary_file, filename, linear_solver="krylov"):
+    """Times a short run (benchmark_cycles cycles, no exports) and writes
+    the results to a JSON file
+
+    Args:
+        volume_file (str): the XDMF file of the tagged cells
+        boundary_file (str): the XDMF file of the tagged facets
+        filename (str): the JSON file of the results
+        linear_solver (str, optional): "krylov" or "mumps", see
+            linear_solvers. Defaults to "krylov".
+    """
+    comm = f.MPI.comm_world
+    schedule = CycleSchedule(
+        rampup=rampup,
+        plateau=plateau,
+        rampdown=rampdown,
+        rest=rest,
+        nb_cycles=benchmark_cycles,
+    )
+
+    f.MPI.barrier(comm)
+    start = time.perf_counter()
+    model = make_model(volume_file, boundary_file, schedule, linear_solver)
+    model.exports = F.Exports([])
+    model.initialise()
+    setup = time.perf_counter() - start
+    counts = count_newton_iterations(model)
+
+    f.MPI.barrier(comm)
+    start = time.perf_counter()
+    run(model)
+    wall = time.perf_counter() - start
+
+    mesh = model.mesh.mesh
+    results = {
+        "nb_processes": f.MPI.size(comm),
+        "linear_solver": linear_solver,
+        "nb_cells": mesh.num_entities_global(mesh.topology().dim()),
+        "nb_unknowns": model.h_transport_problem.u.function_space().dim(),
+        # the slowest process
+        "setup": f.MPI.max(comm, setup),
+        "wall": f.MPI.max(comm, wall),
+        "nb_steps": model.dt.nb_steps,
+        "nb_rejected": model.dt.nb_rejected,
+        "newton_iterations": counts["newton_iterations"],
+        "heat_solves": model.T.nb_solves,
+    }
+    if f.MPI.rank(comm) == 0:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--volume-file", default=volume_file)
+    parser.add_argument("--boundary-file", default=boundary_file)
+    parser.add_argument(
+        "--linear-solver", choices=list(linear_solvers), default="krylov"
+    )
+    parser.add_argument(
+        "--benchmark", metavar="FILE", help="time a short run, results in FILE"
+    )
+    args = parser.parse_args()
+    # messages (eg. of the inventory monitor) from the process of rank 0 only
+    rank = f.MPI.rank(f.MPI.comm_world)
+    logging.basicConfig(
+        level=logging.INFO if rank == 0 else logging.WARNING, format="%(message)s"
+    )
+
+    if args.benchmark is not None:
+        benchmark(
+            args.volume_file, args.boundary_file, args.benchmark, args.linear_solver
+        )
+    else:
+        schedule = CycleSchedule(
+            rampup=rampup,
+            plateau=plateau,
+            rampdown=rampdown,
+            rest=rest,
+            nb_cycles=nb_cycles,
+        )
+        model = make_model(
+            args.volume_file, args.boundary_file, schedule, args.linear_solver
+        )
+        dimension = model.mesh.mesh.topology().dim()
+        main_folder = "results/phi_heat={:.1e}_phi_part={:.1e}/monoblock_{}d".format(
+            heat_flux_value, part_flux_value, dimension
+        )
+        model.exports = make_exports(main_folder, schedule)
+        model.log_level = 20
+        model.initialise()
+        monitor = InventoryMonitor(
+            schedule,
+            spike_ratio_threshold=spike_ratio_threshold,
+            growth_rate_threshold=growth_rate_threshold,
+        )
+        run(model, monitor=monitor)
+        if rank == 0:
+            monitor.write(main_folder + "/monitor.json")
@@ -0,0 +1,140 @@
+"""Post-processing of the inventory of cycling and continuous runs.
+
+The results of each folder are loaded once (see load_inventory) and the
+fluence is integrated exactly from the piecewise linear cycle profile, so
+that all the functions are vectorised and fast on long runs.
+"""
+
+import functools
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+from derived_quantities_reader import read_derived_quantities
+
+
+def scenario_folder(heat_flux, part_flux):
+    """Returns the results folder of a scenario
+
+    Args:
+        heat_flux (float): heat flux during the plateau (W/m2)
+        part_flux (float): particle flux during the plateau (H/m2/s)
+
+    Returns:
+        str: the folder containing the cycling and continuous results
+    """
+    return "results/phi_heat={:.1e}_phi_part={:.1e}".format(heat_flux, part_flux)
+
+
+@functools.lru_cache(maxsize=None)
+def load_inventory(folder):
+    """Loads the time and total inventory of a results folder. The arrays
+    are cached per folder.
+
+    Args:
+        folder (str): the results folder (eg. .../cycling)
+
+    Returns:
+        numpy.ndarray, numpy.ndarray: the times (s) and the inventory (H/m2)
+    """
+    data = read_derived_quantities(folder)
+    inventory = sum(data["Total_retention_volume_{}".format(i)] for i in [1, 2, 3])
+    t = np.array(data["ts"])
+    t.flags.writeable = False
+    inventory.flags.writeable = False
+    return t, inventory
+
+
+def fluence_cycling(schedule, part_flux, t):
+    """Fluence of a cycling run
+
+    Args:
+        schedule (CycleSchedule): the cycle schedule
+        part_flux (float): particle flux during the plateau (H/m2/s)
+        t (numpy.ndarray): the times (s)
+
+    Returns:
+        numpy.ndarray: the fluence (H/m2)
+    """
+    return schedule.integrate([0, part_flux, part_flux, 0], t)
+
+
+def fluence_continuous(part_flux, t):
+    """Fluence of a continuous run
+
+    Args:
+        part_flux (float): particle flux (H/m2/s)
+        t (numpy.ndarray): the times (s)
+
+    Returns:
+        numpy.ndarray: the fluence (H/m2)
+    """
+    return part_flux * np.asarray(t)
+
+
+def cycle_aggregates(schedule, t, inventory):
+    """Per cycle statistics of the inventory. The samples at the end of a
+    cycle belong to the next one.
+
+    Args:
+        schedule (CycleSchedule): the cycle schedule
+        t (numpy.ndarray): the times (s), increasing
+        inventory (numpy.ndarray): the inventory (H/m2)
+
+    Returns:
+        dict: arrays "cycle" (index of the cycles with samples), "peak" and
+            "min" (maximum and minimum inventory over the cycle) and
+            "end_of_rest" (inventory at the end of the cycle, nan if the
+            cycle isn't complete)
+    """
+    cycles = (np.asarray(t) // schedule.cycle_length).astype(int)
+    starts = np.flatnonzero(np.diff(cycles, prepend=-1))
+    cycle = cycles[starts]
+
+    ends = (cycle + 1) * schedule.cycle_length
+    end_of_rest = np.interp(ends, t, inventory)
+    end_of_rest[ends > t[-1] * (1 + 1e-10)] = np.nan
+
+    return {
+        "cycle": cycle,
+        "peak": np.maximum.reduceat(inventory, starts),
+        "min": np.minimum.reduceat(inventory, starts),
+        "end_of_rest": end_of_rest,
+    }
+
+
+def power_law(x, a, b):
+    return a * x**b
+
+
+def fit_power_law(fluence, inventory):
+    """Fits inventory = a * fluence**b
+
+    Args:
+        fluence (numpy.ndarray): the fluence (H/m2)
+        inventory (numpy.ndarray): the inventory (H/m2)
+
+    Returns:
+        numpy.ndarray: a and b
+    """
+    popt, pcov = curve_fit(power_law, fluence, inventory)
+    return popt
+
+
+if __name__ == "__main__":
+    import time
+
+    from cycle_schedule import CycleSchedule
+
+    schedule = CycleSchedule(100, 400, 100, 1000, nb_cycles=600)
+    t = np.linspace(0, schedule.final_time, num=10**6)
+    inventory = np.sqrt(t) * (1 + 0.1 * np.sin(2 * np.pi * t / schedule.cycle_length))
+
+    start = time.perf_counter()
+    fluence = fluence_cycling(schedule, 5e21, t)
+    aggregates = cycle_aggregates(schedule, t, inventory)
+    print(
+        "{} samples, {} cycles: {:.3f} s".format(
+            t.size, aggregates["cycle"].size, time.perf_counter() - start
+        )
+    )
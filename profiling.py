@@ -0,0 +1,282 @@
+"""Per-step profiling of FESTIM runs.
+
+StepProfiler wraps the methods of a model doing the work of a time step
+and appends one JSON line per step to a trace file:
+    - "t", "dt", "cycle", "phase": the step (phase "continuous" without
+      schedule)
+    - "wall": wall time of the step (s)
+    - "times": wall time (s) spent in
+        - "newton": the hydrogen transport solves (including assembly and
+          the evaluation of the boundary conditions)
+        - "assembly": assembly during these solves (dolfin timers of
+          Assembler and SystemAssembler)
+        - "bc_eval": the Python eval of the boundary condition expressions
+          (eg. F.BoundaryConditionExpression, InterpolatedExpression)
+        - "heat": the heat transfer solve
+        - "adapt": the stepsize adaptation
+        - "export:<name>": each export
+    - "newton_iterations": the number of iterations of each attempt
+    - "rejected": the number of rejected attempts: solves that didn't
+      converge and, in error-control mode, steps rejected by CyclingStepsize
+      and recomputed within the step (the nb_rejected of the stepsize)
+
+summarise aggregates a trace per cycle phase; run
+python profiling.py <trace.jsonl> to print the report of a trace.
+"""
+
+import collections
+import json
+import os
+import sys
+import time
+
+import fenics as f
+
+# dolfin timers of the assemblers: Assembler (FESTIM's NonlinearProblem)
+# and SystemAssembler (restricted_traps.PinnedTrapsProblem)
+assembly_tasks = [
+    "Assemble cells",
+    "Assemble exterior facets",
+    "Assemble interior facets",
+    "Assemble system",
+]
+
+
+def assembly_time():
+    """Wall time recorded by the dolfin assembly timers since the last call
+
+    Returns:
+        float: the time (s)
+    """
+    total = 0
+    for task in assembly_tasks:
+        try:
+            total += f.timing(task, f.TimingClear.clear)[1]
+        except RuntimeError:  # no assembly of this kind yet
+            pass
+    return total
+
+
+class StepProfiler:
+    """Per-step instrumentation of a model
+
+    Attributes:
+        schedule (CycleSchedule): the cycle schedule (None for continuous
+            runs)
+        filename (str): the trace file (JSON lines)
+        times (collections.defaultdict): times of the current step by
+            category
+        attempts (list): number of iterations and convergence of the
+            solves of the current step
+    """
+
+    def __init__(self, filename, schedule=None) -> None:
+        """Inits StepProfiler
+
+        Args:
+            filename (str): the trace file. Lines are appended to it if it
+                exists (eg. resumed runs).
+            schedule (CycleSchedule, optional): the cycle schedule.
+                Defaults to None.
+        """
+        self.filename = filename
+        self.schedule = schedule
+        self.times = collections.defaultdict(float)
+        self.attempts = []
+        self.file = None
+
+    def attach(self, model):
+        """Wraps the methods of an initialised model. Can be called again
+        on the models replacing it (eg. after remeshing, see
+        adaptive_mesh.run_adaptive): the steps go to the same trace.
+
+        Args:
+            model (FESTIM.Simulation): the model
+        """
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+            self.file = open(self.filename, "a")
+
+        self.wrap(model, "iterate", self.profile_step)
+        self.wrap(model.h_transport_problem, "solve_once", self.profile_solve)
+        self.time(model.T, "update", "heat")
+        if model.dt.adaptive_stepsize is not None:
+            self.time(model.dt, "adapt", "adapt")
+        for bc in model.boundary_conditions:
+            expression = getattr(bc, "expression", None)
+            if isinstance(expression, f.UserExpression):
+                self.time(expression, "eval", "bc_eval")
+        for export in model.exports.exports:
+            name = "export:{}".format(export_name(export))
+            for method in ["compute", "write"]:
+                if hasattr(export, method):
+                    self.time(export, method, name)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @staticmethod
+    def wrap(obj, name, wrapper):
+        method = getattr(obj, name)
+
+        def wrapped(*args, **kwargs):
+            return wrapper(method, *args, **kwargs)
+
+        setattr(obj, name, wrapped)
+
+    def time(self, obj, name, category):
+        """Adds the wall time of obj.name to the category of the current
+        step"""
+
+        def timed(method, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.times[category] += time.perf_counter() - start
+
+        self.wrap(obj, name, timed)
+
+    def profile_solve(self, solve_once):
+        assembly_time()
+        start = time.perf_counter()
+        nb_it, converged = solve_once()
+        self.times["newton"] += time.perf_counter() - start
+        self.times["assembly"] += assembly_time()
+        self.attempts.append((int(nb_it), bool(converged)))
+        return nb_it, converged
+
+    def profile_step(self, iterate):
+        model = iterate.__self__
+        t = model.t
+        nb_rejected = getattr(model.dt, "nb_rejected", None)
+        start = time.perf_counter()
+        iterate()
+        wall = time.perf_counter() - start
+        if nb_rejected is None:
+            rejected = sum(not converged for _, converged in self.attempts)
+        else:
+            # CyclingStepsize counts both kinds of rejections
+            rejected = model.dt.nb_rejected - nb_rejected
+
+        if self.schedule is None:
+            cycle, phase = 0, "continuous"
+        else:
+            # the step belongs to the phase containing its middle
+            middle = (t + model.t) / 2
+            cycle, phase = self.schedule.cycle(middle), self.schedule.phase(middle)
+        record = {
+            "t": model.t,
+            "dt": model.t - t,
+            "cycle": int(cycle),
+            "phase": phase,
+            "wall": wall,
+            "times": dict(self.times),
+            "newton_iterations": [nb_it for nb_it, _ in self.attempts],
+            "rejected": rejected,
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.times.clear()
+        self.attempts = []
+
+
+def export_name(export):
+    """Name of an export in the trace
+
+    Args:
+        export (FESTIM.Export): the export
+
+    Returns:
+        str: the class and the base name of its file
+    """
+    filename = getattr(export, "binary_filename", None) or export.filename
+    if filename is None:
+        return type(export).__name__
+    return "{}({})".format(type(export).__name__, os.path.basename(filename))
+
+
+def read_trace(filename):
+    """Reads a trace file
+
+    Args:
+        filename (str): the trace file
+
+    Returns:
+        list: the records (dicts)
+    """
+    with open(filename) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def summarise(records):
+    """Aggregates the records of a trace per cycle phase
+
+    Args:
+        records (list): the records (see read_trace)
+
+    Returns:
+        dict: by phase, the number of steps and rejected attempts, the total
+            wall time and times by category (s), the mean number of Newton
+            iterations per solve and the min, mean and max dt (s)
+    """
+    by_phase = collections.defaultdict(list)
+    for record in records:
+        by_phase[record["phase"]].append(record)
+
+    summary = {}
+    for phase, phase_records in by_phase.items():
+        times = collections.defaultdict(float)
+        for record in phase_records:
+            for category, value in record["times"].items():
+                times[category] += value
+        iterations = [
+            n for record in phase_records for n in record["newton_iterations"]
+        ]
+        dts = [record["dt"] for record in phase_records]
+        summary[phase] = {
+            "nb_steps": len(phase_records),
+            "nb_rejected": sum(record["rejected"] for record in phase_records),
+            "wall": sum(record["wall"] for record in phase_records),
+            "times": dict(sorted(times.items(), key=lambda item: -item[1])),
+            "mean_newton_iterations": sum(iterations) / max(len(iterations), 1),
+            "dt_min": min(dts),
+            "dt_mean": sum(dts) / len(dts),
+            "dt_max": max(dts),
+        }
+    return summary
+
+
+def print_summary(summary):
+    """Prints a per phase report
+
+    Args:
+        summary (dict): the summary (see summarise)
+    """
+    for phase, values in summary.items():
+        print(
+            "{}: {} steps, {} rejected, {:.1f} s, {:.2f} Newton it./solve, "
+            "dt {:.2g}/{:.2g}/{:.2g} s (min/mean/max)".format(
+                phase,
+                values["nb_steps"],
+                values["nb_rejected"],
+                values["wall"],
+                values["mean_newton_iterations"],
+                values["dt_min"],
+                values["dt_mean"],
+                values["dt_max"],
+            )
+        )
+        for category, value in values["times"].items():
+            print(
+                "    {:<48}{:>10.2f} s{:>8.1%}".format(
+                    category, value, value / max(values["wall"], 1e-300)
+                )
+            )
+
+
+if __name__ == "__main__":
+    summary = summarise(read_trace(sys.argv[1]))
+    print_summary(summary)
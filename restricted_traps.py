@@ -0,0 +1,316 @@
+"""Hydrogen transport solves with the trap unknowns outside the trap
+materials pinned.
+
+FESTIM discretises every trap over the whole mesh: outside of its
+materials, a trap only has the equation (c_t - c_t_n) / dt = 0 and stays
+at its initial value (0) while still being part of the Newton system.
+dolfin 2019 has no function spaces restricted to subdomains within a mixed
+space, so these unknowns are pinned instead, like homogeneous Dirichlet
+dofs of the Newton update: their rows of the Jacobian are replaced by the
+identity and their residuals set to 0. RestrictedNewtonSolver is a dolfin
+NewtonSolver, so the results (eg. TotalVolume of the retention, see
+benchmark_suite.py "restricted_traps") are the same as with FESTIM's
+solver, in serial and in parallel.
+
+The Newton system keeps its full size: the number of unknowns, the
+assembly and the memory of the factorisation are unchanged, and zeroing
+the pinned residuals adds a little work per iteration. Pinning alone
+therefore saves neither time nor memory and is off by default in the
+cycling and continuous scripts (pin_inactive_traps). The solver is also
+the one of the modified Newton method (reuse_jacobian).
+
+The inactive unknowns are found from the cells of each process: with
+continuous trap elements, a dof on a material interface lying on a process
+boundary may be pinned although shared with an active cell of another
+process. The cycling and continuous scripts use DG traps.
+"""
+
+import time
+
+import fenics as f
+import numpy as np
+
+
+def material_ids(material):
+    ids = material.id
+    return ids if isinstance(ids, list) else [ids]
+
+
+def inactive_trap_dofs(h_transport_problem, volume_markers):
+    """Finds the unknowns of the traps outside of their materials
+
+    Args:
+        h_transport_problem (FESTIM.HTransportProblem): the initialised
+            hydrogen transport problem
+        volume_markers (fenics.MeshFunction): markers of the mesh cells
+
+    Returns:
+        numpy.ndarray: the local indices of the inactive unknowns
+    """
+    V = h_transport_problem.V
+    mesh = V.mesh()
+    markers = volume_markers.array()
+    inactive = []
+    for i, trap in enumerate(h_transport_problem.traps.traps):
+        dofmap = V.sub(i + 1).dofmap()
+        ids = [id for material in trap.materials for id in material_ids(material)]
+        active_cells = np.isin(markers, ids)
+        dofs = np.array([dofmap.cell_dofs(cell) for cell in range(mesh.num_cells())])
+        # dofs shared with an active cell (continuous elements) stay active
+        inactive.append(np.setdiff1d(dofs[~active_cells], dofs[active_cells]))
+    return np.unique(np.concatenate(inactive)).astype(np.int32)
+
+
+class PinnedTrapsProblem(f.NonlinearProblem):
+    """Hydrogen transport problem with the inactive trap unknowns pinned.
+    The Jacobian isn't reassembled while the solver reuses its
+    factorisation.
+
+    Attributes:
+        solver (RestrictedNewtonSolver): the solver
+        assembler (fenics.SystemAssembler): assembler of the Jacobian and
+            the residual (with the Dirichlet BCs of FESTIM)
+        pinned_local (numpy.ndarray): local indices of the pinned unknowns
+            owned by this process
+        pinned_global (numpy.ndarray): their global indices
+        assembled (bool): True if the Jacobian was assembled at this
+            iteration
+    """
+
+    def __init__(self, solver, inactive_dofs) -> None:
+        """Inits PinnedTrapsProblem
+
+        Args:
+            solver (RestrictedNewtonSolver): the solver
+            inactive_dofs (numpy.ndarray): local indices of the pinned
+                unknowns
+        """
+        f.NonlinearProblem.__init__(self)
+        self.solver = solver
+        problem = solver.problem
+        u = problem.u
+        J = problem.J
+        if J is None:
+            J = f.derivative(problem.F, u, f.TrialFunction(u.function_space()))
+        self.assembler = f.SystemAssembler(J, problem.F, problem.bcs)
+
+        dofmap = u.function_space().dofmap()
+        first, last = dofmap.ownership_range()
+        self.pinned_local = inactive_dofs[inactive_dofs < last - first]
+        self.pinned_global = dofmap.tabulate_local_to_global_dofs()[
+            self.pinned_local
+        ].astype(f.la_index_dtype())
+        self.assembled = False
+
+    def F(self, b, x):
+        self.assembler.assemble(b, x)
+        values = b.get_local()
+        values[self.pinned_local] = 0
+        b.set_local(values)
+        b.apply("insert")
+
+    def J(self, A, x):
+        solver = self.solver
+        if solver.factorised_for is not None:
+            solver.nb_reused += 1
+            return
+        start = time.perf_counter()
+        self.assembler.assemble(A)
+        A.ident(self.pinned_global)
+        solver.factorisation_time += time.perf_counter() - start
+        self.assembled = True
+        if solver.reuse_jacobian:
+            solver.factorised_for = solver.current_key
+
+
+class RestrictedNewtonSolver(f.NewtonSolver):
+    """dolfin NewtonSolver of the hydrogen transport problem with the
+    inactive trap unknowns pinned. Same parameters and convergence
+    criterion (residual) as the solver of FESTIM, with a direct solver.
+
+    With reuse_jacobian, the solver is a modified Newton method: the
+    factorised Jacobian is kept across iterations and time steps and only
+    reassembled and refactorised when dt changes, when a new phase of the
+    cycle schedule of the stepsize starts, or when an iteration reduces
+    the residual by less than contraction_max.
+
+    Attributes:
+        model (FESTIM.Simulation): the model
+        problem (FESTIM.HTransportProblem): the hydrogen transport problem
+        nonlinear_problem (PinnedTrapsProblem): the assembled problem
+        lu_solver (fenics.PETScLUSolver): the direct solver
+        nb_removed (int): number of pinned unknowns (global)
+        reuse_jacobian (bool): True for the modified Newton method
+        contraction_max (float): maximum ratio of two successive residuals
+            before the Jacobian is refreshed
+        factorised_for (tuple): step key of the current factorisation, None
+            if it has to be refreshed
+        current_key (tuple): step key of the current solve
+        nb_factorisations (int): number of factorisations
+        nb_reused (int): number of iterations reusing a factorisation
+        factorisation_time (float): wall time spent assembling and
+            factorising the Jacobian (s)
+    """
+
+    def __init__(
+        self, model, inactive_dofs, reuse_jacobian=False, contraction_max=0.5
+    ) -> None:
+        """Inits RestrictedNewtonSolver
+
+        Args:
+            model (FESTIM.Simulation): the initialised model
+            inactive_dofs (numpy.ndarray): local indices of the pinned
+                unknowns
+            reuse_jacobian (bool, optional): if True, the factorised
+                Jacobian is reused across iterations and steps. Defaults to
+                False.
+            contraction_max (float, optional): maximum ratio of two
+                successive residuals with a reused Jacobian. Defaults to 0.5.
+        """
+        comm = model.mesh.mesh.mpi_comm()
+        settings = model.h_transport_problem.settings
+        linear_solver = f.PETScLUSolver(comm, settings.linear_solver or "default")
+        f.NewtonSolver.__init__(self, comm, linear_solver, f.PETScFactory.instance())
+        self.model = model
+        self.problem = model.h_transport_problem
+        self.lu_solver = linear_solver
+        self.parameters["error_on_nonconvergence"] = False
+        self.parameters["absolute_tolerance"] = settings.absolute_tolerance
+        self.parameters["relative_tolerance"] = settings.relative_tolerance
+        self.parameters["maximum_iterations"] = settings.maximum_iterations
+
+        self.nonlinear_problem = PinnedTrapsProblem(self, inactive_dofs)
+        self.nb_removed = int(f.MPI.sum(comm, self.nonlinear_problem.pinned_local.size))
+        self.reuse_jacobian = reuse_jacobian
+        self.contraction_max = contraction_max
+
+        self.factorised_for = None
+        self.current_key = None
+        self.previous_residual = None
+        self.nb_factorisations = 0
+        self.nb_reused = 0
+        self.factorisation_time = 0
+
+    def step_key(self):
+        """Identifies the steps that can share a factorisation
+
+        Returns:
+            tuple: dt and, if the stepsize has a schedule, the cycle and
+                phase index of the current step
+        """
+        dt = float(self.model.dt.value)
+        schedule = getattr(self.model.dt, "schedule", None)
+        if schedule is None:
+            return (dt,)
+        middle = self.model.t - dt / 2
+        return (dt, schedule.cycle(middle), schedule.phase_index(middle))
+
+    def solver_setup(self, A, P, problem, iteration):
+        """Factorises the Jacobian if it was reassembled, else keeps the
+        current factorisation"""
+        if not self.nonlinear_problem.assembled:
+            return
+        start = time.perf_counter()
+        self.lu_solver.set_operator(A)
+        self.lu_solver.ksp().setUp()
+        self.factorisation_time += time.perf_counter() - start
+        self.nb_factorisations += 1
+        self.nonlinear_problem.assembled = False
+
+    def converged(self, r, problem, iteration):
+        """Residual criterion of dolfin, refreshing the Jacobian when the
+        residual decreases too slowly"""
+        residual = r.norm("l2")
+        if iteration > 0 and residual > self.contraction_max * self.previous_residual:
+            # the Jacobian is too far from the current one
+            self.factorised_for = None
+        self.previous_residual = residual
+        return f.NewtonSolver.converged(self, r, problem, iteration)
+
+    def solve_once(self):
+        """Solves the nonlinear problem (replaces
+        HTransportProblem.solve_once)
+
+        Returns:
+            int, bool: number of iterations for reaching convergence, True if
+                converged else False
+        """
+        u = self.problem.u
+        for bc in self.problem.bcs:
+            bc.apply(u.vector())
+
+        self.current_key = self.step_key()
+        if self.current_key != self.factorised_for:
+            self.factorised_for = None
+        nb_it, converged = self.solve(self.nonlinear_problem, u.vector())
+        return nb_it, converged
+
+    def carry_over_statistics(self, previous):
+        """Adds the counters of a previous solver (eg. of the model before
+        remeshing) to the counters of this one
+
+        Args:
+            previous (RestrictedNewtonSolver): the previous solver
+        """
+        self.nb_factorisations += previous.nb_factorisations
+        self.nb_reused += previous.nb_reused
+        self.factorisation_time += previous.factorisation_time
+
+    def statistics(self):
+        """Counts of factorisations and estimated wall time saved by
+        reusing them
+
+        Returns:
+            dict: the number of factorisations, of iterations reusing one,
+                the time spent factorising and the estimated time saved (s)
+        """
+        mean_time = self.factorisation_time / max(self.nb_factorisations, 1)
+        return {
+            "nb_factorisations": self.nb_factorisations,
+            "nb_reused": self.nb_reused,
+            "factorisation_time": self.factorisation_time,
+            "time_saved": self.nb_reused * mean_time,
+        }
+
+
+def restrict_traps(model, reuse_jacobian=False, contraction_max=0.5):
+    """Makes a model solve the hydrogen transport problem with the trap
+    unknowns outside of the trap materials pinned. Must be called before
+    the model is initialised.
+
+    Args:
+        model (FESTIM.Simulation): the model
+        reuse_jacobian (bool, optional): if True, the factorised Jacobian is
+            reused across iterations and steps (modified Newton). Defaults
+            to False.
+        contraction_max (float, optional): maximum ratio of two successive
+            residuals with a reused Jacobian. Defaults to 0.5.
+
+    Returns:
+        dict: holds the RestrictedNewtonSolver under "solver" once the model
+            is initialised
+    """
+    initialise = model.initialise
+    restricted = {}
+
+    def initialise_and_restrict():
+        initialise()
+        problem = model.h_transport_problem
+        inactive = inactive_trap_dofs(problem, model.mesh.volume_markers)
+        solver = RestrictedNewtonSolver(
+            model,
+            inactive,
+            reuse_jacobian=reuse_jacobian,
+            contraction_max=contraction_max,
+        )
+        problem.solve_once = solver.solve_once
+        restricted["solver"] = solver
+        if f.MPI.rank(model.mesh.mesh.mpi_comm()) == 0:
+            print(
+                "{} of {} unknowns pinned in the Newton system".format(
+                    solver.nb_removed, problem.u.vector().size()
+                )
+            )
+
+    model.initialise = initialise_and_restrict
+    return restricted
@@ -0,0 +1,1182 @@
+"""NumPy/SciPy finite volume engine for fast 1D screening of scenarios.
+
+Same model as main.py with the boundary conditions of cycling.py and
+continuous.py (three materials, trap_conglo and trap_w2, implantation
+Dirichlet, recombination at the coolant, heat flux, convective cooling and
+the cubic thermal properties of material_properties.py), without FEniCS:
+    - vertex-centred finite volumes on the vertices of the mesh of main.py,
+      equivalent to the FESTIM discretisation (CG1 mobile concentration and
+      temperature, DG1 traps) with a lumped mass matrix. The traps have one
+      value per half cell and only exist in their materials.
+    - the right hand side and its sparse Jacobian are vectorised over the
+      cells and over a batch of scenarios, integrated together as a single
+      system
+    - backward Euler in time as FESTIM, with the phase-aware stepsizes of
+      CyclingStepsize: the steps end on the phase boundaries, where the
+      fluxes have a kink, and the stepsize follows the error on the
+      retention
+    - modified Newton: the trap sites are eliminated from the linear
+      systems, which are then banded (LAPACK) once numbered vertex by vertex
+    - cycling scenarios start at 323 K, continuous ones (constant fluxes)
+      use the steady state temperature as in continuous.py
+
+    python screening.py
+validates the engine against the derived quantities of the results/
+folders (see validation_tolerances), and
+
+    python screening.py --heat-flux 5e6 1e7 --part-flux 5e21 1e22 \
+        --nb-cycles 10 --output screening.csv
+screens all the combinations of fluxes (cycle_schedule.default_timing).
+
+The model parameters are those of main.py, from model_parameters.py.
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.linalg.lapack import dgbtrf, dgbtrs
+from scipy.sparse.linalg import spsolve
+
+from cycle_schedule import CycleSchedule, default_timing
+from derived_quantities_reader import read_derived_quantities
+from material_properties import properties
+from model_parameters import (
+    convection_parameters as convection,
+    cu_parameters,
+    cucrzr_parameters,
+    implantation_depth,
+    initial_temperature,
+    mesh_parameters,
+    recombination_parameters as recombination,
+    trap_conglo_parameters,
+    trap_w2_parameters,
+    tungsten_parameters,
+)
+from postprocessing import cycle_aggregates
+
+k_B = 8.6173303e-5  # Boltzmann constant (eV/K), as in FESTIM
+
+material_names = ["W", "Cu", "CuCrZr"]
+materials = [
+    dict(name=name, **parameters)
+    for name, parameters in zip(
+        material_names, [tungsten_parameters, cu_parameters, cucrzr_parameters]
+    )
+]
+
+
+def split_trap(parameters, names):
+    """Parameters of a trap in each of its materials
+
+    Args:
+        parameters (dict): the trap parameters of model_parameters.py, with
+            lists over the materials for a trap in several materials
+        names (list): the names of the materials of the trap
+
+    Returns:
+        dict: dicts of k_0, E_k, p_0, E_p and density by material name
+    """
+    return {
+        name: {
+            key: value[i] if isinstance(value, list) else value
+            for key, value in parameters.items()
+        }
+        for i, name in enumerate(names)
+    }
+
+
+# parameters of each trap in each of its materials
+traps = [
+    split_trap(trap_conglo_parameters, material_names),
+    split_trap(trap_w2_parameters, ["W"]),
+]
+
+# surface 1 (x = 0)
+implantation = dict(
+    R_p=implantation_depth,
+    D_0=tungsten_parameters["D_0"],
+    E_D=tungsten_parameters["E_D"],
+)
+
+# stepsizes of cycling.py (CyclingStepsize) and continuous.py (Stepsize),
+# but controlled by the error on the retention as CyclingStepsize with
+# error_relative_tolerance: the Newton iterations of the modified Newton
+# method don't measure the difficulty of a step
+stepsizes_max = {"rampup": 5, "plateau": 20, "rampdown": 5, "rest": 50}
+stepsizes_restart = {"rampup": 0.5, "plateau": 2, "rampdown": 0.5, "rest": 2}
+initial_stepsize = {"cycling": 0.1, "continuous": 1}
+stepsize_change_ratio = 1.1
+error_relative_tolerance = 1e-2
+dt_min = 1e-3
+
+# validate: largest relative difference with the FESTIM inventory over the
+# trusted windows, ie. the whole continuous runs and, in the complete cycles
+# of the cycling runs, the rests from settling_time (s) after their start.
+# The inventory carried from cycle to cycle agrees within 3 %, the
+# transients of the ramp-ups (fast outgassing), plateaus and ramp-downs
+# differ by up to 40 %.
+validation_tolerances = {"continuous": 0.02, "cycling": 0.04}
+settling_time = 100
+
+# Newton solver: converged when the updates are below the absolute
+# tolerances plus relative_tolerance times the solution
+temperature_tolerance = 1e-3
+concentration_tolerance = 1e10
+relative_tolerance = 1e-6
+maximum_iterations = 30
+# the factorised Jacobian is refreshed when an iteration reduces the update
+# by less than this ratio (as in restricted_traps.py)
+contraction_max = 0.5
+
+
+def make_vertices(initial_number_of_cells, size, refinements=None):
+    """Vertices of F.MeshFromRefinements: the cells whose midpoint is left
+    of each refinement point are halved until the mesh has enough cells
+
+    Args:
+        initial_number_of_cells (int): initial number of cells
+        size (float): size of the mesh (m)
+        refinements (list, optional): list of dicts {"x": ..., "cells": ...}.
+            Defaults to None (no refinement).
+
+    Returns:
+        numpy.ndarray: the vertices (m)
+    """
+    x = np.linspace(0, size, num=initial_number_of_cells + 1)
+    nb_cells = initial_number_of_cells
+    for refinement in refinements or []:
+        while x.size - 1 < nb_cells + refinement["cells"]:
+            midpoints = (x[:-1] + x[1:]) / 2
+            refined = midpoints < refinement["x"]
+            if not refined.any():
+                raise ValueError("Infinite loop: no cell to refine")
+            x = np.sort(np.concatenate([x, midpoints[refined]]))
+        nb_cells = x.size - 1
+    return x
+
+
+def cubic(coefficients, T):
+    a, b, c, d = coefficients
+    return ((a * T + b) * T + c) * T + d
+
+
+def cubic_derivative(coefficients, T):
+    a, b, c, _ = coefficients
+    return (3 * a * T + 2 * b) * T + c
+
+
+class Scenario:
+    """Particle and heat fluxes of a scenario, piecewise linear in time
+
+    Attributes:
+        heat_flux (float): heat flux during the plateau (W/m2)
+        part_flux (float): particle flux during the plateau (H/m2/s)
+        schedule (CycleSchedule): the cycle schedule, None for a continuous
+            exposure
+        final_time (float): the final time (s)
+        steady_temperature (bool): True if T is the steady state
+            temperature (continuous exposure)
+        t_data (numpy.ndarray): the times of the profiles (s)
+        heat_data (numpy.ndarray): the heat flux at t_data (W/m2)
+        part_data (numpy.ndarray): the particle flux at t_data (H/m2/s)
+    """
+
+    def __init__(self, heat_flux, part_flux, schedule=None, final_time=None):
+        """Inits Scenario
+
+        Args:
+            heat_flux (float): heat flux during the plateau (W/m2)
+            part_flux (float): particle flux during the plateau (H/m2/s)
+            schedule (CycleSchedule, optional): the cycle schedule. None for
+                a continuous exposure. Defaults to None.
+            final_time (float, optional): the final time (s). Defaults to
+                the end of the schedule, required for continuous exposures.
+        """
+        self.heat_flux = heat_flux
+        self.part_flux = part_flux
+        self.schedule = schedule
+        if schedule is None:
+            self.final_time = final_time
+            self.steady_temperature = True
+            self.t_data = np.array([0, final_time], dtype=float)
+            self.heat_data = np.full(2, heat_flux, dtype=float)
+            self.part_data = np.full(2, part_flux, dtype=float)
+        else:
+            self.final_time = schedule.final_time if final_time is None else final_time
+            self.steady_temperature = False
+            self.t_data = schedule.t_data
+            self.heat_data = schedule.make_data_y([0, heat_flux, heat_flux, 0])
+            self.part_data = schedule.make_data_y([0, part_flux, part_flux, 0])
+
+    def fluxes(self, t):
+        """Heat and particle fluxes at time t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            float, float: the heat flux (W/m2) and particle flux (H/m2/s)
+        """
+        return (
+            np.interp(t, self.t_data, self.heat_data),
+            np.interp(t, self.t_data, self.part_data),
+        )
+
+
+class FiniteVolumeModel:
+    """Vertex-centred finite volume discretisation of the 1D model for a
+    batch of scenarios.
+
+    The state of a scenario is [T (vertices), c_m (vertices but the first,
+    where the implantation Dirichlet applies), c_t (trap sites)], a trap
+    site being a half cell in one of the materials of a trap. The states of
+    the batch are concatenated. As in FESTIM, the trapped concentrations
+    are in the time derivative of the mobile concentration equation,
+    dc_m/dt + sum(dc_t/dt) = div(D grad(c_m)), hence a mass matrix.
+
+    Attributes:
+        scenarios (list): the Scenario objects
+        x (numpy.ndarray): the vertices (m)
+        h (numpy.ndarray): the cell sizes (m)
+        cell_material (numpy.ndarray): the material index of each cell
+        volume (numpy.ndarray): the control volume of each vertex (m)
+        site_vertex (numpy.ndarray): the vertex of each trap site
+        site_weight (numpy.ndarray): the size of each trap site (m)
+        nb_unknowns (int): number of unknowns per scenario
+    """
+
+    def __init__(self, scenarios) -> None:
+        """Inits FiniteVolumeModel
+
+        Args:
+            scenarios (list): the Scenario objects
+        """
+        self.scenarios = scenarios
+        self.steady = np.array([s.steady_temperature for s in scenarios])
+
+        x = make_vertices(**mesh_parameters)
+        self.x, self.h = x, np.diff(x)
+        self.nb_vertices = nv = x.size
+        midpoints = (x[:-1] + x[1:]) / 2
+        self.cell_material = np.zeros(midpoints.size, dtype=int)
+        # first material whose borders contain the midpoint, as FESTIM
+        for i, material in reversed(list(enumerate(materials))):
+            start, end = material["borders"]
+            self.cell_material[(start <= midpoints) & (midpoints <= end)] = i
+        names = [material["name"] for material in materials]
+
+        self.D_0 = np.array([m["D_0"] for m in materials])[self.cell_material]
+        self.E_D = np.array([m["E_D"] for m in materials])[self.cell_material]
+        self.thermal_cond = np.array(
+            [properties[name]["thermal_cond"].coefficients for name in names]
+        )[self.cell_material].T
+        self.rho_cp = np.array(
+            [properties[name]["rho_cp"].coefficients for name in names]
+        )[self.cell_material].T
+        self.volume = np.zeros(nv)
+        self.volume[:-1] += self.h / 2
+        self.volume[1:] += self.h / 2
+
+        # trap sites: both halves of each cell of the materials of a trap
+        cells = np.arange(self.h.size)
+        site_cell, site_vertex, site_parameters = [], [], []
+        for trap in traps:
+            for name, parameters in trap.items():
+                trap_cells = cells[self.cell_material == names.index(name)]
+                for vertices in [trap_cells, trap_cells + 1]:
+                    site_cell.append(trap_cells)
+                    site_vertex.append(vertices)
+                    site_parameters.append(
+                        np.tile(
+                            [parameters[key] for key in ["k_0", "E_k", "p_0", "E_p"]]
+                            + [parameters["density"]],
+                            (trap_cells.size, 1),
+                        )
+                    )
+        site_cell = np.concatenate(site_cell)
+        self.site_vertex = np.concatenate(site_vertex)
+        self.site_weight = self.h[site_cell] / 2
+        self.site_material = self.cell_material[site_cell]
+        self.k_0, self.E_k, self.p_0, self.E_p, self.density = np.concatenate(
+            site_parameters
+        ).T
+        self.nb_sites = ns = self.site_vertex.size
+
+        # scatters the site concentrations (times their size) to the vertices
+        self.site_to_vertex = sparse.csr_matrix(
+            (self.site_weight, (self.site_vertex, np.arange(ns))), shape=(nv, ns)
+        )
+        # the mass matrix couples c_m to the sites of its control volume
+        free = self.site_vertex > 0
+        self.coupling_rows = nv + self.site_vertex[free] - 1
+        self.coupling_sites = np.flatnonzero(free)
+        self.coupling = self.site_weight[free] / self.volume[self.site_vertex[free]]
+        self.site_to_mobile = sparse.csr_matrix(
+            (self.coupling, (self.coupling_rows - nv, self.coupling_sites)),
+            shape=(nv - 1, ns),
+        )
+
+        # retention of each material: trapezoidal rule on the cells
+        retention_mobile = np.zeros((len(materials), nv))
+        np.add.at(retention_mobile, (self.cell_material, cells), self.h / 2)
+        np.add.at(retention_mobile, (self.cell_material, cells + 1), self.h / 2)
+        self.retention_mobile = retention_mobile
+        self.retention_traps = np.zeros((len(materials), ns))
+        self.retention_traps[self.site_material, np.arange(ns)] = self.site_weight
+
+        self.nb_unknowns = 2 * nv - 1 + ns
+        self.T_slice = slice(0, nv)
+        self.c_slice = slice(nv, 2 * nv - 1)
+        self.s_slice = slice(2 * nv - 1, self.nb_unknowns)
+
+        self.absolute_tolerance = np.tile(
+            np.concatenate(
+                [
+                    np.full(nv, temperature_tolerance),
+                    np.full(nv - 1 + ns, concentration_tolerance),
+                ]
+            ),
+            len(scenarios),
+        )
+        self.concentrations = np.tile(
+            np.arange(self.nb_unknowns) >= self.c_slice.start, len(scenarios)
+        )
+
+        # the trap sites are eliminated from the Newton systems (static
+        # condensation): a site only depends on T and c of its vertex and on
+        # no other site, and only c of its vertex depends on it (mass)
+        y = np.zeros((len(scenarios), self.nb_unknowns))
+        y[:, self.T_slice] = initial_temperature
+        rows, cols, _ = self.jacobian(0, y.ravel())
+        nu = self.s_slice.start  # number of T and c unknowns
+        site_row, site_col = rows >= nu, cols >= nu
+        if np.any(site_col & ~(site_row & (rows == cols))):
+            raise ValueError("a trap site is in the rhs of another unknown")
+        self.unknown_entries = ~site_row & ~site_col
+        self.site_entries = site_row & site_col
+        self.dependence_entries = site_row & ~site_col  # sites with T and c
+        scenario = np.arange(len(scenarios))[:, None]
+
+        def batch_index(index, offset, size):
+            # indices in the batch of the entries of each scenario
+            return (scenario * size + index - offset).ravel()
+
+        self.site_index = batch_index(rows[self.site_entries], nu, ns)
+        self.batch_coupling_rows = batch_index(self.coupling_rows, 0, nu)
+        self.batch_coupling_sites = batch_index(self.coupling_sites, 0, ns)
+        self.dependence_sites = batch_index(rows[self.dependence_entries], nu, ns)
+        self.dependence_cols = batch_index(cols[self.dependence_entries], 0, nu)
+        # fill-in of the elimination: each dependence of a site coupled to c
+        coupling = np.full(len(scenarios) * ns, -1)
+        coupling[self.batch_coupling_sites] = np.arange(self.batch_coupling_sites.size)
+        coupling = coupling[self.dependence_sites]
+        self.fill_dependence = np.flatnonzero(coupling >= 0)
+        self.fill_coupling = coupling[self.fill_dependence]
+
+        # numbered vertex by vertex, T and c of the batch form a banded
+        # system: (T, c) of vertex 0, of vertex 1...
+        vertex = np.concatenate([np.arange(nv), np.arange(1, nv)])
+        order = np.argsort(vertex, kind="stable")
+        self.order = (scenario * nu + order).ravel()
+        self.position = np.empty_like(self.order)
+        self.position[self.order] = np.arange(self.order.size)
+        band_rows = self.position[
+            np.concatenate(
+                [
+                    batch_index(rows[self.unknown_entries], 0, nu),
+                    self.batch_coupling_rows[self.fill_coupling],
+                ]
+            )
+        ]
+        band_cols = self.position[
+            np.concatenate(
+                [
+                    batch_index(cols[self.unknown_entries], 0, nu),
+                    self.dependence_cols[self.fill_dependence],
+                ]
+            )
+        ]
+        self.bandwidth = bandwidth = np.abs(band_rows - band_cols).max()
+        # flat indices of the entries in the LAPACK band storage, which has
+        # bandwidth more rows for the fill-in of the pivoting
+        size = self.order.size
+        self.band_shape = (3 * bandwidth + 1, size)
+        self.band_entries = (2 * bandwidth + band_rows - band_cols) * size + band_cols
+        self.band_diagonal = 2 * bandwidth * size + np.arange(size)
+
+    def fluxes(self, t):
+        """Heat and particle fluxes of the scenarios at time t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: the heat fluxes (W/m2) and
+                particle fluxes (H/m2/s)
+        """
+        fluxes = np.array([scenario.fluxes(t) for scenario in self.scenarios])
+        return fluxes[:, 0], fluxes[:, 1]
+
+    def unpack(self, t, y):
+        """Splits the state of the batch
+
+        Args:
+            t (float): the time (s)
+            y (numpy.ndarray): the state of the batch
+
+        Returns:
+            tuple: T, c (with the Dirichlet value on the first vertex) and
+                the trap sites, (nb_scenarios, ...) arrays, the heat fluxes
+                and the derivative of the Dirichlet value with respect to T
+        """
+        y = y.reshape(len(self.scenarios), self.nb_unknowns)
+        T = y[:, self.T_slice]
+        s = y[:, self.s_slice]
+        heat_flux, part_flux = self.fluxes(t)
+        # c = phi * R_p / D(T)
+        E_D = implantation["E_D"]
+        c_0 = (
+            part_flux
+            * implantation["R_p"]
+            / (implantation["D_0"] * np.exp(-E_D / k_B / T[:, 0]))
+        )
+        dc_0 = -c_0 * E_D / (k_B * T[:, 0] ** 2)
+        c = np.concatenate([c_0[:, None], y[:, self.c_slice]], axis=1)
+        return T, c, s, heat_flux, dc_0
+
+    def heat_rates(self, T, heat_flux):
+        """Heat balance of the control volumes
+
+        Args:
+            T (numpy.ndarray): the temperature (K)
+            heat_flux (numpy.ndarray): the heat fluxes (W/m2)
+
+        Returns:
+            numpy.ndarray: the net heat flows (W/m2)
+        """
+        T_mid = (T[:, :-1] + T[:, 1:]) / 2
+        q = cubic(self.thermal_cond, T_mid) * np.diff(T, axis=1) / self.h
+        rates = np.zeros_like(T)
+        rates[:, :-1] += q
+        rates[:, 1:] -= q
+        rates[:, 0] += heat_flux
+        rates[:, -1] -= convection["h_coeff"] * (T[:, -1] - convection["T_ext"])
+        return rates
+
+    def heat_capacity(self, T, derivative=False):
+        """Heat capacity of the control volumes
+
+        Args:
+            T (numpy.ndarray): the temperature (K)
+            derivative (bool, optional): if True, returns the derivative
+                with respect to T instead. Defaults to False.
+
+        Returns:
+            numpy.ndarray: the heat capacities (J/m2/K)
+        """
+        function = cubic_derivative if derivative else cubic
+        capacity = np.zeros_like(T)
+        capacity[:, :-1] += self.h / 2 * function(self.rho_cp, T[:, :-1])
+        capacity[:, 1:] += self.h / 2 * function(self.rho_cp, T[:, 1:])
+        return capacity
+
+    def trap_rates(self, T, c, s):
+        T_site, c_site = T[:, self.site_vertex], c[:, self.site_vertex]
+        k = self.k_0 * np.exp(-self.E_k / k_B / T_site)
+        p = self.p_0 * np.exp(-self.E_p / k_B / T_site)
+        return k * c_site * (self.density - s) - p * s, k, p, T_site, c_site
+
+    def rhs(self, t, y):
+        """Right hand side of mass @ dy/dt = rhs (see mass)
+
+        Args:
+            t (float): the time (s)
+            y (numpy.ndarray): the state of the batch
+
+        Returns:
+            numpy.ndarray: the right hand side
+        """
+        T, c, s, heat_flux, _ = self.unpack(t, y)
+        dy = np.empty((len(self.scenarios), self.nb_unknowns))
+
+        dT = self.heat_rates(T, heat_flux) / self.heat_capacity(T)
+        dT[self.steady] = 0
+        dy[:, self.T_slice] = dT
+
+        T_mid = (T[:, :-1] + T[:, 1:]) / 2
+        D = self.D_0 * np.exp(-self.E_D / k_B / T_mid)
+        j = D * np.diff(c, axis=1) / self.h
+        rates = np.zeros_like(c)
+        rates[:, :-1] += j
+        rates[:, 1:] -= j
+        Kr = recombination["Kr_0"] * np.exp(-recombination["E_Kr"] / k_B / T[:, -1])
+        rates[:, -1] -= Kr * c[:, -1] ** 2
+        dy[:, self.c_slice] = rates[:, 1:] / self.volume[1:]
+
+        dy[:, self.s_slice] = self.trap_rates(T, c, s)[0]
+        return dy.ravel()
+
+    def jacobian(self, t, y):
+        """Entries of the Jacobian of rhs for each scenario of the batch (the
+        Jacobian of the batch is block diagonal). The rows and columns don't
+        depend on the state and may be repeated (the values add up).
+
+        Args:
+            t (float): the time (s)
+            y (numpy.ndarray): the state of the batch
+
+        Returns:
+            numpy.ndarray, numpy.ndarray, numpy.ndarray: the rows and columns
+                in the state of a scenario and the values
+                (nb_scenarios, nb_entries)
+        """
+        T, c, s, heat_flux, dc_0 = self.unpack(t, y)
+        nv, ns = self.nb_vertices, self.nb_sites
+        cells = np.arange(nv - 1)
+        # columns of the full variables (T, c on all the vertices, sites),
+        # c on the first vertex being a function of T on the first vertex
+        T_col = np.arange(nv)
+        c_col = np.concatenate([[0], nv + np.arange(nv - 1)])
+        s_col = 2 * nv - 1 + np.arange(ns)
+        rows, cols, values = [], [], []
+
+        def add(row, col, value, chain=None):
+            # chain: True where the column is c on the first vertex
+            if chain is not None and chain.any():
+                value = np.where(chain, value * dc_0[:, None], value)
+            rows.append(np.broadcast_to(row, value.shape[1:]))
+            cols.append(np.broadcast_to(col, value.shape[1:]))
+            values.append(value)
+
+        # heat: dT/dt = rates / capacity
+        T_mid = (T[:, :-1] + T[:, 1:]) / 2
+        dT_cell = np.diff(T, axis=1) / self.h
+        conductivity = cubic(self.thermal_cond, T_mid)
+        d_conductivity = cubic_derivative(self.thermal_cond, T_mid)
+        dq_left = d_conductivity / 2 * dT_cell - conductivity / self.h
+        dq_right = d_conductivity / 2 * dT_cell + conductivity / self.h
+        capacity = self.heat_capacity(T)
+        transient = ~self.steady[:, None]
+        for row, sign in [(cells, 1), (cells + 1, -1)]:
+            scale = transient * sign / capacity[:, row]
+            add(T_col[row], T_col[cells], scale * dq_left)
+            add(T_col[row], T_col[cells + 1], scale * dq_right)
+        rates = self.heat_rates(T, heat_flux)
+        diagonal = -rates * self.heat_capacity(T, derivative=True) / capacity**2
+        diagonal[:, -1] -= convection["h_coeff"] / capacity[:, -1]
+        add(T_col, T_col, transient * diagonal)
+
+        # mobile: (diffusion - recombination) / volume
+        D = self.D_0 * np.exp(-self.E_D / k_B / T_mid)
+        dD = D * self.E_D / (k_B * T_mid**2)
+        dj_dT = dD / 2 * np.diff(c, axis=1) / self.h
+        for row, sign in [(cells, 1), (cells + 1, -1)]:
+            free = row > 0
+            r = c_col[row[free]]
+            scale = sign / self.volume[row[free]]
+            add(
+                r,
+                c_col[cells[free]],
+                scale * -D[:, free] / self.h[free],
+                cells[free] == 0,
+            )
+            add(r, c_col[cells[free] + 1], scale * D[:, free] / self.h[free])
+            add(r, T_col[cells[free]], scale * dj_dT[:, free])
+            add(r, T_col[cells[free] + 1], scale * dj_dT[:, free])
+        Kr = recombination["Kr_0"] * np.exp(-recombination["E_Kr"] / k_B / T[:, -1])
+        scale = 1 / self.volume[-1]
+        add(c_col[-1:], c_col[-1:], (-2 * Kr * c[:, -1] * scale)[:, None])
+        dKr = Kr * recombination["E_Kr"] / (k_B * T[:, -1] ** 2)
+        add(c_col[-1:], T_col[-1:], (-dKr * c[:, -1] ** 2 * scale)[:, None])
+
+        # trap sites: ds/dt = R
+        R, k, p, T_site, c_site = self.trap_rates(T, c, s)
+        dR_dc = k * (self.density - s)
+        dR_ds = -k * c_site - p
+        dR_dT = (k * self.E_k * c_site * (self.density - s) - p * self.E_p * s) / (
+            k_B * T_site**2
+        )
+        chain = self.site_vertex == 0
+        add(s_col, c_col[self.site_vertex], dR_dc, chain)
+        add(s_col, s_col, dR_ds)
+        add(s_col, T_col[self.site_vertex], dR_dT)
+
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(values, 1)
+
+    def steady_temperature(self, tolerance=1e-10, nb_iterations_max=50):
+        """Steady state temperature of the scenarios at t = 0 (Newton)
+
+        Args:
+            tolerance (float, optional): relative tolerance on the update.
+                Defaults to 1e-10.
+            nb_iterations_max (int, optional): maximum number of
+                iterations. Defaults to 50.
+
+        Returns:
+            numpy.ndarray: the temperatures (nb_scenarios, vertices)
+        """
+        heat_flux = self.fluxes(0)[0]
+        T = np.full((len(self.scenarios), self.nb_vertices), initial_temperature, float)
+        cells = np.arange(self.nb_vertices - 1)
+        for i in range(nb_iterations_max):
+            rates = self.heat_rates(T, heat_flux)
+            T_mid = (T[:, :-1] + T[:, 1:]) / 2
+            dT_cell = np.diff(T, axis=1) / self.h
+            conductivity = cubic(self.thermal_cond, T_mid)
+            d_conductivity = cubic_derivative(self.thermal_cond, T_mid)
+            dq_left = d_conductivity / 2 * dT_cell - conductivity / self.h
+            dq_right = d_conductivity / 2 * dT_cell + conductivity / self.h
+            change = 0
+            for scenario in range(len(self.scenarios)):
+                jacobian = sparse.csc_matrix(
+                    (
+                        np.concatenate(
+                            [
+                                dq_left[scenario],
+                                dq_right[scenario],
+                                -dq_left[scenario],
+                                -dq_right[scenario],
+                                [-convection["h_coeff"]],
+                            ]
+                        ),
+                        (
+                            np.concatenate(
+                                [cells, cells, cells + 1, cells + 1, [cells[-1] + 1]]
+                            ),
+                            np.concatenate(
+                                [cells, cells + 1, cells, cells + 1, [cells[-1] + 1]]
+                            ),
+                        ),
+                    ),
+                    shape=(self.nb_vertices, self.nb_vertices),
+                )
+                update = spsolve(jacobian, -rates[scenario])
+                T[scenario] += update
+                change = max(change, np.abs(update).max() / T[scenario].max())
+            if change < tolerance:
+                return T
+        raise RuntimeError("steady state temperature didn't converge")
+
+    def initial_state(self):
+        """Initial state of the batch: 323 K (steady state temperature for
+        continuous scenarios) and no hydrogen
+
+        Returns:
+            numpy.ndarray: the state
+        """
+        y = np.zeros((len(self.scenarios), self.nb_unknowns))
+        y[:, self.T_slice] = initial_temperature
+        if self.steady.any():
+            y[self.steady, self.T_slice] = self.steady_temperature()[self.steady]
+        return y.ravel()
+
+    def retention(self, t, y):
+        """Retention in each material
+
+        Args:
+            t (float): the time (s)
+            y (numpy.ndarray): the state of the batch at time t
+
+        Returns:
+            numpy.ndarray: the retention (H/m2), (nb_scenarios, 3)
+        """
+        T, c, s, _, _ = self.unpack(t, y)
+        return c @ self.retention_mobile.T + s @ self.retention_traps.T
+
+    def retention_norms(self, y):
+        """L2 norms of the retention (mobile and trapped concentrations) of
+        the scenarios, without the Dirichlet value
+
+        Args:
+            y (numpy.ndarray): the state of the batch, or a difference of
+                states
+
+        Returns:
+            numpy.ndarray: the norms (H/m2.5)
+        """
+        y = y.reshape(len(self.scenarios), self.nb_unknowns)
+        density = (self.site_to_vertex @ y[:, self.s_slice].T).T / self.volume
+        density[:, 1:] += y[:, self.c_slice]
+        return (density**2 @ self.volume) ** 0.5
+
+    def breakpoints(self):
+        """Times at which the fluxes of a scenario have a kink, up to the
+        last final time
+
+        Returns:
+            numpy.ndarray: the times (s), ending with the last final time
+        """
+        final_time = max(scenario.final_time for scenario in self.scenarios)
+        times = np.unique(np.concatenate([s.t_data for s in self.scenarios]))
+        times = times[(times > 0) & (times < final_time)]
+        return np.append(times, final_time)
+
+    def stepsize_limits(self, t):
+        """Stepsize caps of the phases starting at t, as CyclingStepsize:
+        the smallest over the cycling scenarios
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            float, float: the maximum stepsize (s) and the stepsize after a
+                phase boundary (s), inf without cycling scenarios
+        """
+        stepsize_max, stepsize_restart = np.inf, np.inf
+        for scenario in self.scenarios:
+            if scenario.schedule is not None:
+                phase = scenario.schedule.phase(t)
+                stepsize_max = min(stepsize_max, stepsizes_max[phase])
+                stepsize_restart = min(stepsize_restart, stepsizes_restart[phase])
+        return stepsize_max, stepsize_restart
+
+    def mass(self, y):
+        """Product of the mass matrix and a state of the batch: identity but
+        for c_m, which adds up with the sites of its control volume
+
+        Args:
+            y (numpy.ndarray): the state of the batch, or a difference of
+                states
+
+        Returns:
+            numpy.ndarray: the product
+        """
+        y = y.reshape(len(self.scenarios), self.nb_unknowns)
+        product = y.copy()
+        product[:, self.c_slice] += (self.site_to_mobile @ y[:, self.s_slice].T).T
+        return product.ravel()
+
+    def factorise(self, t, y, dt):
+        """Factorises the Jacobian of a backward Euler step, mass - dt *
+        jacobian: LU factorisation (LAPACK band storage) of its Schur
+        complement on T and c, the trap sites being eliminated
+
+        Args:
+            t (float): the time at the end of the step (s)
+            y (numpy.ndarray): the state of the batch
+            dt (float): the stepsize (s)
+
+        Returns:
+            tuple: the LU factors, the pivots, the row and column scaling,
+                the diagonal of the sites and their dependence on T and c
+        """
+        values = -dt * self.jacobian(t, y)[2]
+        diagonal = 1 + np.bincount(
+            self.site_index,
+            values[:, self.site_entries].ravel(),
+            len(self.scenarios) * self.nb_sites,
+        )
+        dependence = values[:, self.dependence_entries].ravel()
+        coupling = np.tile(self.coupling, len(self.scenarios))
+        fill = (
+            -coupling[self.fill_coupling]
+            * dependence[self.fill_dependence]
+            / diagonal[self.dependence_sites[self.fill_dependence]]
+        )
+        band = np.bincount(
+            self.band_entries,
+            np.concatenate([values[:, self.unknown_entries].ravel(), fill]),
+            self.band_shape[0] * self.band_shape[1],
+        )
+        band[self.band_diagonal] += 1
+        band = band.reshape(self.band_shape)
+
+        # equilibration: T and c differ by 20 orders of magnitude, so the
+        # rows then the columns are scaled by their largest entry
+        bandwidth, size = self.bandwidth, self.band_shape[1]
+        diagonals = []
+        for offset in range(-bandwidth, bandwidth + 1):
+            # band[2 * bandwidth + offset, j] is in the row j + offset
+            j = slice(max(0, -offset), size - max(0, offset))
+            i = slice(max(0, offset), size + min(0, offset))
+            diagonals.append((2 * bandwidth + offset, i, j))
+        row_scale = np.zeros(size)
+        for a, i, j in diagonals:
+            row_scale[i] = np.maximum(row_scale[i], np.abs(band[a, j]))
+        row_scale = 1 / row_scale
+        for a, i, j in diagonals:
+            band[a, j] *= row_scale[i]
+        column_scale = 1 / np.abs(band).max(axis=0)
+        band *= column_scale
+
+        lu, pivots, info = dgbtrf(band, bandwidth, bandwidth)
+        if info > 0:
+            raise RuntimeError("t = {:.2f} s: singular Jacobian".format(t))
+        return lu, pivots, row_scale, column_scale, diagonal, dependence
+
+    def solve(self, factors, b):
+        """Solves a linear system factorised by factorise
+
+        Args:
+            factors (tuple): the LU factors, pivots, scaling and site
+                entries
+            b (numpy.ndarray): the right hand side
+
+        Returns:
+            numpy.ndarray: the solution
+        """
+        lu, pivots, row_scale, column_scale, diagonal, dependence = factors
+        nu = self.s_slice.start
+        b = b.reshape(len(self.scenarios), self.nb_unknowns)
+        b_sites = b[:, nu:].ravel() / diagonal
+        b_unknowns = b[:, :nu].copy()
+        b_unknowns[:, self.c_slice] -= (
+            self.site_to_mobile @ b_sites.reshape(len(b), -1).T
+        ).T
+        solution, _ = dgbtrs(
+            lu,
+            self.bandwidth,
+            self.bandwidth,
+            b_unknowns.ravel()[self.order] * row_scale,
+            pivots,
+        )
+        unknowns = (solution * column_scale)[self.position]
+        sites = b_sites - (
+            np.bincount(
+                self.dependence_sites,
+                dependence * unknowns[self.dependence_cols],
+                b_sites.size,
+            )
+            / diagonal
+        )
+        x = np.empty_like(b)
+        x[:, :nu] = unknowns.reshape(len(b), nu)
+        x[:, nu:] = sites.reshape(len(b), -1)
+        return x.ravel()
+
+    def step(self, t, y, dt, statistics, prediction=None):
+        """Backward Euler step, solved with a modified Newton method (the
+        factorised Jacobian is kept while the iterations contract)
+
+        Args:
+            t (float): the time (s)
+            y (numpy.ndarray): the state of the batch at time t
+            dt (float): the stepsize (s)
+            statistics (dict): the counters, updated
+            prediction (numpy.ndarray, optional): the start of the
+                iterations. Defaults to None (y).
+
+        Returns:
+            numpy.ndarray: the state at t + dt, None if Newton didn't
+                converge
+        """
+        t_new = t + dt
+        x = y.copy() if prediction is None else prediction
+        factors, previous_norm = None, None
+        # a diverging iteration overflows: the step is then rejected
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            for i in range(maximum_iterations):
+                residual = self.mass(x - y) - dt * self.rhs(t_new, x)
+                if factors is None:
+                    factors = self.factorise(t_new, x, dt)
+                    statistics["nb_factorisations"] += 1
+                update = self.solve(factors, residual)
+                x -= update
+                statistics["nb_iterations"] += 1
+                norm = np.max(
+                    np.abs(update)
+                    / (self.absolute_tolerance + relative_tolerance * np.abs(x))
+                )
+                if not np.isfinite(norm):
+                    break
+                if norm < 1:
+                    # backward Euler keeps the concentrations positive: a root
+                    # with negative ones is spurious (far Newton start)
+                    if x[self.concentrations].min() < -concentration_tolerance:
+                        return None
+                    return x
+                if previous_norm is not None and norm > contraction_max * previous_norm:
+                    factors = None
+                previous_norm = norm
+        return None
+
+    def run(self):
+        """Integrates the batch from 0 to the last final time with backward
+        Euler. As with CyclingStepsize, the steps end exactly on the phase
+        boundaries, where the stepsize restarts, and are capped in each
+        phase. The stepsize follows the local truncation error on the
+        retention, estimated from a linear extrapolation of the two previous
+        steps, of the scenario with the largest error relative to its
+        retention.
+
+        Returns:
+            numpy.ndarray, numpy.ndarray, dict: the times (s), the
+                retention in each material (nb_times, nb_scenarios, 3) and
+                the statistics of the integration (nb_steps, nb_rejected,
+                nb_iterations, nb_factorisations)
+        """
+        breakpoints = self.breakpoints()
+        tolerance = 1e-9 * breakpoints[-1]
+        y = self.initial_state()
+        t = 0.0
+        if all(scenario.schedule is None for scenario in self.scenarios):
+            dt = initial_stepsize["continuous"]
+        else:
+            dt = initial_stepsize["cycling"]
+        y_previous, dt_previous = None, None
+        times, retention = [t], [self.retention(t, y)]
+        statistics = dict(nb_steps=0, nb_rejected=0, nb_iterations=0)
+        statistics["nb_factorisations"] = 0
+        while t < breakpoints[-1] - tolerance:
+            next_breakpoint = breakpoints[np.searchsorted(breakpoints, t + tolerance)]
+            time_left = next_breakpoint - t
+            dt = min(dt, self.stepsize_limits(t + tolerance)[0])
+            if dt >= time_left:
+                dt = time_left
+            elif dt > time_left / 2:
+                # avoid leaving a tiny step before the breakpoint
+                dt = time_left / 2
+
+            prediction = None
+            if y_previous is not None:
+                prediction = y + dt / dt_previous * (y - y_previous)
+            y_new = self.step(t, y, dt, statistics, prediction)
+            if y_new is None:
+                statistics["nb_rejected"] += 1
+                dt /= stepsize_change_ratio
+                if dt < dt_min:
+                    raise RuntimeError(
+                        "t = {:.2f} s: stepsize reached dt_min".format(t)
+                    )
+                continue
+            statistics["nb_steps"] += 1
+            if y_previous is None:
+                factor = stepsize_change_ratio
+            else:
+                ratio = dt / dt_previous
+                error = (
+                    dt
+                    / (dt + dt_previous)
+                    * (y_new - (1 + ratio) * y + ratio * y_previous)
+                )
+                error = (
+                    self.retention_norms(error) / self.retention_norms(y_new)
+                ).max()
+                if error == 0:
+                    factor = 2
+                else:
+                    # local error of backward Euler is O(dt**2)
+                    factor = min(
+                        max(0.9 * (error_relative_tolerance / error) ** 0.5, 0.2), 2
+                    )
+            t, y, y_previous, dt_previous = t + dt, y_new, y, dt
+            dt *= factor
+            times.append(t)
+            retention.append(self.retention(t, y))
+            if abs(t - next_breakpoint) < tolerance:
+                # the fluxes have a kink, extrapolating across it is wrong
+                dt = self.stepsize_limits(t + tolerance)[1]
+                y_previous = None
+        return np.array(times), np.array(retention), statistics
+
+
+def run_batch(scenarios):
+    """Runs scenarios as one batch
+
+    Args:
+        scenarios (list): the Scenario objects
+
+    Returns:
+        list, dict: the times (s) and retention in each material (H/m2) of
+            each scenario at every step up to its final time, and the
+            statistics of the integration (with the wall time)
+    """
+    start = time.perf_counter()
+    model = FiniteVolumeModel(scenarios)
+    times, retention, statistics = model.run()
+    statistics["wall"] = time.perf_counter() - start
+    results = []
+    for i, scenario in enumerate(scenarios):
+        kept = times <= scenario.final_time * (1 + 1e-12)
+        results.append((times[kept], retention[kept, i]))
+    return results, statistics
+
+
+def validate(results="results", tolerances=None):
+    """Compares the engine with the inventory of the stored FESTIM results
+    (cycling and continuous runs of every scenario, see
+    spike_analysis.find_scenarios) over the trusted windows (see
+    validation_tolerances)
+
+    Args:
+        results (str, optional): the results folder. Defaults to "results".
+        tolerances (dict, optional): the largest relative difference of the
+            total inventory for the "cycling" and "continuous" runs. Defaults
+            to None (validation_tolerances).
+
+    Raises:
+        RuntimeError: if a difference exceeds its tolerance
+
+    Returns:
+        list: dicts with the folder, the wall time of its batch, the
+            maximum relative difference of the total inventory over the
+            trusted window and over the whole run, and the final one
+    """
+    from spike_analysis import find_scenarios
+
+    if tolerances is None:
+        tolerances = validation_tolerances
+
+    comparisons = []
+    for kind in ["cycling", "continuous"]:
+        folders, scenarios, references = [], [], []
+        for scenario in find_scenarios(results):
+            data = read_derived_quantities(scenario[kind])
+            t = np.array(data["ts"])
+            inventory = sum(
+                data["Total_retention_volume_{}".format(i)] for i in [1, 2, 3]
+            )
+            if kind == "cycling":
+                timing = {phase: scenario[phase] for phase in default_timing}
+                # the stored runs may stop (or diverge) during their last
+                # cycle: only the complete cycles are compared
+                nb_cycles = max(int(t[-1] / sum(timing.values()) + 1e-9), 1)
+                schedule = CycleSchedule(**timing, nb_cycles=nb_cycles)
+                kept = t <= schedule.final_time * (1 + 1e-9)
+                t, inventory = t[kept], inventory[kept]
+                rest_start = schedule.phase_starts[3]
+                trusted = t % schedule.cycle_length >= rest_start + settling_time
+            else:
+                schedule = None
+                trusted = np.ones(t.size, dtype=bool)
+            folders.append(scenario[kind])
+            scenarios.append(
+                Scenario(
+                    scenario["heat_flux"],
+                    scenario["part_flux"],
+                    schedule,
+                    final_time=t[-1],
+                )
+            )
+            references.append((t, inventory, trusted))
+        if not scenarios:
+            continue
+        batch, statistics = run_batch(scenarios)
+        for folder, (t, reference, trusted), (times, retention) in zip(
+            folders, references, batch
+        ):
+            inventory = np.interp(t, times, retention.sum(axis=1))
+            difference = np.abs(inventory - reference) / reference
+            comparisons.append(
+                {
+                    "folder": folder,
+                    "wall": statistics["wall"],
+                    "nb_scenarios": len(scenarios),
+                    "tolerance": tolerances[kind],
+                    "max_difference": difference[trusted].max(),
+                    "max_difference_all": difference.max(),
+                    "final_difference": difference[-1],
+                }
+            )
+    failed = [c for c in comparisons if c["max_difference"] > c["tolerance"]]
+    if failed:
+        raise RuntimeError(
+            "screening engine differs from FESTIM: "
+            + ", ".join(
+                "{} ({:.2%} > {:.2%})".format(
+                    c["folder"], c["max_difference"], c["tolerance"]
+                )
+                for c in failed
+            )
+        )
+    return comparisons
+
+
+def screen(heat_fluxes, part_fluxes, nb_cycles, timing=default_timing):
+    """Runs the cycling scenarios of all the combinations of fluxes as one
+    batch
+
+    Args:
+        heat_fluxes (list): heat fluxes during the plateau (W/m2)
+        part_fluxes (list): particle fluxes during the plateau (H/m2/s)
+        nb_cycles (int): number of cycles
+        timing (dict, optional): durations of the phases. Defaults to
+            default_timing.
+
+    Returns:
+        list, dict: for each scenario, its fluxes, the inventory at the end
+            of the rest of its last complete cycle and its relative growth
+            over that cycle, and the statistics of the integration. Only
+            the end-of-rest inventories are reported: the engine is
+            validated over the rests only (see validation_tolerances),
+            not over the peaks and minima of the ramps and plateaus.
+    """
+    schedule = CycleSchedule(**timing, nb_cycles=nb_cycles)
+    combinations = list(itertools.product(heat_fluxes, part_fluxes))
+    scenarios = [Scenario(heat, part, schedule) for heat, part in combinations]
+    batch, statistics = run_batch(scenarios)
+    rows = []
+    for (heat_flux, part_flux), (t, retention) in zip(combinations, batch):
+        end_of_rest = cycle_aggregates(schedule, t, retention.sum(axis=1))[
+            "end_of_rest"
+        ]
+        end_of_rest = end_of_rest[~np.isnan(end_of_rest)]
+        growth_rate = np.nan
+        if end_of_rest.size > 1:
+            growth_rate = end_of_rest[-1] / end_of_rest[-2] - 1
+        rows.append(
+            {
+                "heat_flux": heat_flux,
+                "part_flux": part_flux,
+                "inventory": end_of_rest[-1],
+                "growth_rate": growth_rate,
+            }
+        )
+    return rows, statistics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--heat-flux", type=float, nargs="+", help="W/m2")
+    parser.add_argument("--part-flux", type=float, nargs="+", help="H/m2/s")
+    parser.add_argument("--nb-cycles", type=int, default=10)
+    parser.add_argument("--output", default="screening.csv", help="CSV file")
+    args = parser.parse_args()
+
+    if args.heat_flux is None and args.part_flux is None:
+        comparisons = validate()
+        width = max(len(comparison["folder"]) for comparison in comparisons) + 2
+        print(
+            "{:<{}}{:>10}{:>10}{:>16}{:>12}{:>18}{:>12}".format(
+                "",
+                width,
+                "batch of",
+                "wall (s)",
+                "max difference",
+                "(all)",
+                "final difference",
+                "tolerance",
+            )
+        )
+        for comparison in comparisons:
+            print(
+                "{:<{}}{:>10}{:>10.1f}{:>16.2%}{:>12.2%}{:>18.2%}{:>12.2%}".format(
+                    comparison["folder"],
+                    width,
+                    comparison["nb_scenarios"],
+                    comparison["wall"],
+                    comparison["max_difference"],
+                    comparison["max_difference_all"],
+                    comparison["final_difference"],
+                    comparison["tolerance"],
+                )
+            )
+    else:
+        if args.heat_flux is None or args.part_flux is None:
+            parser.error("--heat-flux and --part-flux go together")
+        rows, statistics = screen(args.heat_flux, args.part_flux, args.nb_cycles)
+        np.savetxt(
+            args.output,
+            [list(row.values()) for row in rows],
+            delimiter=",",
+            header=",".join(rows[0]),
+            comments="",
+        )
+        print(
+            "{} scenarios in {:.1f} s ({} steps), written to {}".format(
+                len(rows), statistics["wall"], statistics["nb_steps"], args.output
+            )
+        )
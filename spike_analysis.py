@@ -0,0 +1,233 @@
+"""Spike height and convergence-to-power-law analysis of all the scenarios.
+
+Every results/phi_heat=..._phi_part=... folder with cycling and continuous
+results is analysed:
+    - the spike height of each cycle (peak minus minimum inventory) and the
+      baseline (minimum inventory) are extracted from the cycling run
+    - inventory = a * fluence**b is fitted on the continuous run
+    - the number of cycles after which the spike of cycle spike_cycle is
+      smaller than target_height_over_inv times the inventory is computed
+
+The folders are analysed in parallel and the results are cached in
+<results>/spike_analysis.json (or cache_file), keyed on the modification
+times of the results files and on the analysis parameters.
+"""
+
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import re
+
+import numpy as np
+
+from cycle_schedule import CycleSchedule, default_timing
+from postprocessing import (
+    load_inventory,
+    fluence_cycling,
+    fluence_continuous,
+    cycle_aggregates,
+    fit_power_law,
+)
+
+folder_pattern = re.compile(r"phi_heat=([^_]+)_phi_part=([^/]+)$")
+
+
+def find_scenarios(results="results"):
+    """Finds the scenarios with both cycling and continuous results
+
+    Args:
+        results (str, optional): the results folder. Defaults to "results".
+
+    Returns:
+        list: dicts with keys "cycling", "continuous" (folders), "heat_flux",
+            "part_flux" and the cycle timing
+    """
+    scenarios = []
+    for folder in sorted(glob.glob(os.path.join(results, "phi_heat=*_phi_part=*"))):
+        match = folder_pattern.search(folder)
+        if match is None:
+            continue
+        for cycling in sorted(glob.glob(os.path.join(folder, "cycling*"))):
+            suffix = os.path.basename(cycling)[len("cycling") :]
+            continuous = os.path.join(folder, "continuous" + suffix)
+            if not os.path.isdir(continuous):
+                continue
+            timing = dict(default_timing)
+            for item in suffix.strip("_").split("_"):
+                if "=" in item:
+                    key, value = item.split("=")
+                    timing[key] = float(value)
+            scenarios.append(
+                {
+                    "cycling": cycling,
+                    "continuous": continuous,
+                    "heat_flux": float(match.group(1)),
+                    "part_flux": float(match.group(2)),
+                    **timing,
+                }
+            )
+    return scenarios
+
+
+def results_mtimes(scenario):
+    """Modification times of the results files of a scenario
+
+    Args:
+        scenario (dict): the scenario
+
+    Returns:
+        list: the modification times
+    """
+    mtimes = []
+    for kind in ["cycling", "continuous"]:
+        for filename in sorted(glob.glob(scenario[kind] + "/derived_quantities.*")):
+            mtimes.append([filename, os.path.getmtime(filename)])
+    return mtimes
+
+
+def analyse_scenario(scenario, spike_cycle=2, target_height_over_inv=0.1):
+    """Analyses a scenario
+
+    Args:
+        scenario (dict): the scenario (see find_scenarios)
+        spike_cycle (int, optional): index of the cycle whose spike is
+            compared to the inventory. Defaults to 2.
+        target_height_over_inv (float, optional): ratio of the spike height
+            to the inventory below which the spike is negligible. Defaults
+            to 0.1.
+
+    Returns:
+        dict: the results of the analysis
+    """
+    part_flux = scenario["part_flux"]
+    t, inventory = load_inventory(scenario["cycling"])
+    nb_cycles = int(t[-1] // (sum(scenario[key] for key in default_timing))) + 1
+    schedule = CycleSchedule(
+        scenario["rampup"],
+        scenario["plateau"],
+        scenario["rampdown"],
+        scenario["rest"],
+        nb_cycles,
+    )
+    aggregates = cycle_aggregates(schedule, t, inventory)
+    complete = ~np.isnan(aggregates["end_of_rest"])
+    spike_heights = (aggregates["peak"] - aggregates["min"])[complete]
+    baselines = aggregates["min"][complete]
+
+    t_continuous, inventory_continuous = load_inventory(scenario["continuous"])
+    a, b = fit_power_law(
+        fluence_continuous(part_flux, t_continuous), inventory_continuous
+    )
+
+    fluence_per_cycle = fluence_cycling(schedule, part_flux, schedule.cycle_length)
+    if spike_cycle < spike_heights.size:
+        height_spike = spike_heights[spike_cycle]
+        fluence_when_spike_negligible = (
+            1 / target_height_over_inv * height_spike / a
+        ) ** (1 / b)
+        nb_cycles_negligible = fluence_when_spike_negligible / fluence_per_cycle
+    else:
+        height_spike = np.nan
+        nb_cycles_negligible = np.nan
+
+    return {
+        "heat_flux": scenario["heat_flux"],
+        "part_flux": part_flux,
+        "spike_heights": spike_heights.tolist(),
+        "baselines": baselines.tolist(),
+        "a": float(a),
+        "b": float(b),
+        "height_spike": float(height_spike),
+        "nb_cycles_negligible": float(nb_cycles_negligible),
+    }
+
+
+def analyse_all(
+    results="results",
+    nb_processes=None,
+    spike_cycle=2,
+    target_height_over_inv=0.1,
+    cache_file=None,
+):
+    """Analyses all the scenarios, reusing the cached results of the
+    scenarios whose results files haven't changed
+
+    Args:
+        results (str, optional): the results folder. Defaults to "results".
+        nb_processes (int, optional): the number of processes. Defaults to
+            the number of cores.
+        spike_cycle (int, optional): see analyse_scenario. Defaults to 2.
+        target_height_over_inv (float, optional): see analyse_scenario.
+            Defaults to 0.1.
+        cache_file (str, optional): the cache file. None for
+            <results>/spike_analysis.json. Defaults to None.
+
+    Returns:
+        dict: the results of the analysis by cycling folder
+    """
+    if cache_file is None:
+        cache_file = os.path.join(results, "spike_analysis.json")
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file) as file:
+            cache = json.load(file)
+
+    scenarios = find_scenarios(results)
+    parameters = [spike_cycle, target_height_over_inv]
+    mtimes = {
+        scenario["cycling"]: [parameters] + results_mtimes(scenario)
+        for scenario in scenarios
+    }
+    to_analyse = [
+        scenario
+        for scenario in scenarios
+        if cache.get(scenario["cycling"], {}).get("mtimes")
+        != mtimes[scenario["cycling"]]
+    ]
+
+    if to_analyse:
+        nb_processes = max(min(nb_processes or os.cpu_count(), len(to_analyse)), 1)
+        with multiprocessing.Pool(nb_processes) as pool:
+            analyses = pool.map(
+                functools.partial(
+                    analyse_scenario,
+                    spike_cycle=spike_cycle,
+                    target_height_over_inv=target_height_over_inv,
+                ),
+                to_analyse,
+            )
+        for scenario, analysis in zip(to_analyse, analyses):
+            cache[scenario["cycling"]] = {
+                "mtimes": mtimes[scenario["cycling"]],
+                "analysis": analysis,
+            }
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        with open(cache_file, "w") as file:
+            json.dump(cache, file)
+
+    return {
+        scenario["cycling"]: cache[scenario["cycling"]]["analysis"]
+        for scenario in scenarios
+    }
+
+
+if __name__ == "__main__":
+    spike_cycle = 2
+    analyses = analyse_all(spike_cycle=spike_cycle)
+    print(
+        "{:<48}{:>14}{:>8}{:>14}{:>14}".format(
+            "", "height spike", "b", "spike cycle", "cycles"
+        )
+    )
+    for folder, analysis in analyses.items():
+        print(
+            "{:<48}{:>14.2e}{:>8.2f}{:>14}{:>14.0f}".format(
+                folder,
+                analysis["height_spike"],
+                analysis["b"],
+                spike_cycle,
+                analysis["nb_cycles_negligible"],
+            )
+        )
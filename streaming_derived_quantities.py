@@ -0,0 +1,151 @@
+"""Streaming, columnar output of the derived quantities.
+
+StreamingDerivedQuantities appends the computed rows to a column-major
+binary output: each column (as in the CSV header) is a file of float64,
+<name>.<j>.bin for <name>.bin, so reading one quantity is a contiguous
+read. The rows are appended in chunks of chunk_size rows, flushed to disk
+as soon as they are full: a crash loses at most one chunk and the history
+isn't kept in memory. The column titles are stored next to them in
+<name>.json. The CSV file is only written if
+csv_filename is given. The files are read with
+derived_quantities_reader.read_derived_quantities.
+
+In parallel runs, the values are computed by all the processes (global
+assembly) and the files are written by the process of rank 0 only.
+"""
+
+import json
+import os
+import shutil
+
+import fenics as f
+import numpy as np
+import FESTIM as F
+
+from derived_quantities_reader import (
+    column_filename,
+    count_rows,
+    header_filename,
+    read_binary,
+)
+
+
+class StreamingDerivedQuantities(F.DerivedQuantities):
+    """F.DerivedQuantities appending its rows to a binary file
+
+    Attributes:
+        binary_filename (str): the binary file (its columns are written to
+            derived_quantities_reader.column_filename)
+        chunk_size (int): number of rows written at once
+        chunk (list): rows not written yet
+        nb_rows (int): number of rows in the binary file
+        opened (bool): False until the binary file is created (or restored)
+        writer (bool): True if this process writes the files
+    """
+
+    def __init__(
+        self, derived_quantities, filename, csv_filename=None, chunk_size=50, **kwargs
+    ) -> None:
+        """Inits StreamingDerivedQuantities
+
+        Args:
+            derived_quantities (list): list of F.DerivedQuantity objects
+            filename (str): the binary file (must end with .bin)
+            csv_filename (str, optional): if given, the data is also written
+                to this CSV file when exported. Defaults to None.
+            chunk_size (int, optional): number of rows written at once.
+                Defaults to 50.
+            **kwargs: arguments of F.DerivedQuantities
+                (nb_iterations_between_compute...)
+        """
+        super().__init__(derived_quantities, filename=csv_filename, **kwargs)
+        if not filename.endswith(".bin"):
+            raise ValueError("filename must end with .bin")
+        self.binary_filename = filename
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.nb_rows = 0
+        self.opened = False
+        self.writer = f.MPI.rank(f.MPI.comm_world) == 0
+
+    def compute(self, t):
+        super().compute(t)
+        self.chunk.append(self.data.pop())
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Appends the pending rows to the binary file"""
+        if self.opened and not self.chunk:
+            return
+        if self.writer:
+            self.write_chunk()
+        self.nb_rows += len(self.chunk)
+        self.chunk = []
+        self.opened = True
+
+        # the history is on disk
+        self.t = []
+        for quantity in self.derived_quantities:
+            quantity.t = []
+            quantity.data = []
+
+    def write_chunk(self):
+        """Appends the pending rows to the column files, creating them and
+        their header first if needed"""
+        mode = "ab"
+        header = self.make_header()
+        if not self.opened:
+            os.makedirs(os.path.dirname(self.binary_filename) or ".", exist_ok=True)
+            with open(header_filename(self.binary_filename), "w") as file:
+                json.dump({"columns": header}, file)
+            mode = "wb"
+        rows = np.array(self.chunk, dtype=np.float64).reshape(-1, len(header))
+        for j in range(len(header)):
+            with open(column_filename(self.binary_filename, j), mode) as file:
+                rows[:, j].tofile(file)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def write(self):
+        self.flush()
+        if self.filename is not None and self.writer:
+            data = np.column_stack(read_binary(self.binary_filename))
+            os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+            np.savetxt(
+                self.filename,
+                data,
+                fmt="%s",
+                delimiter=",",
+                header=",".join(self.make_header()),
+                comments="",
+            )
+        return True
+
+    def save(self, filename):
+        """Copies the rows written so far (used by the checkpoints)
+
+        Args:
+            filename (str): the copy (a .bin name, see column_filename)
+        """
+        self.flush()
+        for j in range(len(self.make_header())):
+            shutil.copyfile(
+                column_filename(self.binary_filename, j), column_filename(filename, j)
+            )
+
+    def load(self, filename):
+        """Replaces the binary output by a copy made by save
+
+        Args:
+            filename (str): the copy
+        """
+        self.opened = False
+        self.chunk = []
+        self.flush()  # creates the column files and their header
+        nb_columns = len(self.make_header())
+        for j in range(nb_columns):
+            shutil.copyfile(
+                column_filename(filename, j), column_filename(self.binary_filename, j)
+            )
+        self.nb_rows = count_rows(filename, nb_columns)
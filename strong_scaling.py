@@ -0,0 +1,148 @@
+"""Strong scaling benchmark of the 2D/3D monoblock model.
+
+Runs monoblock_mpi.py --benchmark on the same mesh with 1, 2, 4... up to
+max_processes MPI processes and reports, for each number of processes, the
+wall time of the time stepping, the speedup and the parallel efficiency
+relative to 1 process:
+
+    python strong_scaling.py 16 --volume-file volumes.xdmf \
+        --boundary-file surfaces.xdmf
+
+The results are written to a JSON file (default
+benchmarks/scaling-<date>.json) with the metadata of benchmark_suite.py.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+from benchmark_suite import metadata
+
+
+def process_counts(max_processes):
+    """Powers of 2 up to max_processes, and max_processes
+
+    Args:
+        max_processes (int): the largest number of processes
+
+    Returns:
+        list: the numbers of processes
+    """
+    counts = []
+    nb_processes = 1
+    while nb_processes < max_processes:
+        counts.append(nb_processes)
+        nb_processes *= 2
+    counts.append(max_processes)
+    return counts
+
+
+def run_scaling(
+    max_processes,
+    volume_file=None,
+    boundary_file=None,
+    mpirun="mpirun",
+    linear_solver=None,
+):
+    """Runs the benchmark of monoblock_mpi.py with increasing numbers of
+    processes
+
+    Args:
+        max_processes (int): the largest number of processes
+        volume_file (str, optional): the XDMF file of the tagged cells.
+            Defaults to None (the default of monoblock_mpi.py).
+        boundary_file (str, optional): the XDMF file of the tagged facets.
+            Defaults to None (the default of monoblock_mpi.py).
+        mpirun (str, optional): the MPI launcher command. Defaults to
+            "mpirun".
+        linear_solver (str, optional): "krylov" or "mumps". Defaults to
+            None (the default of monoblock_mpi.py).
+
+    Returns:
+        list: the results of monoblock_mpi.benchmark for each number of
+            processes, with their speedup and efficiency
+    """
+    # monoblock_mpi isn't imported here: dolfin would initialise MPI in
+    # this process, which some MPI implementations don't allow before
+    # calling mpirun
+    options = []
+    if volume_file is not None:
+        options += ["--volume-file", volume_file]
+    if boundary_file is not None:
+        options += ["--boundary-file", boundary_file]
+    if linear_solver is not None:
+        options += ["--linear-solver", linear_solver]
+    runs = []
+    with tempfile.TemporaryDirectory() as folder:
+        for nb_processes in process_counts(max_processes):
+            print("Running on {} process(es)".format(nb_processes))
+            filename = os.path.join(folder, "{}.json".format(nb_processes))
+            command = (
+                shlex.split(mpirun)
+                + ["-n", str(nb_processes), sys.executable, "monoblock_mpi.py"]
+                + options
+                + ["--benchmark", filename]
+            )
+            subprocess.run(command, check=True)
+            with open(filename) as file:
+                runs.append(json.load(file))
+
+    reference = runs[0]["wall"] * runs[0]["nb_processes"]
+    for run in runs:
+        run["speedup"] = reference / run["wall"]
+        run["efficiency"] = run["speedup"] / run["nb_processes"]
+    return runs
+
+
+def print_table(runs):
+    print(
+        "{:>10}{:>12}{:>12}{:>10}{:>12}{:>12}".format(
+            "processes", "setup (s)", "wall (s)", "speedup", "efficiency", "newton"
+        )
+    )
+    for run in runs:
+        print(
+            "{:>10}{:>12.1f}{:>12.1f}{:>10.2f}{:>12.1%}{:>12}".format(
+                run["nb_processes"],
+                run["setup"],
+                run["wall"],
+                run["speedup"],
+                run["efficiency"],
+                run["newton_iterations"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("max_processes", type=int, help="largest number of processes")
+    parser.add_argument("--volume-file")
+    parser.add_argument("--boundary-file")
+    parser.add_argument("--mpirun", default="mpirun", help="MPI launcher command")
+    parser.add_argument("--linear-solver", choices=["krylov", "mumps"])
+    parser.add_argument(
+        "--output",
+        default="benchmarks/scaling-{}.json".format(
+            datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        ),
+        help="JSON file of the results",
+    )
+    args = parser.parse_args()
+
+    runs = run_scaling(
+        args.max_processes,
+        args.volume_file,
+        args.boundary_file,
+        args.mpirun,
+        args.linear_solver,
+    )
+    print_table(runs)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump({"metadata": metadata(), "runs": runs}, file, indent=2)
+    print("Results written to {}".format(args.output))
@@ -0,0 +1,224 @@
+"""Parameter sweep over (heat flux, particle flux, cycle timing, nb_cycles)
+scenarios, run in parallel over a pool of processes.
+
+Each scenario gets its own model from main.build_monoblock_model and writes to
+the usual results/phi_heat=..._phi_part=.../{cycling,continuous} folders. Scenarios
+whose derived quantities already reach the final time are skipped, the
+others resume from their latest checkpoint if they have one. Cycling
+scenarios stop early once the convergence criteria of cycling.py are met
+if they are set (see inventory_monitor.py). If
+cycling.temperature_from_library is set, the temperature of cycling
+scenarios is read from the temperature library (see temperature_library.py),
+so scenarios only differing by their particle flux solve it once.
+"""
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+
+from cycle_schedule import default_timing
+from derived_quantities_reader import binary_exists, read_derived_quantities
+
+
+def make_scenarios(heat_fluxes, part_fluxes, timings=None, nb_cycles=None, kinds=None):
+    """Creates the grid of scenarios. Scenarios writing to the same folder
+    (ie. only differing by nb_cycles) are merged into the longest one.
+
+    Args:
+        heat_fluxes (list): heat fluxes during the plateau (W/m2)
+        part_fluxes (list): particle fluxes during the plateau (H/m2/s)
+        timings (list, optional): dicts with keys "rampup", "plateau",
+            "rampdown" and "rest" (s). Defaults to default_timing only.
+        nb_cycles (list, optional): numbers of cycles. Defaults to 20 only.
+        kinds (list, optional): "cycling" and/or "continuous". Defaults to
+            both.
+
+    Returns:
+        list: the scenarios (dicts)
+    """
+    if timings is None:
+        timings = [default_timing]
+    if nb_cycles is None:
+        nb_cycles = [20]
+    if kinds is None:
+        kinds = ["cycling", "continuous"]
+    scenarios = {}
+    for kind, heat_flux, part_flux, timing, nb in itertools.product(
+        kinds, heat_fluxes, part_fluxes, timings, nb_cycles
+    ):
+        scenario = {
+            "kind": kind,
+            "heat_flux": heat_flux,
+            "part_flux": part_flux,
+            "nb_cycles": nb,
+            **timing,
+        }
+        folder = results_folder(scenario)
+        if folder not in scenarios or scenarios[folder]["nb_cycles"] < nb:
+            scenarios[folder] = scenario
+    return list(scenarios.values())
+
+
+def results_folder(scenario):
+    """Returns the results folder of a scenario. The cycle timing is only
+    added to the folder name if it differs from default_timing.
+
+    Args:
+        scenario (dict): the scenario
+
+    Returns:
+        str: the folder
+    """
+    folder = "results/phi_heat={:.1e}_phi_part={:.1e}/{}".format(
+        scenario["heat_flux"], scenario["part_flux"], scenario["kind"]
+    )
+    timing = {key: scenario[key] for key in default_timing}
+    if timing != default_timing:
+        folder += "_" + "_".join(
+            "{}={}".format(key, value) for key, value in timing.items()
+        )
+    return folder
+
+
+def final_time(scenario):
+    """Returns the final time of a scenario. Continuous scenarios last as
+    long as the beam-on time of the cycling ones.
+
+    Args:
+        scenario (dict): the scenario
+
+    Returns:
+        float: the final time (s)
+    """
+    beam_on = scenario["rampup"] + scenario["plateau"] + scenario["rampdown"]
+    if scenario["kind"] == "continuous":
+        return scenario["nb_cycles"] * beam_on
+    return scenario["nb_cycles"] * (beam_on + scenario["rest"])
+
+
+def is_complete(scenario):
+    """Checks if the results of a scenario already reach its final time or
+    were stopped by the inventory monitor
+
+    Args:
+        scenario (dict): the scenario
+
+    Returns:
+        bool: True if the results are complete, else False
+    """
+    folder = results_folder(scenario)
+    if os.path.exists(folder + "/monitor.json"):
+        with open(folder + "/monitor.json") as file:
+            if json.load(file)["converged"]:
+                return True
+    if not (
+        binary_exists(folder + "/derived_quantities.bin")
+        or os.path.exists(folder + "/derived_quantities.csv")
+    ):
+        return False
+    t = read_derived_quantities(folder)["ts"]
+    if t.size == 0:
+        return False
+    return bool(t[-1] >= final_time(scenario) * (1 - 1e-10))
+
+
+def run_scenario(scenario):
+    """Runs a scenario
+
+    Args:
+        scenario (dict): the scenario
+
+    Returns:
+        str: the results folder
+    """
+    import FESTIM as F
+    from main import build_monoblock_model
+    from checkpoint import resume, run_with_checkpoints
+    from temperature_library import use_temperature_library
+    from restricted_traps import restrict_traps
+    from inventory_monitor import InventoryMonitor
+
+    folder = results_folder(scenario)
+    model = build_monoblock_model()
+    if scenario["kind"] == "cycling":
+        import cycling as script
+        from cycle_schedule import CycleSchedule
+
+        schedule = CycleSchedule(
+            rampup=scenario["rampup"],
+            plateau=scenario["plateau"],
+            rampdown=scenario["rampdown"],
+            rest=scenario["rest"],
+            nb_cycles=scenario["nb_cycles"],
+        )
+        script.setup_cycling(
+            model, schedule, scenario["heat_flux"], scenario["part_flux"]
+        )
+        if script.temperature_from_library:
+            use_temperature_library(model, schedule)
+        model.exports = script.make_exports(folder, schedule)
+        reuse_jacobian = script.reuse_jacobian
+        monitor = InventoryMonitor(
+            schedule,
+            spike_ratio_threshold=script.spike_ratio_threshold,
+            growth_rate_threshold=script.growth_rate_threshold,
+        )
+    else:
+        import continuous as script
+
+        script.setup_continuous(
+            model,
+            final_time(scenario),
+            scenario["heat_flux"],
+            scenario["part_flux"],
+        )
+        model.exports = script.make_exports(folder)
+        reuse_jacobian = False
+        monitor = None
+    if script.pin_inactive_traps or reuse_jacobian:
+        restrict_traps(model, reuse_jacobian=reuse_jacobian)
+    checkpoints_folder = folder + "/checkpoints"
+    model.initialise()
+    resume(model, checkpoints_folder, monitor)
+    run_with_checkpoints(model, checkpoints_folder, monitor=monitor)
+    if monitor is not None:
+        monitor.write(folder + "/monitor.json")
+
+    # derived quantities may only be written every N iterations
+    for export in model.exports.exports:
+        if isinstance(export, F.DerivedQuantities):
+            export.write()
+    return folder
+
+
+def run_sweep(scenarios, nb_processes=None):
+    """Runs the scenarios that are not complete yet in parallel
+
+    Args:
+        scenarios (list): the scenarios
+        nb_processes (int, optional): the number of processes. Defaults to
+            the number of cores.
+    """
+    to_run = [scenario for scenario in scenarios if not is_complete(scenario)]
+    print(
+        "{} scenarios to run, {} already complete".format(
+            len(to_run), len(scenarios) - len(to_run)
+        )
+    )
+    if nb_processes is None:
+        nb_processes = os.cpu_count()
+    nb_processes = max(min(nb_processes, len(to_run)), 1)
+    with multiprocessing.Pool(nb_processes) as pool:
+        for folder in pool.imap_unordered(run_scenario, to_run, chunksize=1):
+            print("Finished {}".format(folder))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    scenarios = make_scenarios(
+        heat_fluxes=[5e6, 13e6],
+        part_fluxes=[5e21, 1.6e22],
+        nb_cycles=[20],
+    )
+    run_sweep(scenarios)
@@ -0,0 +1,315 @@
+"""Precomputed temperature fields for cycling runs.
+
+The heat transfer problem doesn't depend on the hydrogen transport, so
+T(x, t) is solved once per heat flux profile (mesh, thermal properties,
+heat boundary conditions and cycle timing) and stored in
+temperature_store/<key>.npz:
+    - "t": the times within a cycle (s), graded from each phase boundary
+    - "T": the nodal values of T at these times for each stored cycle
+
+Since the cycles are identical, cycles are solved until the temperature
+at the end of a cycle matches the one at its beginning (periodic state),
+usually the first one as the rest is long enough for the monoblock to cool
+down. The following cycles reuse the last stored one.
+
+TemperatureFromLibrary interpolates the stored fields linearly in time,
+use_temperature_library replaces the heat transfer problem of a set up
+model by it.
+"""
+
+import hashlib
+import json
+import os
+
+import fenics as f
+import numpy as np
+import FESTIM as F
+
+from cycle_schedule import PHASES
+
+store_folder = "temperature_store"
+
+stepsizes_max = {"rampup": 2, "plateau": 10, "rampdown": 2, "rest": 20}
+dt_min = 0.1
+stepsize_ratio = 1.2
+periodic_tolerance = 1e-4
+nb_cycles_max = 5
+
+thermal_attributes = ["id", "borders", "thermal_cond", "heat_capacity", "rho"]
+
+# parameters of the library key
+bc_attributes = [
+    "surfaces",
+    "field",
+    "value",
+    "phi",
+    "R_p",
+    "D_0",
+    "E_D",
+    "h_coeff",
+    "T_ext",
+    "Kr_0",
+    "E_Kr",
+    "order",
+]
+temperature_attributes = [
+    "transient",
+    "steady_tolerance",
+    "library_key",
+    "initial_value",
+    "relative_tolerance",
+    "absolute_tolerance",
+]
+
+
+def describe(value):
+    """Converts a parameter to something JSON serialisable. Unknown objects
+    are described by their str, which changes from one run to the other for
+    most fenics objects so they never produce false cache hits.
+
+    Args:
+        value: the parameter
+
+    Returns:
+        the description
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): describe(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, F.Material):
+        return value.id
+    if isinstance(value, f.Constant):
+        return float(value)
+    if hasattr(value, "coefficients"):  # material_properties.CubicProperty
+        return value.coefficients
+    return str(value)
+
+
+def describe_attributes(obj, attributes):
+    """Describes the attributes of obj
+
+    Args:
+        obj: the object
+        attributes (list): names of the attributes
+
+    Returns:
+        dict: the class and the description of the existing attributes
+    """
+    description = {"class": type(obj).__name__}
+    for attribute in attributes:
+        if hasattr(obj, attribute):
+            description[attribute] = describe(getattr(obj, attribute))
+    return description
+
+
+def describe_boundary_condition(bc):
+    """Describes a boundary condition. For the cycling ones, only the values
+    of the first cycle and the timing are used (not the number of cycles).
+
+    Args:
+        bc (FESTIM.BoundaryCondition): the boundary condition
+
+    Returns:
+        dict: the description
+    """
+    description = describe_attributes(bc, bc_attributes)
+    if hasattr(bc, "schedule"):
+        description["durations"] = describe(bc.schedule.durations)
+        description["data_y"] = describe(bc.data_y[:4])
+    return description
+
+
+def make_time_grid(schedule):
+    """Times within a cycle at which T is stored. The steps restart from
+    dt_min at each phase boundary and grow by stepsize_ratio up to the
+    maximum stepsize of the phase.
+
+    Args:
+        schedule (CycleSchedule): the cycle schedule
+
+    Returns:
+        numpy.ndarray: the times (s), from 0 to the cycle length
+    """
+    times = [0.0]
+    for start, end, phase in zip(schedule.phase_starts, schedule.phase_ends, PHASES):
+        t, dt = start, dt_min
+        while end - t > 1e-9 * schedule.cycle_length:
+            t += min(dt, stepsizes_max[phase], end - t)
+            times.append(t)
+            dt *= stepsize_ratio
+        times[-1] = end
+    return np.array(times)
+
+
+def library_key(model, schedule):
+    """Hash of everything affecting the temperature of a cycling model. Has
+    to be computed before the model is initialised.
+
+    Args:
+        model (FESTIM.Simulation): the set up cycling model
+        schedule (CycleSchedule): the cycle schedule
+
+    Returns:
+        str: the key
+    """
+    mesh = model.mesh.mesh
+    description = {
+        "durations": describe(schedule.durations),
+        "mesh": hashlib.sha256(mesh.coordinates().tobytes()).hexdigest(),
+        "materials": [
+            describe_attributes(material, thermal_attributes)
+            for material in model.materials.materials
+        ],
+        "boundary_conditions": [
+            describe_boundary_condition(bc)
+            for bc in model.boundary_conditions
+            if bc.field == "T"
+        ],
+        "T": describe_attributes(model.T, temperature_attributes),
+        "grid": [
+            stepsizes_max,
+            dt_min,
+            stepsize_ratio,
+            periodic_tolerance,
+            nb_cycles_max,
+        ],
+    }
+    content = json.dumps(description, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def solve_cycles(model, schedule):
+    """Solves the heat transfer problem of a set up cycling model cycle by
+    cycle until it is periodic
+
+    Args:
+        model (FESTIM.Simulation): the set up cycling model, not
+            initialised. Its heat transfer problem and heat boundary
+            conditions are initialised here and can't be reused.
+        schedule (CycleSchedule): the cycle schedule
+
+    Returns:
+        numpy.ndarray, numpy.ndarray: the times within a cycle (s) and the
+            nodal values of T for each solved cycle
+    """
+    grid = make_time_grid(schedule)
+    mesh, materials, T = model.mesh, model.materials, model.T
+    mesh.define_measures(materials)
+    T.boundary_conditions = [bc for bc in model.boundary_conditions if bc.field == "T"]
+    dt = F.Stepsize(initial_value=grid[1])
+    T.create_functions(materials, mesh, dt)
+    T.T.assign(T.T_n)
+
+    cycles = []
+    for cycle in range(nb_cycles_max):
+        cycle_start = cycle * schedule.cycle_length
+        values = [T.T_n.vector().get_local()]
+        for t_previous, t in zip(grid[:-1], grid[1:]):
+            dt.value.assign(t - t_previous)
+            T.update(cycle_start + t)
+            values.append(T.T.vector().get_local())
+        cycles.append(np.array(values))
+
+        change = np.linalg.norm(values[-1] - values[0]) / np.linalg.norm(values[-1])
+        print("Temperature of cycle {}: periodicity error {:.1e}".format(cycle, change))
+        if change < periodic_tolerance:
+            break
+    return grid, np.array(cycles)
+
+
+class TemperatureFromLibrary(F.Temperature):
+    """Temperature interpolated from stored cycles
+
+    Attributes:
+        filename (str): the stored fields (.npz)
+        schedule (CycleSchedule): the cycle schedule
+        library_key (str): the key of the stored fields
+        t_data (numpy.ndarray): the times within a cycle (s)
+        cycles (numpy.ndarray): the nodal values of T for each stored cycle
+    """
+
+    def __init__(self, filename, schedule) -> None:
+        """Inits TemperatureFromLibrary
+
+        Args:
+            filename (str): the stored fields (.npz)
+            schedule (CycleSchedule): the cycle schedule
+        """
+        super().__init__()
+        self.filename = filename
+        self.schedule = schedule
+        self.library_key = os.path.splitext(os.path.basename(filename))[0]
+        with np.load(filename) as data:
+            self.t_data = data["t"]
+            self.cycles = data["T"]
+
+    def create_functions(self, mesh):
+        V = f.FunctionSpace(mesh.mesh, "CG", 1)
+        self.T = f.Function(V, name="T")
+        self.T_n = f.Function(V, name="T_n")
+        self.T.vector().set_local(self.values(0))
+        self.T.vector().apply("insert")
+        self.T_n.assign(self.T)
+
+    def values(self, t):
+        """Nodal values of T at time t
+
+        Args:
+            t (float): the time (s)
+
+        Returns:
+            numpy.ndarray: the values (K)
+        """
+        cycle = self.schedule.cycle(t)
+        t_cycle = t - cycle * self.schedule.cycle_length
+        values = self.cycles[min(cycle, len(self.cycles) - 1)]
+        i = np.searchsorted(self.t_data, t_cycle, side="right") - 1
+        i = min(max(i, 0), self.t_data.size - 2)
+        weight = (t_cycle - self.t_data[i]) / (self.t_data[i + 1] - self.t_data[i])
+        return (1 - weight) * values[i] + weight * values[i + 1]
+
+    def update(self, t):
+        self.T_n.assign(self.T)
+        self.T.vector().set_local(self.values(t))
+        self.T.vector().apply("insert")
+
+    def is_steady_state(self):
+        return False
+
+
+def use_temperature_library(model, schedule, folder=None):
+    """Replaces the heat transfer problem of a set up cycling model by the
+    stored temperature, solving and storing it first if needed
+
+    Args:
+        model (FESTIM.Simulation): the set up cycling model, not
+            initialised
+        schedule (CycleSchedule): the cycle schedule
+        folder (str, optional): the store folder. Defaults to store_folder.
+
+    Returns:
+        bool: True if the temperature was read from the store, else False
+    """
+    if folder is None:
+        folder = store_folder
+    filename = os.path.join(folder, library_key(model, schedule) + ".npz")
+    found = os.path.exists(filename)
+    if not found:
+        t, cycles = solve_cycles(model, schedule)
+        os.makedirs(folder, exist_ok=True)
+        # written under a temporary name so that concurrent runs only see
+        # complete files
+        tmp_filename = "{}.{}.npz".format(filename[: -len(".npz")], os.getpid())
+        np.savez(tmp_filename, t=t, T=cycles)
+        os.replace(tmp_filename, filename)
+    else:
+        print("Temperature read from {}".format(filename))
+    model.T = TemperatureFromLibrary(filename, schedule)
+    return found
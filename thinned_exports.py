@@ -0,0 +1,149 @@
+"""XDMF exports written only at selected times of a cycling run.
+
+ThinnedXDMFExport replaces the every-step F.XDMFExport of the cycling
+scripts. A snapshot is written:
+    - at the end of the selected phases (by default the end of the plateau
+      and the end of the rest), every every_cycles cycles. Without
+      breakpoint clipping (stepsizes_restart=None), the snapshot is written
+      at the first step past the end of the phase.
+    - when the field has changed by more than change_threshold (relative
+      L2 norm) since the last written snapshot, if change_threshold is set
+    - at the final time
+"""
+
+import fenics as f
+import numpy as np
+import FESTIM as F
+
+from cycle_schedule import PHASES
+
+
+class ThinnedXDMFExport(F.XDMFExport):
+    """XDMF export following a cycle-aware export policy
+
+    Attributes:
+        schedule (CycleSchedule): the cycle schedule
+        phases (tuple): names of the phases whose end is exported
+        every_cycles (int): the phase ends are exported every every_cycles
+            cycles (counting from the first one)
+        change_threshold (float): relative change of the field triggering
+            an export. None to disable.
+        tolerance (float): absolute tolerance on the phase boundaries (s)
+        last_written (fenics.Function): copy of the last written field
+        forced (bool): True if the current time has to be exported whatever
+            the change of the field
+        t_previous (float): time of the previous step, None before the
+            first one
+        t_written (float): time of the last written snapshot, None before
+            the first one
+    """
+
+    def __init__(
+        self,
+        field,
+        schedule,
+        phases=None,
+        every_cycles=1,
+        change_threshold=None,
+        **kwargs
+    ) -> None:
+        """Inits ThinnedXDMFExport
+
+        Args:
+            field (str): the exported field ("solute", "1", "retention", "T"...)
+            schedule (CycleSchedule): the cycle schedule
+            phases (tuple, optional): names of the phases whose end is
+                exported. None for ("plateau", "rest"). Defaults to None.
+            every_cycles (int, optional): the phase ends are exported every
+                every_cycles cycles. Defaults to 1.
+            change_threshold (float, optional): relative change of the field
+                since the last written snapshot triggering an export. None
+                to disable. Defaults to None.
+            **kwargs: arguments of F.XDMFExport (filename, checkpoint...)
+        """
+        super().__init__(field, **kwargs)
+        self.schedule = schedule
+        if phases is None:
+            phases = ("plateau", "rest")
+        self.phases = tuple(phases)
+        self.every_cycles = every_cycles
+        self.change_threshold = change_threshold
+        self.tolerance = 1e-9 * schedule.cycle_length
+        self.last_written = None
+        self.forced = False
+        self.t_previous = None
+        self.t_written = None
+
+    def is_on_policy(self, t, final_time):
+        """Checks if t is a time that is always exported: the final time, or
+        the first step at or past the end of a selected phase
+
+        Args:
+            t (float): the current time
+            final_time (float): the final time of the simulation
+
+        Returns:
+            bool: True if t has to be exported, else False
+        """
+        t_previous, self.t_previous = self.t_previous, t
+        if t >= final_time - self.tolerance:
+            return True
+        if t_previous is None:
+            # first step (or first step after a restart)
+            phase_ends = [self.schedule.phase_ending_at(t, self.tolerance)]
+            if phase_ends[0] is None:
+                return False
+        else:
+            # phase boundaries in ]t_previous, t] (t_data[k] ends phase k - 1)
+            t_data = self.schedule.t_data
+            first = np.searchsorted(t_data, t_previous + self.tolerance, "right")
+            last = np.searchsorted(t_data, t + self.tolerance, "right")
+            phase_ends = [divmod(k - 1, 4) for k in range(max(first, 1), last)]
+        return any(
+            PHASES[phase_index] in self.phases and cycle % self.every_cycles == 0
+            for cycle, phase_index in phase_ends
+        )
+
+    def is_export(self, t, final_time, nb_iterations):
+        """Checks if export should be exported. When change_threshold is
+        set, every time step is a candidate and the decision is taken in
+        write, once the field is known.
+
+        Args:
+            t (float): the current time
+            final_time (float): the final time of the simulation
+            nb_iterations (int): the current number of time steps
+
+        Returns:
+            bool: True if export should be exported, else False
+        """
+        self.forced = self.is_on_policy(t, final_time)
+        return self.forced or self.change_threshold is not None
+
+    def relative_change(self):
+        """Relative L2 change of the field since the last written snapshot
+
+        Returns:
+            float: the relative change
+        """
+        if self.last_written is None:
+            return float("inf")
+        dx = f.dx(domain=self.last_written.function_space().mesh())
+        difference = f.assemble((self.function - self.last_written) ** 2 * dx)
+        reference = f.assemble(self.last_written**2 * dx)
+        if reference == 0:
+            return float("inf") if difference > 0 else 0.0
+        return (difference / reference) ** 0.5
+
+    def write(self, t):
+        """Writes to file if the time is forced or the field has changed
+        enough
+
+        Args:
+            t (float): current time
+        """
+        if self.forced or self.relative_change() > self.change_threshold:
+            super().write(t)
+            self.t_written = t
+            if self.change_threshold is not None:
+                self.last_written = self.function.copy(deepcopy=True)